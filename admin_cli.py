@@ -0,0 +1,91 @@
+# Bulk link administration from the command line
+#
+# Examples:
+#   python admin_cli.py deactivate --ip 203.0.113.7 --dry-run
+#   python admin_cli.py delete --codes-file campaign.txt
+#   python admin_cli.py deactivate --created-after 2025-01-01 --created-before 2025-02-01
+#
+# By default the CLI talks to the database directly (same configuration as the
+# app). With --api it calls a running instance's /api/admin/bulk endpoint instead,
+# authenticating with ADMIN_API_KEY.
+import argparse
+import json
+import os
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def build_selector(args):
+    """Turn command-line filters into a bulk selector request body"""
+    body = {}
+    if args.codes or args.codes_file:
+        codes = list(args.codes or [])
+        if args.codes_file:
+            with open(args.codes_file) as f:
+                codes += [line.strip() for line in f if line.strip()]
+        body["short_codes"] = codes
+    if args.ip:
+        body["created_by_ip"] = args.ip
+    if args.created_after:
+        body["created_after"] = args.created_after
+    if args.created_before:
+        body["created_before"] = args.created_before
+    return body
+
+
+def run_local(action, body, dry_run, max_rate):
+    from utils.bulk_admin import parse_selector, run_bulk
+    selector = parse_selector(body)
+    return run_bulk(action, selector, dry_run=dry_run, max_rate=max_rate)
+
+
+def run_remote(api_url, action, body, dry_run, max_rate):
+    import requests
+    payload = dict(body, dry_run=dry_run)
+    if max_rate:
+        payload["max_rate"] = max_rate
+    response = requests.post(
+        f"{api_url.rstrip('/')}/api/admin/bulk/{action}",
+        json=payload,
+        headers={"X-Admin-Key": os.getenv('ADMIN_API_KEY', '')},
+        stream=True,
+        timeout=30
+    )
+    if response.status_code != 200:
+        raise ValueError(f"HTTP {response.status_code}: {response.text}")
+    return (json.loads(line) for line in response.iter_lines() if line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk deactivate or delete short links")
+    parser.add_argument("action", choices=["deactivate", "delete"])
+    parser.add_argument("--ip", help="Links created from this IP address")
+    parser.add_argument("--codes", nargs="+", help="Explicit short codes")
+    parser.add_argument("--codes-file", help="File with one short code per line")
+    parser.add_argument("--created-after", help="ISO-8601 lower bound on creation time (inclusive)")
+    parser.add_argument("--created-before", help="ISO-8601 upper bound on creation time (exclusive)")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the matching links")
+    parser.add_argument("--max-rate", type=float, help="Maximum writes per second")
+    parser.add_argument("--api", help="Base URL of a running instance (default: use the database directly)")
+    args = parser.parse_args(argv)
+
+    body = build_selector(args)
+    try:
+        if args.api:
+            events = run_remote(args.api, args.action, body, args.dry_run, args.max_rate)
+        else:
+            events = run_local(args.action, body, args.dry_run, args.max_rate)
+        for event in events:
+            print(json.dumps(event), flush=True)
+            if event.get("event") == "error":
+                return 1
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,4 @@
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, jsonify, request
 from flask_cors import CORS
 import logging
 import os
@@ -9,16 +9,24 @@ load_dotenv()
 
 # Import route blueprints
 from routes.shorten import shorten_bp
-from routes.redirect import redirect_bp
+from routes.redirect import redirect_bp, record_redirect
+from routes.admin import admin_bp
 
 # Import database configuration
 from config.database import init_db
+from utils.static_pages import static_pages
+from utils.expiry import expiry_sweeper
+from utils.click_spool import click_spool
+from utils.invalidation import invalidation_bus
+from utils.mapping_cache import mapping_cache
+from utils.logging_setup import configure_logging
+from utils.fast_path import install_fast_path
+from utils.traffic_capture import traffic_capture, install_traffic_capture
+from utils.admission import admission_controller
+from utils.tracing import tracer
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging: JSON records written by a background thread, success paths sampled
+configure_logging()
 
 def create_app():
     """Create and configure Flask application"""
@@ -38,13 +46,34 @@ def create_app():
     # Register blueprints
     app.register_blueprint(shorten_bp)  # Luis's shortening endpoints
     app.register_blueprint(redirect_bp)  # Eli's redirect endpoints
+    app.register_blueprint(admin_bp)  # Admin / operations endpoints
+    
+    # Trace requests through the model and Firestore layers (sampled; see utils/tracing.py)
+    tracer.init_app(app)
+    
+    # Shed low-priority requests first when latency shows the instance is overloaded
+    admission_controller.init_app(app)
+    
+    # Render static pages once into precompressed buffers
+    static_pages.init_app(app)
+    
+    # Evict cached lookups when any instance changes a mapping
+    invalidation_bus.subscribe(mapping_cache.invalidate)
+    invalidation_bus.start()
+    
+    # Delete expired links in the background
+    if os.getenv('EXPIRY_SWEEPER_ENABLED', 'true').lower() == 'true':
+        expiry_sweeper.start(interval=int(os.getenv('EXPIRY_SWEEP_INTERVAL_SECONDS', '60')))
+    
+    # Replay spooled clicks to the database in batches (no-op without CLICK_SPOOL_DIR)
+    click_spool.start(interval=float(os.getenv('CLICK_SPOOL_REPLAY_SECONDS', '1')))
     
     # Main route for simple frontend
     @app.route('/')
     def index():
         """Serve the main page"""
         try:
-            return render_template('index.html')
+            return static_pages.response('index.html')
         except Exception as e:
             logging.error(f"Error serving index page: {e}")
             return jsonify({"error": "Failed to load page"}), 500
@@ -56,7 +85,7 @@ def create_app():
         if request.path.startswith('/api/'):
             return jsonify({"error": "API endpoint not found"}), 404
         try:
-            return render_template('404.html'), 404
+            return static_pages.response('404.html', 404)
         except:
             return jsonify({"error": "Page not found"}), 404
     
@@ -71,6 +100,14 @@ def create_app():
         """Handle 400 errors"""
         return jsonify({"error": "Bad request"}), 400
     
+    # Answer cached redirects in WSGI, before Flask routing (installed last so every route is known)
+    if os.getenv('FAST_PATH_ENABLED', 'false').lower() == 'true':
+        install_fast_path(app, record_redirect)
+    
+    # Record anonymized redirect/shorten traffic for replay_traffic.py (outermost, so fast path hits count)
+    if traffic_capture.enabled:
+        install_traffic_capture(app)
+    
     return app
 
 # Create the Flask application
@@ -81,8 +118,8 @@ if __name__ == '__main__':
     port = int(os.getenv('PORT', 8080))
     debug = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
     
-    logging.info(f"Starting URL Shortener service on port {port}")
-    logging.info(f"Debug mode: {debug}")
+    logging.info("Starting URL Shortener service on port %s", port)
+    logging.info("Debug mode: %s", debug)
     
     app.run(
         debug=debug,
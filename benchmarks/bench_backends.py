@@ -0,0 +1,92 @@
+"""
+Compare storage backends on behaviour and speed
+For every backend registered in tests/backend_harness.py this runs the functional
+contract (tests/test_backend_contract.py) and times the URLMapping operations on
+the request path, then prints one table so behaviour drift and performance
+regressions show up side by side. Set FIRESTORE_EMULATOR_HOST to include the
+Firestore emulator.
+
+Usage: python benchmarks/bench_backends.py [operations per backend]
+"""
+import io
+import logging
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+logging.disable(logging.CRITICAL)
+
+from models.url_mapping import URLMapping
+from tests import test_backend_contract
+from tests.backend_harness import available_backends, use_backend
+
+
+def run_contract(name):
+    """Run the contract against one backend; returns (passed, total, failed test names)"""
+    test_class = getattr(test_backend_contract, 'TestContract_' + name.replace('-', '_'))
+    suite = unittest.defaultTestLoader.loadTestsFromTestCase(test_class)
+    result = unittest.TextTestRunner(stream=io.StringIO(), verbosity=0).run(suite)
+    failed = [test.id().rsplit('.', 1)[-1] for test, _ in result.failures + result.errors]
+    return result.testsRun - len(failed), result.testsRun, failed
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def time_operation(func, args_list):
+    """Per-call latencies in microseconds plus throughput in operations per second"""
+    samples = []
+    start = time.perf_counter()
+    for args in args_list:
+        began = time.perf_counter()
+        func(*args)
+        samples.append((time.perf_counter() - began) * 1e6)
+    elapsed = time.perf_counter() - start
+    return percentile(samples, 0.5), percentile(samples, 0.99), len(args_list) / elapsed
+
+
+def run_benchmark(name, count):
+    """Time the request-path operations against one backend"""
+    codes = [f"bench{i}" for i in range(count)]
+    results = {}
+    with use_backend(name):
+        results["create"] = time_operation(
+            URLMapping.create_mapping, [(f"https://example.com/{code}", code) for code in codes])
+        # Uncached backend read, as on a cold cache
+        results["fetch"] = time_operation(URLMapping._fetch_mapping, [(code,) for code in codes])
+        results["click"] = time_operation(URLMapping.increment_clicks, [(code,) for code in codes])
+        results["stats"] = time_operation(URLMapping.get_url_stats, [(code,) for code in codes])
+        results["stats x20"] = time_operation(
+            URLMapping._fetch_stats_many, [(codes[i:i + 20],) for i in range(0, count, 20)])
+    return results
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    operations = ["create", "fetch", "click", "stats", "stats x20"]
+
+    header = f"{'backend':<24} {'contract':>9}  " + "  ".join(f"{op + ' p50/p99 us':>22}" for op in operations)
+    print(f"{count} operations per backend")
+    print(header)
+    print("-" * len(header))
+    failures = {}
+    for name in available_backends():
+        passed, total, failed = run_contract(name)
+        if failed:
+            failures[name] = failed
+        timings = run_benchmark(name, count)
+        cells = "  ".join(f"{timings[op][0]:>8.1f}/{timings[op][1]:>7.1f} {timings[op][2] / 1000:>4.0f}k" for op in operations)
+        print(f"{name:<24} {passed:>4}/{total:<4}  {cells}")
+
+    print("\ncells: p50/p99 latency in microseconds, then thousand operations per second")
+    for name, failed in failures.items():
+        print(f"{name}: contract failures: {', '.join(failed)}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
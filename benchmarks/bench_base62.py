@@ -0,0 +1,88 @@
+"""
+Benchmark Base62 encoding and decoding
+Compares the original one-at-a-time implementation (string prepending and
+str.index) with the table-driven scalar codec and the batch encode_many /
+decode_many functions (pure Python and, when installed, NumPy).
+
+Usage: python benchmarks/bench_base62.py [count]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.url_encoder import URLEncoder, np
+
+CHARS = URLEncoder.BASE62_CHARS
+
+
+def legacy_encode(number):
+    """Encoder as it was before the lookup tables"""
+    if number == 0:
+        return CHARS[0]
+    result = ""
+    while number > 0:
+        result = CHARS[number % 62] + result
+        number //= 62
+    return result
+
+
+def legacy_decode(encoded_string):
+    """Decoder as it was before the lookup tables"""
+    result = 0
+    for char in encoded_string:
+        result = result * 62 + CHARS.index(char)
+    return result
+
+
+def timed(func, *args):
+    """Best of three runs, in seconds"""
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    rng = random.Random(62)
+    # Sequential-style IDs up to ~2^40 (7 digits) plus a tail of full 64-bit values
+    numbers = [rng.randrange(2 ** 40) for _ in range(count - count // 10)]
+    numbers += [rng.randrange(2 ** 63) for _ in range(count // 10)]
+
+    cases = [
+        ("encode legacy", lambda: [legacy_encode(n) for n in numbers]),
+        ("encode scalar", lambda: [URLEncoder.encode_base62(n) for n in numbers]),
+        ("encode_many python", lambda: URLEncoder.encode_many(numbers, use_numpy=False)),
+    ]
+    if np is not None:
+        cases.append(("encode_many numpy", lambda: URLEncoder.encode_many(numbers, use_numpy=True)))
+
+    encoded = [legacy_encode(n) for n in numbers]
+    cases += [
+        ("decode legacy", lambda: [legacy_decode(s) for s in encoded]),
+        ("decode scalar", lambda: [URLEncoder.decode_base62(s) for s in encoded]),
+        ("decode_many python", lambda: URLEncoder.decode_many(encoded, use_numpy=False)),
+    ]
+    if np is not None:
+        cases.append(("decode_many numpy", lambda: URLEncoder.decode_many(encoded, use_numpy=True)))
+
+    print(f"{count} values, best of 3{'' if np is not None else ' (NumPy not installed)'}")
+    baselines = {}
+    for name, func in cases:
+        elapsed, result = timed(func)
+        expected = encoded if name.startswith("encode") else numbers
+        assert result == expected, f"{name} returned wrong results"
+        kind = name.split()[0].split("_")[0]
+        baselines.setdefault(kind, elapsed)
+        print(f"  {name:<20} {elapsed:8.3f}s  {count / elapsed / 1e6:6.2f} M/s  "
+              f"{baselines[kind] / elapsed:5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark cached redirects with and without the WSGI fast path
+Drives the WSGI callable directly from one thread (so requests per second is
+requests per core, without server overhead) for a redirect whose mapping is
+already in the per-process cache, first through Flask and then through
+FastRedirectMiddleware. Uses the mock database so clicks cost the same in both.
+
+Usage: python benchmarks/bench_fast_path.py [requests]
+"""
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['USE_MOCK_DATABASE'] = 'true'
+os.environ['EXPIRY_SWEEPER_ENABLED'] = 'false'
+logging.disable(logging.CRITICAL)
+
+from werkzeug.test import EnvironBuilder
+from app import create_app
+from models.url_mapping import URLMapping
+
+SHORT_CODE = 'benchfast'
+
+
+def start_response(status, headers, exc_info=None):
+    pass
+
+
+def requests_per_second(wsgi_app, count):
+    """Time `count` cached redirects; returns (requests per second, status line)"""
+    base = EnvironBuilder(path=f'/{SHORT_CODE}', headers={'User-Agent': 'bench'}).get_environ()
+    statuses = []
+
+    def capture(status, headers, exc_info=None):
+        statuses.append(status)
+
+    body = wsgi_app(dict(base), capture)  # warm the cache
+    b"".join(body)
+    start = time.perf_counter()
+    for _ in range(count):
+        body = wsgi_app(dict(base), start_response)
+        for _ in body:
+            pass
+        if hasattr(body, 'close'):
+            body.close()
+    return count / (time.perf_counter() - start), statuses[0]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    URLMapping.create_mapping('https://example.com/benchmark', SHORT_CODE)
+
+    results = {}
+    for enabled in ('false', 'true'):
+        os.environ['FAST_PATH_ENABLED'] = enabled
+        app = create_app()
+        results[enabled] = requests_per_second(app, count)
+
+    print(f"{count} cached redirects, single thread")
+    print(f"{'path':<12} {'requests/s':>12}  status")
+    for label, key in (('flask', 'false'), ('fast path', 'true')):
+        rate, status = results[key]
+        print(f"{label:<12} {rate:>12,.0f}  {status}")
+    print(f"speedup: {results['true'][0] / results['false'][0]:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark routing rule evaluation against a first-match interpreter
+Builds rule sets of increasing size that mix country, language, device, OS and
+time-window conditions, then times one decision per request for a spread of
+request headers: the compiled decision table from utils/routing.py versus
+walking the stored rules in order until one matches. Both give the same answer;
+the check runs before timing.
+
+Usage: python benchmarks/bench_routing.py [requests]
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.routing import DAYS, DIMENSIONS, _parse_time, compile_rules, evaluate
+
+COUNTRIES = [f"{chr(65 + i // 26)}{chr(65 + i % 26)}" for i in range(200)]
+LANGUAGES = ["en", "de", "fr", "es", "it", "pt", "ja", "zh"]
+AGENTS = [
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148',
+    'Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 Chrome/120.0 Mobile Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 14_0) AppleWebKit/605.1.15 Version/17.0 Safari/605.1.15',
+]
+
+
+def make_rules(count, rng):
+    """`count` rules with one to three random conditions each"""
+    rules = []
+    for index in range(count):
+        rule = {"url": f"https://example.com/{index}"}
+        for dimension in rng.sample(["country", "language", "device", "os", "time"], rng.randint(1, 3)):
+            if dimension == "country":
+                rule["country"] = sorted(rng.sample(COUNTRIES, rng.randint(1, 5)))
+            elif dimension == "language":
+                rule["language"] = [rng.choice(LANGUAGES)]
+            elif dimension == "device":
+                rule["device"] = [rng.choice(["mobile", "tablet", "desktop"])]
+            elif dimension == "os":
+                rule["os"] = [rng.choice(["ios", "android", "windows", "macos"])]
+            else:
+                start = rng.randrange(24)
+                rule["time"] = {"start": f"{start:02d}:00", "end": f"{(start + rng.randint(1, 12)) % 24:02d}:00",
+                                "days": sorted(rng.sample(DAYS, rng.randint(1, 7)), key=DAYS.index)}
+        rules.append(rule)
+    return rules
+
+
+def interpret(rules, get_header, now):
+    """Reference implementation: test each rule's conditions in order"""
+    minute = now.hour * 60 + now.minute
+    for index, rule in enumerate(rules):
+        if not all(DIMENSIONS[dimension](get_header) in rule[dimension]
+                   for dimension in DIMENSIONS if dimension in rule):
+            continue
+        window = rule.get("time")
+        if window:
+            start, end = _parse_time(window["start"]), _parse_time(window["end"])
+            today, yesterday = DAYS[now.weekday()], DAYS[now.weekday() - 1]
+            if start < end:
+                inside = today in window["days"] and start <= minute < end
+            else:
+                inside = (today in window["days"] and minute >= start) or \
+                         (yesterday in window["days"] and minute < end)
+            if not inside:
+                continue
+        return index
+    return None
+
+
+def make_requests(count, rng):
+    """(get_header, now) pairs spread over countries, languages, agents and the week"""
+    requests = []
+    monday = datetime(2024, 1, 1)
+    for _ in range(count):
+        headers = {"X-AppEngine-Country": rng.choice(COUNTRIES), "User-Agent": rng.choice(AGENTS),
+                   "Accept-Language": rng.choice(LANGUAGES) + ";q=0.9"}
+        requests.append((headers.get, monday + timedelta(minutes=rng.randrange(7 * 24 * 60))))
+    return requests
+
+
+def per_call_us(func, rules, requests):
+    start = time.perf_counter()
+    for get_header, now in requests:
+        func(rules, get_header, now)
+    return (time.perf_counter() - start) / len(requests) * 1e6
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rng = random.Random(7)
+    requests = make_requests(count, rng)
+
+    print(f"{count} routing decisions per rule set")
+    print(f"{'rules':>6} {'compile ms':>11} {'table us':>9} {'interpreted us':>15} {'speedup':>8}")
+    for size in (10, 100, 500):
+        rules = make_rules(size, rng)
+        start = time.perf_counter()
+        table = compile_rules(rules)
+        compile_ms = (time.perf_counter() - start) * 1000
+        for get_header, now in requests[:1000]:
+            assert evaluate(table, get_header, now) == interpret(rules, get_header, now)
+
+        compiled = per_call_us(lambda _, get_header, now: evaluate(table, get_header, now), rules, requests)
+        interpreted = per_call_us(interpret, rules, requests)
+        print(f"{size:>6} {compile_ms:>11.2f} {compiled:>9.2f} {interpreted:>15.2f} {interpreted / compiled:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
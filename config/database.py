@@ -1,15 +1,177 @@
 import os
+import bisect
+import hashlib
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from google.cloud import firestore
 from google.cloud.exceptions import GoogleCloudError
+from google.api_core.exceptions import FailedPrecondition
 import logging
+from utils.tracing import instrument_firestore
+from utils.hyperloglog import HyperLogLog
+
+DEFAULT_DATABASE = "(default)"
+
+# Composite indexes every mapping collection needs (list_by_creator, bulk filters by
+# creator). Firestore keys indexes by collection id, so each shard needs its own copy.
+COMPOSITE_INDEXES = [
+    [("created_by_ip", "ASCENDING"), ("created_at", "ASCENDING")],
+    [("created_by_ip", "ASCENDING"), ("created_at", "DESCENDING")]
+]
+
+# Fields written by clicks, visitor sketches and spool replay without bumping "version"
+COUNTER_FIELDS = ("click_count", "variant_clicks", "visitor_hll", "click_spools")
+
+# Fan-out pool for queries that touch every shard
+_scatter_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="shard-scatter")
+
+
+def parse_shards(value):
+    """
+    Parse a shard list such as "url_mappings_0,url_mappings_1,links-eu/url_mappings"
+    Each entry is a collection name, optionally prefixed with a Firestore database id.
+    Returns:
+        list: (database, collection) tuples
+    """
+    shards = []
+    for entry in (value or "").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        database, _, collection = entry.rpartition("/")
+        shards.append((database or DEFAULT_DATABASE, collection))
+    return shards
+
+
+def _merge_moved(current, source, previous):
+    """
+    Fold a source document into its copy in the new shard layout
+    Once the copy exists both documents can take writes: edits (which bump
+    "version") and counter writes (which don't). The higher version's fields win;
+    counters add the source's growth since `previous`, the source as it was last
+    copied. Without a previous copy the counters take the larger side, which
+    never double counts.
+    Args:
+        current: The copy's data
+        source: The source document's data
+        previous: Source data of the last copy made by this move, or None
+    Returns:
+        dict: Data to store in the copy
+    """
+    newer = source if (source.get("version") or 0) > (current.get("version") or 0) else current
+    merged = {key: value for key, value in newer.items() if key not in COUNTER_FIELDS}
+    base = previous or {}
+
+    def grow(mine, theirs, before):
+        mine, theirs = mine or 0, theirs or 0
+        return max(mine, theirs) if previous is None else mine + theirs - (before or 0)
+
+    merged["click_count"] = grow(current.get("click_count"), source.get("click_count"), base.get("click_count"))
+    variants = {}
+    for counts in (current.get("variant_clicks"), source.get("variant_clicks")):
+        variants.update({variant: None for variant in counts or {}})
+    if variants:
+        merged["variant_clicks"] = {
+            variant: grow((current.get("variant_clicks") or {}).get(variant),
+                          (source.get("variant_clicks") or {}).get(variant),
+                          (base.get("variant_clicks") or {}).get(variant))
+            for variant in variants
+        }
+    sketches = [bytes(data["visitor_hll"]) for data in (current, source) if data.get("visitor_hll")]
+    if sketches:
+        # HyperLogLog merges are idempotent, so the union never double counts
+        sketch = HyperLogLog.from_bytes(sketches[0])
+        for other in sketches[1:]:
+            sketch.merge(HyperLogLog.from_bytes(other))
+        merged["visitor_hll"] = sketch.to_bytes()
+    spools = dict(current.get("click_spools") or {})
+    for spool_id, seq in (source.get("click_spools") or {}).items():
+        spools[spool_id] = max(spools.get(spool_id, 0), seq)
+    if spools:
+        merged["click_spools"] = spools
+    return merged
+
+
+def index_definitions(shards):
+    """
+    firestore.indexes.json contents covering every shard collection
+    Args:
+        shards: (database, collection) tuples
+    Returns:
+        dict: database id -> index file contents, one per database a shard lives in
+    """
+    files = {}
+    for database, collection in shards:
+        indexes = files.setdefault(database, {"indexes": [], "fieldOverrides": []})["indexes"]
+        for fields in COMPOSITE_INDEXES:
+            index = {
+                "collectionGroup": collection,
+                "queryScope": "COLLECTION",
+                "fields": [{"fieldPath": field, "order": order} for field, order in fields]
+            }
+            if index not in indexes:
+                indexes.append(index)
+    return files
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping keys to shards
+    Each shard owns `replicas` points on the ring, so adding or removing one shard
+    only moves about 1/N of the keys.
+    """
+    
+    def __init__(self, shards, replicas=64):
+        if not shards:
+            raise ValueError("HashRing needs at least one shard")
+        self.shards = list(shards)
+        points = []
+        for shard in self.shards:
+            for replica in range(replicas):
+                points.append((self._hash(f"{shard[0]}/{shard[1]}#{replica}"), shard))
+        points.sort()
+        self._keys = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+    
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+    
+    def shard_for(self, key):
+        """Shard owning a key"""
+        if len(self.shards) == 1:
+            return self.shards[0]
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._owners[index]
+
 
 class DatabaseConfig:
-    def __init__(self):
+    def __init__(self, shards=None, previous_shards=None, client_factory=None):
+        """
+        Args:
+            shards: (database, collection) tuples; default FIRESTORE_SHARDS, or the
+                    single FIRESTORE_COLLECTION when unset
+            previous_shards: Shard layout being migrated away from (FIRESTORE_PREVIOUS_SHARDS);
+                    reads fall back to it while resharding is in progress
+            client_factory: Callable(project_id, database) -> client, for tests
+        """
         self.project_id = os.getenv('GOOGLE_CLOUD_PROJECT')
         self.collection_name = os.getenv('FIRESTORE_COLLECTION', 'url_mappings')
         self.client = None
+        self.clients = {}
         self.is_initialized = False
         self.use_mock = os.getenv('USE_MOCK_DATABASE', 'false').lower() == 'true'
+        
+        if shards is None:
+            shards = parse_shards(os.getenv('FIRESTORE_SHARDS')) or [(DEFAULT_DATABASE, self.collection_name)]
+        if previous_shards is None:
+            previous_shards = parse_shards(os.getenv('FIRESTORE_PREVIOUS_SHARDS'))
+        self.shards = list(shards)
+        self.previous_shards = list(previous_shards)
+        self.ring = HashRing(self.shards)
+        self.previous_ring = HashRing(self.previous_shards) if self.previous_shards else None
+        self.client_factory = client_factory or self._create_client
     
     def init_db(self):
         """
@@ -23,12 +185,8 @@ class DatabaseConfig:
             return True
             
         try:
-            # Initialize Firestore client
-            if self.project_id:
-                self.client = firestore.Client(project=self.project_id)
-            else:
-                # Use application default credentials
-                self.client = firestore.Client()
+            # Initialize Firestore clients (one per database used by a shard)
+            self.client = self._client_for(self.shards[0][0])
             
             # Test connection
             if self.test_connection():
@@ -48,6 +206,19 @@ class DatabaseConfig:
             print("💡 Tip: Run 'python setup_dev.py' to set up mock development mode")
             return False
     
+    def _create_client(self, project_id, database):
+        """Create a Firestore client (application default credentials without a project)"""
+        kwargs = {"project": project_id} if project_id else {}
+        if database != DEFAULT_DATABASE:
+            kwargs["database"] = database
+        return instrument_firestore(firestore.Client(**kwargs))
+    
+    def _client_for(self, database):
+        client = self.clients.get(database)
+        if client is None:
+            client = self.clients[database] = self.client_factory(self.project_id, database)
+        return client
+    
     def get_client(self):
         """
         Return initialized Firestore client
@@ -61,6 +232,196 @@ class DatabaseConfig:
                 return None
         return self.client
     
+    def _shard_collection(self, shard):
+        return self._client_for(shard[0]).collection(shard[1])
+    
+    def get_shard(self, short_code, new=False):
+        """
+        Locate the shard holding a short code
+        While resharding, a code whose placement changed is looked up in its new
+        shard first and read from its old shard if it hasn't been moved yet.
+        Args:
+            short_code: The short code
+            new: Place a document that is being created (always the current layout)
+        Returns:
+            tuple: (client, collection reference), or (None, None) if unavailable
+        """
+        if self.use_mock or not self.get_client():
+            return None, None
+        
+        shard = self.ring.shard_for(short_code)
+        if self.previous_ring is not None and not new:
+            old_shard = self.previous_ring.shard_for(short_code)
+            if old_shard != shard and not self._shard_collection(shard).document(short_code).get().exists:
+                shard = old_shard
+        return self._client_for(shard[0]), self._shard_collection(shard)
+    
+    def all_collections(self):
+        """
+        Every shard collection, including the old layout while resharding
+        Returns: list of collection references
+        """
+        if self.use_mock or not self.get_client():
+            return []
+        shards = list(dict.fromkeys(self.shards + self.previous_shards))
+        return [self._shard_collection(shard) for shard in shards]
+    
+    def get_documents(self, short_codes, field_paths=None):
+        """
+        Batch-read documents across shards, one get_all per shard in parallel
+        Args:
+            short_codes: Short codes to read
+            field_paths: Optional projection
+        Returns:
+            dict: short_code -> snapshot for the documents that exist
+        """
+        return {doc.id: doc for _, docs in self.get_document_groups(short_codes, field_paths) for doc in docs}
+    
+    def get_document_groups(self, short_codes, field_paths=None):
+        """
+        Like get_documents, grouped by the client that owns each shard (for batched writes)
+        Returns:
+            list: (client, [snapshots of existing documents]) per shard
+        """
+        if self.use_mock or not self.get_client():
+            return []
+        groups = self._get_document_groups(short_codes, self.ring, field_paths)
+        if self.previous_ring is not None:
+            found = {doc.id for _, docs in groups for doc in docs}
+            missing = [code for code in short_codes
+                       if code not in found and self.previous_ring.shard_for(code) != self.ring.shard_for(code)]
+            if missing:
+                groups += self._get_document_groups(missing, self.previous_ring, field_paths)
+        return groups
+    
+    def _get_document_groups(self, short_codes, ring, field_paths):
+        by_shard = {}
+        for code in dict.fromkeys(short_codes):
+            by_shard.setdefault(ring.shard_for(code), []).append(code)
+        
+        def read(shard, codes):
+            collection = self._shard_collection(shard)
+            refs = [collection.document(code) for code in codes]
+            return [doc for doc in self._client_for(shard[0]).get_all(refs, field_paths=field_paths) if doc.exists]
+        
+        # Each task runs in a copy of the caller's context so its RPCs join the caller's trace
+        futures = [(shard, _scatter_pool.submit(copy_context().run, read, shard, codes))
+                   for shard, codes in by_shard.items()]
+        return [(self._client_for(shard[0]), future.result()) for shard, future in futures]
+    
+    def scatter_query(self, build_query, sort_key=None, limit=None, reverse=False):
+        """
+        Run a query against every shard in parallel and merge the results
+        Args:
+            build_query: Callable(collection) -> query; each shard applies its own limit
+            sort_key: Callable(snapshot) -> key; when set, results are merged in order
+            limit: Maximum number of merged results
+            reverse: Merge in descending sort_key order (for descending queries)
+        Returns:
+            list: Document snapshots
+        """
+        futures = [_scatter_pool.submit(copy_context().run, lambda c: list(build_query(c).stream()), collection)
+                   for collection in self.all_collections()]
+        streams = [future.result() for future in futures]
+        if sort_key is not None:
+            merged = heapq.merge(*streams, key=sort_key, reverse=reverse)
+        else:
+            merged = (doc for stream in streams for doc in stream)
+        
+        results = []
+        seen = set()
+        for doc in merged:
+            # A document mid-migration can briefly exist in both layouts
+            if doc.id in seen:
+                continue
+            seen.add(doc.id)
+            results.append(doc)
+            if limit is not None and len(results) >= limit:
+                break
+        return results
+    
+    def iter_documents(self, page_size=500, build_query=None):
+        """
+        Stream mapping documents, shard by shard (exports and bulk selections)
+        Args:
+            page_size: Documents fetched per round trip
+            build_query: Optional callable(collection) -> ordered query; default is
+                         every document in id order
+        Yields: document snapshots, each short code once
+        """
+        build_query = build_query or (lambda collection: collection.order_by("__name__"))
+        seen = set()
+        for collection in self.all_collections():
+            for doc in self._paginate(build_query(collection), page_size):
+                if doc.id not in seen:
+                    seen.add(doc.id)
+                    yield doc
+    
+    @staticmethod
+    def _paginate(query, page_size):
+        """Stream an ordered query one bounded page at a time"""
+        last = None
+        while True:
+            page_query = query.limit(page_size)
+            if last is not None:
+                page_query = page_query.start_after(last)
+            page = list(page_query.stream())
+            yield from page
+            if len(page) < page_size:
+                return
+            last = page[-1]
+    
+    def migrate_shards(self, batch_size=500):
+        """
+        Move documents whose shard changed from the previous layout to the current one
+        Safe to run while serving: each move copies the document (merging it into a
+        copy the new layout already holds), then deletes the source only if it is
+        unchanged since it was read; otherwise the latest source is merged again.
+        Returns:
+            dict: Counts of moved and already-placed documents
+        """
+        counts = {"moved": 0, "kept": 0}
+        if self.previous_ring is None or self.use_mock or not self.get_client():
+            return counts
+        
+        for old_shard in self.previous_shards:
+            for doc in self._paginate(self._shard_collection(old_shard).order_by("__name__"), batch_size):
+                if self.ring.shard_for(doc.id) == old_shard:
+                    counts["kept"] += 1
+                else:
+                    self._move_document(doc, old_shard)
+                    counts["moved"] += 1
+        return counts
+    
+    def _move_document(self, snapshot, old_shard, attempts=5):
+        client = self._client_for(old_shard[0])
+        new_shard = self.ring.shard_for(snapshot.id)
+        target = self._shard_collection(new_shard).document(snapshot.id)
+        previous = None
+        for _ in range(attempts):
+            source = snapshot.to_dict()
+            self._copy_moved(self._client_for(new_shard[0]), target, source, previous)
+            previous = source
+            try:
+                snapshot.reference.delete(option=client.write_option(last_update_time=snapshot.update_time))
+                return
+            except FailedPrecondition:
+                # Written while being copied (an edit, or a click that resolved the old
+                # shard before the copy existed): merge what changed since the copy
+                snapshot = snapshot.reference.get()
+                if not snapshot.exists:
+                    return
+        raise RuntimeError(f"Document {snapshot.id} kept changing during migration")
+    
+    @staticmethod
+    def _copy_moved(client, target, source, previous):
+        @firestore.transactional
+        def copy(transaction):
+            current = target.get(transaction=transaction)
+            transaction.set(target, _merge_moved(current.to_dict(), source, previous) if current.exists else source)
+        
+        copy(client.transaction())
+    
     def test_connection(self):
         """
         Test database connectivity
@@ -74,7 +435,7 @@ class DatabaseConfig:
                 return False
             
             # Try to access the collection (this will create it if it doesn't exist)
-            collection_ref = self.client.collection(self.collection_name)
+            collection_ref = self._shard_collection(self.shards[0])
             
             # Try a simple query to test connectivity
             docs = collection_ref.limit(1).get()
@@ -84,17 +445,23 @@ class DatabaseConfig:
             logging.error(f"Database connection test failed: {e}")
             return False
     
-    def get_collection(self):
+    def get_collection(self, short_code=None, new=False):
         """
         Get the URL mappings collection reference
+        Args:
+            short_code: Route to the shard holding this code (default: the first shard)
+            new: The document is being created, see get_shard
         Returns: Collection reference or None
         """
         if self.use_mock:
             return None  # Mock mode doesn't use collections
-            
+        
+        if short_code is not None:
+            return self.get_shard(short_code, new)[1]
+        
         client = self.get_client()
         if client:
-            return client.collection(self.collection_name)
+            return self._shard_collection(self.shards[0])
         return None
 
 # Global database instance
@@ -114,12 +481,50 @@ def get_db():
     """
     return db_config.get_client()
 
-def get_collection():
+def get_collection(short_code=None, new=False):
     """
     Function to get the URL mappings collection
+    Args:
+        short_code: Route to the shard holding this code
+        new: The document is being created
     Returns: Collection reference or None
     """
-    return db_config.get_collection()
+    return db_config.get_collection(short_code, new)
+
+def get_shard(short_code):
+    """
+    Function to get the client and collection holding a short code
+    Returns: (client, collection reference) or (None, None)
+    """
+    return db_config.get_shard(short_code)
+
+def get_documents(short_codes, field_paths=None):
+    """
+    Function to batch-read mapping documents across shards
+    Returns: dict of short_code -> snapshot for existing documents
+    """
+    return db_config.get_documents(short_codes, field_paths)
+
+def scatter_query(build_query, sort_key=None, limit=None, reverse=False):
+    """
+    Function to run a query on every shard and merge the results
+    Returns: list of document snapshots
+    """
+    return db_config.scatter_query(build_query, sort_key, limit, reverse)
+
+def get_document_groups(short_codes, field_paths=None):
+    """
+    Function to batch-read mapping documents grouped by owning client
+    Returns: list of (client, [snapshots]) per shard
+    """
+    return db_config.get_document_groups(short_codes, field_paths)
+
+def iter_documents(page_size=500, build_query=None):
+    """
+    Function to stream mapping documents across shards
+    Returns: generator of document snapshots
+    """
+    return db_config.iter_documents(page_size, build_query)
 
 def health_check():
     """
@@ -131,7 +536,9 @@ def health_check():
             return {
                 "status": "healthy",
                 "database": "connected",
-                "collection": db_config.collection_name
+                "collection": db_config.collection_name,
+                "shards": len(db_config.shards),
+                "resharding": db_config.previous_ring is not None
             }
         else:
             return {
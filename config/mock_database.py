@@ -1,5 +1,9 @@
 # Mock Database for Development
 # This allows teammates to work without Google Cloud setup
+from datetime import datetime
+from utils.destinations import lookup_fields
+from utils.routing import routing_fields
+from utils.click_spool import prune_markers
 
 class MockURLMapping:
     # In-memory storage for development
@@ -7,16 +11,25 @@ class MockURLMapping:
     _click_counts = {}
     
     @staticmethod
-    def create_mapping(original_url, short_code, client_ip=None):
+    def create_mapping(original_url, short_code, client_ip=None, immutable=False, expires_at=None,
+                       destinations=None, rules=None):
         """Mock create mapping - stores in memory"""
         MockURLMapping._storage[short_code] = {
             "short_code": short_code,
             "original_url": original_url,
             "created_at": "2025-08-06T10:30:00Z",
+            "updated_at": datetime.utcnow().isoformat(),
             "click_count": 0,
             "is_active": True,
-            "created_by_ip": client_ip
+            "immutable": bool(immutable),
+            "created_by_ip": client_ip,
+            "expires_at": expires_at,
+            "version": 1
         }
+        if destinations:
+            MockURLMapping._storage[short_code]["destinations"] = destinations
+        if rules:
+            MockURLMapping._storage[short_code]["rules"] = rules
         return MockURLMapping._storage[short_code]
     
     @staticmethod
@@ -24,19 +37,29 @@ class MockURLMapping:
         """Mock get mapping"""
         if short_code in MockURLMapping._storage:
             data = MockURLMapping._storage[short_code]
-            return {
+            if not data["is_active"]:
+                return {"original_url": None, "exists": False, "error": "URL deactivated",
+                        "version": data["version"]}
+            return dict({
                 "original_url": data["original_url"],
                 "exists": True,
                 "click_count": data["click_count"],
-                "created_at": data["created_at"]
-            }
-        return {"original_url": None, "exists": False, "error": "Short code not found"}
+                "created_at": data["created_at"],
+                "immutable": data["immutable"],
+                "expires_at": data["expires_at"],
+                "version": data["version"]
+            }, **lookup_fields(data.get("destinations")), **routing_fields(data.get("rules")))
+        return {"original_url": None, "exists": False, "error": "Short code not found", "version": 0}
     
     @staticmethod
-    def increment_clicks(short_code):
+    def increment_clicks(short_code, variant=None):
         """Mock increment clicks"""
         if short_code in MockURLMapping._storage:
             MockURLMapping._storage[short_code]["click_count"] += 1
+            if variant is not None:
+                variant_clicks = MockURLMapping._storage[short_code].setdefault("variant_clicks", {})
+                variant_clicks[str(variant)] = variant_clicks.get(str(variant), 0) + 1
+            MockURLMapping._storage[short_code]["updated_at"] = datetime.utcnow().isoformat()
             return True
         return False
     
@@ -45,6 +68,67 @@ class MockURLMapping:
         """Mock validation"""
         return short_code in MockURLMapping._storage
     
+    @staticmethod
+    def merge_visitor_sketch(short_code, sketch_bytes):
+        """Mock merge of a visitor HyperLogLog into the stored sketch"""
+        from utils.hyperloglog import HyperLogLog
+        if short_code not in MockURLMapping._storage:
+            return None
+        sketch = HyperLogLog.from_bytes(sketch_bytes)
+        stored = MockURLMapping._storage[short_code].get("visitor_hll")
+        if stored:
+            sketch.merge(HyperLogLog.from_bytes(stored))
+        MockURLMapping._storage[short_code]["visitor_hll"] = sketch.to_bytes()
+        return True
+    
+    @staticmethod
+    def apply_clicks(spool_id, clicks):
+        """Mock idempotent apply of replayed clicks"""
+        for short_code, (count, seq, variants) in clicks.items():
+            data = MockURLMapping._storage.get(short_code)
+            if data is None:
+                continue
+            applied = data.setdefault("click_spools", {})
+            if applied.get(spool_id, 0) >= seq:
+                continue
+            applied[spool_id] = seq
+            prune_markers(applied, spool_id)
+            data["click_count"] += count
+            variant_clicks = data.setdefault("variant_clicks", {})
+            for variant, variant_count in variants.items():
+                variant_clicks[variant] = variant_clicks.get(variant, 0) + variant_count
+            data["updated_at"] = datetime.utcnow().isoformat()
+        return True
+    
+    @staticmethod
+    def find_expiring(before, limit=500):
+        """Mock range query on expires_at (scans, the mock has no index)"""
+        expiring = sorted(
+            (data["expires_at"], code) for code, data in MockURLMapping._storage.items()
+            if data.get("expires_at") and data["expires_at"] <= before
+        )
+        return [(code, expires_at) for expires_at, code in expiring[:limit]]
+    
+    @staticmethod
+    def delete_if_expired(short_code, now):
+        """Mock delete of an expired mapping, returns the deleted version or None"""
+        data = MockURLMapping._storage.get(short_code)
+        if data and data.get("expires_at") and data["expires_at"] <= now:
+            del MockURLMapping._storage[short_code]
+            return data["version"]
+        return None
+    
+    @staticmethod
+    def update_mapping(short_code, updates):
+        """Mock update, returns the new version or None"""
+        data = MockURLMapping._storage.get(short_code)
+        if data is None:
+            return None
+        data.update(updates)
+        data["version"] += 1
+        data["updated_at"] = datetime.utcnow().isoformat()
+        return data["version"]
+    
     @staticmethod
     def get_url_stats(short_code):
         """Mock get stats"""
@@ -2,8 +2,49 @@ import os
 from google.cloud import firestore
 from datetime import datetime
 import logging
-from config.database import get_collection
+from config.database import get_collection, get_shard, get_documents, get_document_groups, scatter_query, iter_documents
 from config.mock_database import MockURLMapping
+from utils.hyperloglog import HyperLogLog
+from utils.unique_visitors import visitor_tracker
+from utils.expiry import expiry_sweeper, is_expired, seconds_until, format_timestamp
+from utils.mapping_cache import mapping_cache
+from utils.invalidation import invalidation_bus
+from utils.shared_cache import get_shared_cache, encode_value, decode_value
+from utils.single_flight import lookup_flight
+from utils.circuit_breaker import backend_breaker, CircuitOpenError
+from utils.tracing import traced
+from utils.segment_store import segment_store
+from utils.destinations import lookup_fields
+from utils.routing import routing_fields
+from utils.click_spool import prune_markers
+from concurrent.futures import ThreadPoolExecutor
+from google.api_core.exceptions import FailedPrecondition, AlreadyExists
+import threading
+
+# Shared cache layout: positional fields keep each cached lookup to a few dozen bytes
+MAPPING_KEY_PREFIX = "m:"
+STATS_KEY_PREFIX = "s:"
+MAPPING_FIELDS = ("exists", "original_url", "error", "click_count", "created_at",
+                  "immutable", "expires_at", "version", "destinations", "alias_table", "routing")
+SHARED_CACHE_TTL = int(os.getenv('SHARED_CACHE_TTL_SECONDS', '300'))
+SHARED_CACHE_NEGATIVE_TTL = int(os.getenv('SHARED_CACHE_NEGATIVE_TTL_SECONDS', '10'))
+STATS_CACHE_TTL = int(os.getenv('STATS_CACHE_TTL_SECONDS', '10'))
+# Changed mappings refuse shared-cache writes of older versions this long (outlives in-flight reads)
+SHARED_INVALIDATION_TTL = 60
+
+# Firestore allows at most 500 writes per batch
+BULK_BATCH_SIZE = 500
+
+# Columns returned by link listings; reads are projected to these fields
+LISTING_FIELDS = ("original_url", "created_at", "click_count", "is_active", "expires_at")
+
+# Deadline for a single Firestore read on the lookup path
+BACKEND_TIMEOUT = float(os.getenv('BACKEND_TIMEOUT_SECONDS', '2'))
+
+# Background revalidation of stale cache entries (stale-while-revalidate)
+_refresh_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="mapping-refresh")
+_refreshing = set()
+_refresh_lock = threading.Lock()
 
 class URLMapping:
     def __init__(self):
@@ -14,13 +55,19 @@ class URLMapping:
             self.mock_db = MockURLMapping()
     
     @staticmethod
-    def create_mapping(original_url, short_code, client_ip=None):
+    @traced("URLMapping.create_mapping")
+    def create_mapping(original_url, short_code, client_ip=None, immutable=False, expires_at=None,
+                       destinations=None, rules=None):
         """
         Create new URL mapping in Firestore
         Args:
             original_url: The original long URL
             short_code: The generated short code
             client_ip: Optional client IP for analytics
+            immutable: Whether redirects may be cached long-term (301/308)
+            expires_at: Optional expiry timestamp (see utils.expiry.format_timestamp)
+            destinations: Optional weighted [{"url", "weight"}] list for split links
+            rules: Optional routing rules (see utils.routing.parse_rules)
         Returns:
             dict: Created mapping data or None if failed
         """
@@ -28,30 +75,43 @@ class URLMapping:
         use_mock = os.getenv('USE_MOCK_DATABASE', 'false').lower() == 'true'
         if use_mock:
             mock_db = MockURLMapping()
-            return mock_db.create_mapping(original_url, short_code, client_ip)
+            mapping_data = mock_db.create_mapping(original_url, short_code, client_ip, immutable, expires_at,
+                                                  destinations, rules)
+            URLMapping._after_create(short_code, mapping_data)
+            return mapping_data
             
         try:
-            collection = get_collection()
+            collection = get_collection(short_code, new=True)
             if not collection:
                 logging.error("Database collection not available")
                 return None
             
             # Create mapping document
+            now = datetime.utcnow().isoformat()
             mapping_data = {
                 "short_code": short_code,
                 "original_url": original_url,
-                "created_at": datetime.utcnow().isoformat(),
+                "created_at": now,
+                "updated_at": now,
                 "click_count": 0,
                 "is_active": True,
+                "immutable": bool(immutable),
                 "created_by_ip": client_ip,
-                "expires_at": None  # Can be set for expiring URLs
+                "expires_at": expires_at,  # None for links that never expire
+                "version": 1  # Bumped on every change, orders cache invalidations
             }
+            if destinations:
+                mapping_data["destinations"] = destinations
+            if rules:
+                mapping_data["rules"] = rules
             
             # Use short_code as document ID for fast lookups
             doc_ref = collection.document(short_code)
             doc_ref.set(mapping_data)
+            URLMapping._after_create(short_code, mapping_data)
             
-            logging.info(f"Created URL mapping: {short_code} -> {original_url}")
+            logging.info("Created URL mapping: %s -> %s", short_code, original_url,
+                         extra={"route": "shorten", "short_code": short_code})
             return mapping_data
             
         except Exception as e:
@@ -59,54 +119,199 @@ class URLMapping:
             return None
     
     @staticmethod
+    @traced("URLMapping.get_mapping")
     def get_mapping(short_code):
         """
         Retrieve URL mapping by short code
+        Lookups go through the per-process cache, then the shared cache tier,
+        then the database. A stale cached entry is returned immediately while a
+        background refresh runs.
         Args:
             short_code: The short code to look up
         Returns:
             dict: Mapping data with original_url and exists status
+                  ("unavailable": True when the backend is down and nothing is known)
+        """
+        result, fresh = mapping_cache.lookup(short_code)
+        if result is None:
+            # Concurrent misses for one code share a single backend read
+            result = lookup_flight.do(short_code, URLMapping._load_mapping, short_code)
+        elif not fresh:
+            URLMapping._refresh_in_background(short_code)
+        
+        # Expired links stay unreachable until the sweeper deletes them
+        if result["exists"] and is_expired(result.get("expires_at")):
+            return {"original_url": None, "exists": False, "error": "URL expired"}
+        return result
+    
+    @staticmethod
+    def _refresh_in_background(short_code):
+        """Revalidate a stale cache entry without blocking the caller"""
+        with _refresh_lock:
+            if short_code in _refreshing:
+                return
+            _refreshing.add(short_code)
+        
+        def refresh():
+            try:
+                lookup_flight.do(short_code, URLMapping._load_mapping, short_code)
+            finally:
+                with _refresh_lock:
+                    _refreshing.discard(short_code)
+        
+        _refresh_pool.submit(refresh)
+    
+    @staticmethod
+    @traced("URLMapping._load_mapping")
+    def _load_mapping(short_code):
+        """Read-through on a local cache miss: shared cache first, then the backend"""
+        shared = get_shared_cache()
+        if shared:
+            try:
+                cached = shared.get(MAPPING_KEY_PREFIX + short_code)
+            except Exception as e:
+                logging.error(f"Shared cache read failed: {e}")
+                cached = None
+            result = decode_value(cached, MAPPING_FIELDS) if cached else None
+            # A refused put means an invalidation already superseded this version
+            if result is not None and URLMapping._cache_locally(short_code, result):
+                return result
+        
+        try:
+            result = backend_breaker.call(URLMapping._fetch_mapping, short_code)
+        except Exception as e:
+            if not isinstance(e, CircuitOpenError):
+                logging.error(f"Failed to get URL mapping: {e}")
+            # Serve the last known answer rather than failing a valid link
+            stale = mapping_cache.get_stale(short_code)
+            if stale is not None:
+                return stale
+            return {"original_url": None, "exists": False, "error": "Backend unavailable", "unavailable": True}
+        
+        # Write through only if no invalidation superseded the read; a refused local put
+        # means this result is already stale and must not reach other instances
+        if URLMapping._cache_locally(short_code, result):
+            URLMapping._cache_shared(short_code, result)
+        return result
+    
+    @staticmethod
+    def _cache_locally(short_code, result):
+        remaining = seconds_until(result.get("expires_at"))
+        ttl = None if remaining is None else min(remaining, mapping_cache.ttl_seconds)
+        return mapping_cache.put(short_code, result, result["version"], ttl=ttl)
+    
+    @staticmethod
+    def _cache_shared(short_code, result):
+        shared = get_shared_cache()
+        if not shared:
+            return
+        ttl = SHARED_CACHE_TTL if result["exists"] else SHARED_CACHE_NEGATIVE_TTL
+        remaining = seconds_until(result.get("expires_at"))
+        if remaining is not None:
+            ttl = min(ttl, remaining)
+        if ttl < 1:
+            return
+        try:
+            # Refused when another instance invalidated a newer version meanwhile
+            shared.set_if_current(MAPPING_KEY_PREFIX + short_code, encode_value(result, MAPPING_FIELDS),
+                                  result["version"], ttl)
+        except Exception as e:
+            logging.error(f"Shared cache write failed: {e}")
+    
+    @staticmethod
+    def _lookup_result(data):
+        """Shape a stored mapping document into a get_mapping result"""
+        # Check if URL is active
+        if data.get("is_active", True):
+            # Weighted links carry their alias table and rule links their compiled
+            # decision table, so neither is rebuilt per redirect
+            return dict({
+                "original_url": data.get("original_url"),
+                "exists": True,
+                "click_count": data.get("click_count", 0),
+                "created_at": data.get("created_at"),
+                "immutable": data.get("immutable", False),
+                "expires_at": data.get("expires_at"),
+                "version": data.get("version", 1)
+            }, **lookup_fields(data.get("destinations")), **routing_fields(data.get("rules")))
+        return {"original_url": None, "exists": False, "error": "URL deactivated",
+                "version": data.get("version", 1)}
+    
+    @staticmethod
+    @traced("URLMapping._fetch_mapping")
+    def _fetch_mapping(short_code):
+        """
+        Read a mapping from the configured backend
+        Raises on backend errors so the circuit breaker can count them.
         """
         # Check if using mock database
         use_mock = os.getenv('USE_MOCK_DATABASE', 'false').lower() == 'true'
         if use_mock:
             mock_db = MockURLMapping()
-            return mock_db.get_mapping(short_code)
-            
-        try:
-            collection = get_collection()
+            result = mock_db.get_mapping(short_code)
+            return result if result["version"] else URLMapping._promote_archived(short_code) or result
+        
+        collection = get_collection(short_code)
+        if not collection:
+            raise RuntimeError("Database unavailable")
+        
+        # Get document by short_code, bounded by the per-call deadline
+        doc_ref = collection.document(short_code)
+        doc = doc_ref.get(timeout=BACKEND_TIMEOUT)
+        
+        if doc.exists:
+            return URLMapping._lookup_result(doc.to_dict())
+        # Not in the primary store: the link may have been archived to the cold tier
+        return URLMapping._promote_archived(short_code) or \
+            {"original_url": None, "exists": False, "error": "Short code not found", "version": 0}
+    
+    @staticmethod
+    @traced("URLMapping._promote_archived")
+    def _promote_archived(short_code):
+        """
+        Move an archived mapping back to the primary store when it is accessed
+        Args:
+            short_code: The short code that missed in the primary store
+        Returns:
+            dict: get_mapping result, or None if the code isn't archived either
+        """
+        data = segment_store.get(short_code)
+        if data is None:
+            return None
+        
+        # Archiving announced version + 1; a fresh updated_at keeps it hot for a while
+        data = dict(data, version=data.get("version", 1) + 2, updated_at=datetime.utcnow().isoformat())
+        use_mock = os.getenv('USE_MOCK_DATABASE', 'false').lower() == 'true'
+        if use_mock:
+            data = MockURLMapping._storage.setdefault(short_code, data)
+        else:
+            collection = get_collection(short_code, new=True)
             if not collection:
-                return {"original_url": None, "exists": False, "error": "Database unavailable"}
-            
-            # Get document by short_code
+                raise RuntimeError("Database unavailable")
             doc_ref = collection.document(short_code)
-            doc = doc_ref.get()
-            
-            if doc.exists:
+            try:
+                doc_ref.create(data)
+            except AlreadyExists:
+                # Another instance promoted it first
+                doc = doc_ref.get(timeout=BACKEND_TIMEOUT)
+                if not doc.exists:
+                    return None
                 data = doc.to_dict()
-                # Check if URL is active
-                if data.get("is_active", True):
-                    return {
-                        "original_url": data.get("original_url"),
-                        "exists": True,
-                        "click_count": data.get("click_count", 0),
-                        "created_at": data.get("created_at")
-                    }
-                else:
-                    return {"original_url": None, "exists": False, "error": "URL deactivated"}
-            else:
-                return {"original_url": None, "exists": False, "error": "Short code not found"}
-                
-        except Exception as e:
-            logging.error(f"Failed to get URL mapping: {e}")
-            return {"original_url": None, "exists": False, "error": str(e)}
+        
+        segment_store.discard(short_code)
+        URLMapping._announce_change(short_code, data.get("version", 1))
+        logging.info("Promoted archived mapping: %s", short_code,
+                     extra={"route": "tiering", "short_code": short_code})
+        return URLMapping._lookup_result(data)
     
     @staticmethod
-    def increment_clicks(short_code):
+    @traced("URLMapping.increment_clicks")
+    def increment_clicks(short_code, variant=None):
         """
         Increment click counter for analytics
         Args:
             short_code: The short code to increment
+            variant: Index of the destination chosen for a weighted link, or "r<index>" of a matched rule
         Returns:
             boolean: True if successful, False otherwise
         """
@@ -114,10 +319,10 @@ class URLMapping:
         use_mock = os.getenv('USE_MOCK_DATABASE', 'false').lower() == 'true'
         if use_mock:
             mock_db = MockURLMapping()
-            return mock_db.increment_clicks(short_code)
+            return mock_db.increment_clicks(short_code, variant)
             
         try:
-            collection = get_collection()
+            db, collection = get_shard(short_code)
             if not collection:
                 return False
             
@@ -128,19 +333,26 @@ class URLMapping:
             def update_clicks(transaction):
                 doc = doc_ref.get(transaction=transaction)
                 if doc.exists:
-                    current_count = doc.to_dict().get("click_count", 0)
-                    transaction.update(doc_ref, {"click_count": current_count + 1})
+                    data = doc.to_dict()
+                    update = {
+                        "click_count": data.get("click_count", 0) + 1,
+                        "updated_at": datetime.utcnow().isoformat()
+                    }
+                    if variant is not None:
+                        variant_clicks = dict(data.get("variant_clicks") or {})
+                        variant_clicks[str(variant)] = variant_clicks.get(str(variant), 0) + 1
+                        update["variant_clicks"] = variant_clicks
+                    transaction.update(doc_ref, update)
                     return True
                 return False
             
-            # Execute transaction
-            from config.database import get_db
-            db = get_db()
+            # Execute transaction on the client that owns the shard
             if db:
                 transaction = db.transaction()
                 result = update_clicks(transaction)
                 if result:
-                    logging.info(f"Incremented click count for: {short_code}")
+                    logging.debug("Incremented click count for: %s", short_code,
+                                  extra={"route": "redirect", "short_code": short_code})
                 return result
             
             return False
@@ -150,29 +362,126 @@ class URLMapping:
             return False
     
     @staticmethod
+    @traced("URLMapping.apply_clicks")
+    def apply_clicks(spool_id, clicks):
+        """
+        Apply clicks replayed from a click spool, at most once per spool sequence
+        Each mapping remembers the highest sequence applied from every spool, so a
+        batch that is replayed again after a crash or a failed write is skipped.
+        Args:
+            spool_id: ID of the spool the clicks come from
+            clicks: dict of short_code -> (count, highest spool sequence for the code,
+                    {variant index (str): count} for weighted links)
+        Returns:
+            boolean: True if every click was applied, already applied or dropped
+                     (unknown code), False to retry the batch later
+        """
+        # A link archived after the click was spooled has to come back to count it
+        for short_code in clicks:
+            if segment_store.contains(short_code):
+                URLMapping._promote_archived(short_code)
+        
+        # Check if using mock database
+        use_mock = os.getenv('USE_MOCK_DATABASE', 'false').lower() == 'true'
+        if use_mock:
+            mock_db = MockURLMapping()
+            return mock_db.apply_clicks(spool_id, clicks)
+        
+        try:
+            now = datetime.utcnow().isoformat()
+            groups = get_document_groups(list(clicks), field_paths=["click_count", "click_spools", "variant_clicks"])
+            for db, docs in groups:
+                for start in range(0, len(docs), BULK_BATCH_SIZE):
+                    batch = db.batch()
+                    pending = []
+                    for doc in docs[start:start + BULK_BATCH_SIZE]:
+                        update = URLMapping._click_update(doc.to_dict(), spool_id, *clicks[doc.id], now)
+                        if update:
+                            batch.update(doc.reference, update,
+                                         option=db.write_option(last_update_time=doc.update_time))
+                            pending.append(doc)
+                    if not pending:
+                        continue
+                    try:
+                        batch.commit()
+                    except FailedPrecondition:
+                        # Clicked or edited since the read; redo these one by one in transactions
+                        for doc in pending:
+                            URLMapping._apply_clicks_one(db, doc.reference, spool_id, *clicks[doc.id])
+            return True
+            
+        except Exception as e:
+            logging.error(f"Failed to apply replayed clicks: {e}")
+            return False
+    
+    @staticmethod
+    def _click_update(data, spool_id, count, seq, variants, now):
+        applied = dict(data.get("click_spools") or {})
+        if applied.get(spool_id, 0) >= seq:
+            return None
+        applied[spool_id] = seq
+        prune_markers(applied, spool_id)
+        update = {"click_count": (data.get("click_count") or 0) + count, "click_spools": applied, "updated_at": now}
+        if variants:
+            variant_clicks = dict(data.get("variant_clicks") or {})
+            for variant, variant_count in variants.items():
+                variant_clicks[variant] = variant_clicks.get(variant, 0) + variant_count
+            update["variant_clicks"] = variant_clicks
+        return update
+    
+    @staticmethod
+    def _apply_clicks_one(db, doc_ref, spool_id, count, seq, variants):
+        @firestore.transactional
+        def apply(transaction):
+            doc = doc_ref.get(transaction=transaction)
+            if doc.exists:
+                update = URLMapping._click_update(doc.to_dict(), spool_id, count, seq, variants,
+                                                  datetime.utcnow().isoformat())
+                if update:
+                    transaction.update(doc_ref, update)
+        
+        apply(db.transaction())
+    
+    @staticmethod
+    @traced("URLMapping.validate_short_code_exists")
     def validate_short_code_exists(short_code):
         """
         Check if short code exists in database
+        An expired link the sweeper hasn't reached yet already 404s, so it is
+        deleted here and the code counts as free.
         Args:
             short_code: The short code to check
         Returns:
             boolean: True if exists, False otherwise
         """
+        # Check if using mock database
+        use_mock = os.getenv('USE_MOCK_DATABASE', 'false').lower() == 'true'
+        if use_mock:
+            mock_db = MockURLMapping()
+            if mock_db.validate_short_code_exists(short_code):
+                expires_at = MockURLMapping._storage[short_code].get("expires_at")
+                return not (is_expired(expires_at) and URLMapping.delete_if_expired(short_code))
+            return segment_store.contains(short_code)
+            
         try:
-            collection = get_collection()
+            collection = get_collection(short_code)
             if not collection:
                 return False
             
             doc_ref = collection.document(short_code)
-            doc = doc_ref.get()
+            doc = doc_ref.get(field_paths=["expires_at"])
+            if doc.exists:
+                return not (is_expired(doc.to_dict().get("expires_at")) and URLMapping.delete_if_expired(short_code))
             
-            return doc.exists
+            # Archived codes are still taken
+            return segment_store.contains(short_code)
             
         except Exception as e:
             logging.error(f"Failed to validate short code: {e}")
             return False
     
     @staticmethod
+    @traced("URLMapping.get_url_stats")
     def get_url_stats(short_code):
         """
         Get URL statistics
@@ -181,8 +490,15 @@ class URLMapping:
         Returns:
             dict: Statistics data or None if not found
         """
+        # Check if using mock database
+        use_mock = os.getenv('USE_MOCK_DATABASE', 'false').lower() == 'true'
+        if use_mock:
+            mock_db = MockURLMapping()
+            data = mock_db.get_url_stats(short_code) or segment_store.get(short_code)
+            return URLMapping._build_stats(short_code, data) if data else None
+            
         try:
-            collection = get_collection()
+            collection = get_collection(short_code)
             if not collection:
                 return None
             
@@ -190,45 +506,610 @@ class URLMapping:
             doc = doc_ref.get()
             
             if doc.exists:
-                data = doc.to_dict()
-                return {
-                    "short_code": short_code,
-                    "original_url": data.get("original_url"),
-                    "click_count": data.get("click_count", 0),
-                    "created_at": data.get("created_at"),
-                    "is_active": data.get("is_active", True),
-                    "created_by_ip": data.get("created_by_ip")
-                }
-            else:
-                return None
+                return URLMapping._build_stats(short_code, doc.to_dict())
+            archived = segment_store.get(short_code)
+            return URLMapping._build_stats(short_code, archived) if archived else None
                 
         except Exception as e:
             logging.error(f"Failed to get URL stats: {e}")
             return None
     
     @staticmethod
-    def deactivate_mapping(short_code):
+    @traced("URLMapping.get_url_stats_many")
+    def get_url_stats_many(short_codes):
         """
-        Deactivate a URL mapping (soft delete)
+        Get statistics for several short codes at once
+        Cached stats come from one pipelined multi-get on the shared cache; the
+        rest are read from the database in a single batched call.
         Args:
-            short_code: The short code to deactivate
+            short_codes: List of short codes
         Returns:
-            boolean: True if successful, False otherwise
+            dict: short_code -> statistics dict, or None if not found
         """
+        results = {}
+        pending = list(dict.fromkeys(short_codes))
+        shared = get_shared_cache()
+        
+        if shared and pending:
+            try:
+                cached = shared.get_many([STATS_KEY_PREFIX + code for code in pending])
+            except Exception as e:
+                logging.error(f"Shared cache multi-get failed: {e}")
+                cached = {}
+            for key, value in cached.items():
+                stats = decode_value(value)
+                if stats is not None:
+                    results[key[len(STATS_KEY_PREFIX):]] = stats
+            pending = [code for code in pending if code not in results]
+        
+        if pending:
+            fetched = URLMapping._fetch_stats_many(pending)
+            found = {STATS_KEY_PREFIX + code: encode_value(stats) for code, stats in fetched.items() if stats}
+            if shared and found:
+                try:
+                    shared.set_many(found, STATS_CACHE_TTL)
+                except Exception as e:
+                    logging.error(f"Shared cache write failed: {e}")
+            results.update(fetched)
+        
+        return {code: results.get(code) for code in short_codes}
+    
+    @staticmethod
+    def _fetch_stats_many(short_codes):
+        """Read statistics for several short codes from the backend in one batch"""
+        # Check if using mock database
+        use_mock = os.getenv('USE_MOCK_DATABASE', 'false').lower() == 'true'
+        if use_mock:
+            return {code: URLMapping.get_url_stats(code) for code in short_codes}
+            
         try:
-            collection = get_collection()
+            # One get_all per shard, run in parallel
+            results = {code: None for code in short_codes}
+            for code, doc in get_documents(short_codes).items():
+                results[code] = URLMapping._build_stats(code, doc.to_dict())
+            return results
+            
+        except Exception as e:
+            logging.error(f"Failed to get batch URL stats: {e}")
+            return {}
+    
+    @staticmethod
+    def _build_stats(short_code, data):
+        """Shape a stored mapping document into the public statistics dict"""
+        stats = {
+            "short_code": short_code,
+            "original_url": data.get("original_url"),
+            "click_count": data.get("click_count", 0),
+            "unique_visitors": visitor_tracker.estimate(short_code, data.get("visitor_hll")),
+            "created_at": data.get("created_at"),
+            "updated_at": data.get("updated_at", data.get("created_at")),
+            "expires_at": data.get("expires_at"),
+            "is_active": data.get("is_active", True),
+            "created_by_ip": data.get("created_by_ip")
+        }
+        variant_clicks = data.get("variant_clicks") or {}
+        if data.get("destinations"):
+            stats["destinations"] = [dict(destination, click_count=variant_clicks.get(str(i), 0))
+                                     for i, destination in enumerate(data["destinations"])]
+        if data.get("rules"):
+            stats["rules"] = [dict(rule, click_count=variant_clicks.get(f"r{i}", 0))
+                              for i, rule in enumerate(data["rules"])]
+        return stats
+    
+    @staticmethod
+    @traced("URLMapping.merge_visitor_sketch")
+    def merge_visitor_sketch(short_code, sketch_bytes):
+        """
+        Merge a batch of visitors into the HyperLogLog sketch stored with the mapping
+        Args:
+            short_code: The short code the visits belong to
+            sketch_bytes: Serialized HyperLogLog of the new visitors
+        Returns:
+            boolean: True if successful, None if the mapping doesn't exist, False on failure
+        """
+        # Check if using mock database
+        use_mock = os.getenv('USE_MOCK_DATABASE', 'false').lower() == 'true'
+        if use_mock:
+            mock_db = MockURLMapping()
+            return mock_db.merge_visitor_sketch(short_code, sketch_bytes)
+            
+        try:
+            db, collection = get_shard(short_code)
             if not collection:
                 return False
             
             doc_ref = collection.document(short_code)
-            doc_ref.update({"is_active": False})
             
-            logging.info(f"Deactivated URL mapping: {short_code}")
-            return True
+            # Read-merge-write in a transaction so concurrent flushes don't lose registers
+            @firestore.transactional
+            def update_sketch(transaction):
+                doc = doc_ref.get(transaction=transaction)
+                if not doc.exists:
+                    return None
+                sketch = HyperLogLog.from_bytes(sketch_bytes)
+                stored = doc.to_dict().get("visitor_hll")
+                if stored:
+                    sketch.merge(HyperLogLog.from_bytes(bytes(stored)))
+                transaction.update(doc_ref, {"visitor_hll": sketch.to_bytes()})
+                return True
+            
+            if db:
+                return update_sketch(db.transaction())
+            
+            return False
             
         except Exception as e:
-            logging.error(f"Failed to deactivate URL mapping: {e}")
+            logging.error(f"Failed to merge visitor sketch: {e}")
             return False
+    
+    @staticmethod
+    @traced("URLMapping.find_expiring")
+    def find_expiring(before, limit=500):
+        """
+        Find mappings that expire at or before a timestamp (indexed range query)
+        Args:
+            before: Timestamp string in stored format
+            limit: Maximum number of results
+        Returns:
+            list: (short_code, expires_at) tuples ordered by expiry
+        """
+        # Check if using mock database
+        use_mock = os.getenv('USE_MOCK_DATABASE', 'false').lower() == 'true'
+        if use_mock:
+            mock_db = MockURLMapping()
+            return mock_db.find_expiring(before, limit)
+            
+        try:
+            # Documents without expires_at (or with null) are not part of this range;
+            # every shard returns its earliest `limit` and the merge keeps the overall earliest
+            docs = scatter_query(
+                lambda collection: collection.where("expires_at", "<=", before).order_by("expires_at").limit(limit),
+                sort_key=lambda doc: doc.get("expires_at"),
+                limit=limit
+            )
+            return [(doc.id, doc.get("expires_at")) for doc in docs]
+            
+        except Exception as e:
+            logging.error(f"Failed to query expiring mappings: {e}")
+            return []
+    
+    @staticmethod
+    def export_mappings():
+        """
+        Stream every stored mapping (scatter-gather across shards)
+        Yields:
+            dict: Mapping document including its short_code
+        """
+        # Check if using mock database
+        use_mock = os.getenv('USE_MOCK_DATABASE', 'false').lower() == 'true'
+        if use_mock:
+            documents = ((code, dict(data)) for code, data in list(MockURLMapping._storage.items()))
+        else:
+            documents = ((doc.id, doc.to_dict()) for doc in iter_documents())
+        
+        for short_code, data in documents:
+            data.pop("visitor_hll", None)  # binary sketch, not part of exports
+            data.pop("click_spools", None)  # click replay bookkeeping
+            data["short_code"] = short_code
+            yield data
+    
+    @staticmethod
+    def find_codes(created_by_ip=None, created_after=None, created_before=None, page_size=500):
+        """
+        Stream short codes by creator IP and/or creation time (indexed queries, all shards)
+        Args:
+            created_by_ip: Only links created from this IP
+            created_after: Inclusive lower bound on created_at (stored format)
+            created_before: Exclusive upper bound on created_at (stored format)
+            page_size: Documents fetched per round trip
+        Yields:
+            str: Matching short codes in creation order per shard
+        """
+        # Check if using mock database
+        use_mock = os.getenv('USE_MOCK_DATABASE', 'false').lower() == 'true'
+        if use_mock:
+            mappings = sorted(MockURLMapping._storage.items(), key=lambda item: item[1]["created_at"])
+            for code, data in mappings:
+                created_at = data["created_at"]
+                if created_by_ip is not None and data.get("created_by_ip") != created_by_ip:
+                    continue
+                if (created_after and created_at < created_after) or (created_before and created_at >= created_before):
+                    continue
+                yield code
+            return
+        
+        # created_by_ip + created_at is a composite index (firestore.indexes.json)
+        def build_query(collection):
+            query = collection
+            if created_by_ip is not None:
+                query = query.where("created_by_ip", "==", created_by_ip)
+            if created_after:
+                query = query.where("created_at", ">=", created_after)
+            if created_before:
+                query = query.where("created_at", "<", created_before)
+            return query.order_by("created_at").select(["created_at"])
+        
+        for doc in iter_documents(page_size, build_query):
+            yield doc.id
+    
+    @staticmethod
+    @traced("URLMapping.list_by_creator")
+    def list_by_creator(created_by_ip, limit=50, after=None):
+        """
+        List a creator's links, newest first, one page at a time
+        Every page is a bounded, projected range read on the created_by_ip +
+        created_at index, so its cost doesn't grow with the creator's link count.
+        Args:
+            created_by_ip: Creator IP address
+            limit: Maximum number of links in the page
+            after: (created_at, short_code) of the last link on the previous page
+        Returns:
+            tuple: (list of listing dicts, (created_at, short_code) for the next page or None)
+        """
+        # Check if using mock database
+        use_mock = os.getenv('USE_MOCK_DATABASE', 'false').lower() == 'true'
+        if use_mock:
+            rows = [(data["created_at"], code, data) for code, data in list(MockURLMapping._storage.items())
+                    if data.get("created_by_ip") == created_by_ip]
+            rows.sort(key=lambda row: row[:2], reverse=True)
+            if after is not None:
+                rows = [row for row in rows if row[:2] < tuple(after)]
+            page = [(code, data) for _, code, data in rows[:limit + 1]]
+        else:
+            # One extra row per shard tells whether another page follows
+            def build_query(collection):
+                query = collection.where("created_by_ip", "==", created_by_ip) \
+                    .order_by("created_at", direction=firestore.Query.DESCENDING) \
+                    .order_by("__name__", direction=firestore.Query.DESCENDING)
+                if after is not None:
+                    query = query.start_after({"created_at": after[0], "__name__": after[1]})
+                return query.select(list(LISTING_FIELDS)).limit(limit + 1)
+            
+            docs = scatter_query(build_query, sort_key=lambda doc: (doc.get("created_at"), doc.id),
+                                 limit=limit + 1, reverse=True)
+            page = [(doc.id, doc.to_dict()) for doc in docs]
+        
+        links = [dict({field: data.get(field) for field in LISTING_FIELDS}, short_code=code)
+                 for code, data in page[:limit]]
+        for link in links:
+            link["click_count"] = link["click_count"] or 0
+            link["is_active"] = link["is_active"] is not False
+        next_after = (links[-1]["created_at"], links[-1]["short_code"]) if len(page) > limit else None
+        return links, next_after
+    
+    @staticmethod
+    @traced("URLMapping.bulk_deactivate")
+    def bulk_deactivate(short_codes):
+        """
+        Deactivate many mappings with batched writes
+        Args:
+            short_codes: Codes to deactivate (at most a few hundred per call)
+        Returns:
+            dict: Counts of updated, skipped (already inactive) and missing codes
+        """
+        return URLMapping._bulk_write(short_codes, delete=False)
+    
+    @staticmethod
+    @traced("URLMapping.bulk_delete")
+    def bulk_delete(short_codes):
+        """
+        Permanently delete many mappings with batched writes
+        Args:
+            short_codes: Codes to delete (at most a few hundred per call)
+        Returns:
+            dict: Counts of deleted and missing codes
+        """
+        counts = URLMapping._bulk_write(short_codes, delete=True)
+        # Archived copies are deleted with a tombstone
+        archived = sum(1 for code in set(short_codes) if segment_store.discard(code))
+        counts["deleted"] += archived
+        counts["missing"] = max(0, counts["missing"] - archived)
+        return counts
+    
+    @staticmethod
+    def _bulk_write(short_codes, delete):
+        changed_key = "deleted" if delete else "updated"
+        counts = {changed_key: 0, "skipped": 0, "missing": 0}
+        
+        # Check if using mock database
+        use_mock = os.getenv('USE_MOCK_DATABASE', 'false').lower() == 'true'
+        if use_mock:
+            for code in short_codes:
+                data = MockURLMapping._storage.get(code)
+                if data is None:
+                    counts["missing"] += 1
+                elif delete:
+                    del MockURLMapping._storage[code]
+                    URLMapping._announce_change(code, data["version"] + 1)
+                    counts["deleted"] += 1
+                elif not data.get("is_active", True):
+                    counts["skipped"] += 1
+                else:
+                    URLMapping._announce_change(code, MockURLMapping.update_mapping(code, {"is_active": False}))
+                    counts["updated"] += 1
+            return counts
+        
+        groups = get_document_groups(short_codes)
+        counts["missing"] = len(set(short_codes)) - sum(len(docs) for _, docs in groups)
+        now = datetime.utcnow().isoformat()
+        for db, docs in groups:
+            if not delete:
+                counts["skipped"] += sum(1 for doc in docs if not doc.get("is_active"))
+                docs = [doc for doc in docs if doc.get("is_active")]
+            for start in range(0, len(docs), BULK_BATCH_SIZE):
+                chunk = docs[start:start + BULK_BATCH_SIZE]
+                # Each write is conditional on the document being unchanged since it was read,
+                # so the version we announce is the one actually stored
+                batch = db.batch()
+                for doc in chunk:
+                    option = db.write_option(last_update_time=doc.update_time)
+                    if delete:
+                        batch.delete(doc.reference, option=option)
+                    else:
+                        batch.update(doc.reference, {"is_active": False, "updated_at": now,
+                                                     "version": (doc.get("version") or 1) + 1}, option=option)
+                try:
+                    batch.commit()
+                except FailedPrecondition:
+                    # Something changed mid-batch; fall back to per-document transactions
+                    for doc in chunk:
+                        if delete:
+                            changed = URLMapping._delete_mapping(doc.id)
+                        else:
+                            changed = URLMapping.update_mapping(doc.id, {"is_active": False}) is not None
+                        counts[changed_key if changed else "missing"] += 1
+                    continue
+                for doc in chunk:
+                    URLMapping._announce_change(doc.id, (doc.get("version") or 1) + 1)
+                counts[changed_key] += len(chunk)
+        return counts
+    
+    @staticmethod
+    @traced("URLMapping.archive_idle")
+    def archive_idle(idle_before, batch_size=BULK_BATCH_SIZE):
+        """
+        Move mappings not updated (clicked or edited) since a timestamp to the cold tier
+        Each batch is written to a segment first and then deleted from the primary
+        store with conditional deletes, so a link that is clicked while it is being
+        archived stays hot and its archived copy is tombstoned.
+        Args:
+            idle_before: updated_at cutoff (datetime.isoformat() string)
+            batch_size: Mappings per segment
+        Returns:
+            dict: Counts of archived and kept (changed mid-run) mappings
+        Raises:
+            RuntimeError: If the cold tier isn't shared storage every instance can read
+        """
+        # Archived documents are deleted from the database, so a segment only one
+        # instance can see (or that disappears with it) would turn links into 404s
+        if not segment_store.shared:
+            raise RuntimeError("Cold tier storage is not shared: set TIERING_SEGMENT_DIR to gs://bucket/prefix "
+                               "or a mount every instance sees with TIERING_SHARED_STORAGE=true")
+        counts = {"archived": 0, "kept": 0}
+        
+        # Check if using mock database
+        use_mock = os.getenv('USE_MOCK_DATABASE', 'false').lower() == 'true'
+        if use_mock:
+            idle = {code: dict(data) for code, data in list(MockURLMapping._storage.items())
+                    if data.get("updated_at", data["created_at"]) < idle_before}
+            codes = sorted(idle)
+            for start in range(0, len(codes), batch_size):
+                chunk = {code: idle[code] for code in codes[start:start + batch_size]}
+                segment_store.write_segment(chunk)
+                for code, data in chunk.items():
+                    del MockURLMapping._storage[code]
+                    URLMapping._announce_change(code, data["version"] + 1)
+                counts["archived"] += len(chunk)
+            return counts
+        
+        def build_query(collection):
+            return collection.where("updated_at", "<", idle_before).order_by("updated_at").select(["updated_at"])
+        
+        codes = []
+        for doc in iter_documents(batch_size, build_query):
+            codes.append(doc.id)
+            if len(codes) >= batch_size:
+                URLMapping._archive_batch(codes, idle_before, counts)
+                codes = []
+        if codes:
+            URLMapping._archive_batch(codes, idle_before, counts)
+        return counts
+    
+    @staticmethod
+    def _archive_batch(short_codes, idle_before, counts):
+        groups = get_document_groups(short_codes)
+        # Re-check the cutoff on the full documents; the query page may be stale
+        groups = [(db, [doc for doc in docs if (doc.get("updated_at") or doc.get("created_at")) < idle_before])
+                  for db, docs in groups]
+        segment_store.write_segment({doc.id: doc.to_dict() for _, docs in groups for doc in docs})
+        
+        for db, docs in groups:
+            for start in range(0, len(docs), BULK_BATCH_SIZE):
+                chunk = docs[start:start + BULK_BATCH_SIZE]
+                # Delete only if unchanged since the archived copy was read
+                batch = db.batch()
+                for doc in chunk:
+                    batch.delete(doc.reference, option=db.write_option(last_update_time=doc.update_time))
+                try:
+                    batch.commit()
+                    deleted = chunk
+                except FailedPrecondition:
+                    deleted = []
+                    for doc in chunk:
+                        try:
+                            doc.reference.delete(option=db.write_option(last_update_time=doc.update_time))
+                            deleted.append(doc)
+                        except FailedPrecondition:
+                            # Clicked or edited mid-run: it stays hot, hide the stale copy
+                            segment_store.discard(doc.id)
+                            counts["kept"] += 1
+                for doc in deleted:
+                    URLMapping._announce_change(doc.id, (doc.get("version") or 1) + 1)
+                counts["archived"] += len(deleted)
+    
+    @staticmethod
+    def _delete_mapping(short_code):
+        """Delete one mapping in a transaction, announcing the change"""
+        try:
+            db, collection = get_shard(short_code)
+            if not collection:
+                return False
+            
+            doc_ref = collection.document(short_code)
+            
+            @firestore.transactional
+            def delete_doc(transaction):
+                doc = doc_ref.get(transaction=transaction)
+                if not doc.exists:
+                    return None
+                transaction.delete(doc_ref)
+                return doc.to_dict().get("version", 1)
+            
+            version = delete_doc(db.transaction()) if db else None
+            if version is not None:
+                URLMapping._announce_change(short_code, version + 1)
+            return version is not None
+            
+        except Exception as e:
+            logging.error(f"Failed to delete URL mapping: {e}")
+            return False
+    
+    @staticmethod
+    @traced("URLMapping.delete_if_expired")
+    def delete_if_expired(short_code):
+        """
+        Delete a mapping if it has expired
+        The expiry is re-checked inside a transaction so a link whose
+        expiry was extended in the meantime is kept.
+        Args:
+            short_code: The short code to delete
+        Returns:
+            boolean: True if the mapping was deleted
+        """
+        now = format_timestamp(datetime.utcnow())
+        
+        # Check if using mock database
+        use_mock = os.getenv('USE_MOCK_DATABASE', 'false').lower() == 'true'
+        if use_mock:
+            mock_db = MockURLMapping()
+            version = mock_db.delete_if_expired(short_code, now)
+            if version is not None:
+                URLMapping._announce_change(short_code, version + 1)
+            return version is not None
+            
+        try:
+            db, collection = get_shard(short_code)
+            if not collection:
+                return False
+            
+            doc_ref = collection.document(short_code)
+            
+            @firestore.transactional
+            def delete_expired(transaction):
+                doc = doc_ref.get(transaction=transaction)
+                if not doc.exists:
+                    return None
+                data = doc.to_dict()
+                if not data.get("expires_at") or data["expires_at"] > now:
+                    return None
+                transaction.delete(doc_ref)
+                return data.get("version", 1)
+            
+            version = delete_expired(db.transaction()) if db else None
+            if version is not None:
+                URLMapping._announce_change(short_code, version + 1)
+                logging.info(f"Deleted expired URL mapping: {short_code}")
+                return True
+            
+            return False
+            
+        except Exception as e:
+            logging.error(f"Failed to delete expired URL mapping: {e}")
+            return False
+    
+    @staticmethod
+    @traced("URLMapping.update_mapping")
+    def update_mapping(short_code, updates):
+        """
+        Update mapping fields and announce the change to every instance's cache
+        Args:
+            short_code: The short code to update
+            updates: Dict of fields to set
+        Returns:
+            int: The mapping's new version, or None if it doesn't exist or failed
+        """
+        # Check if using mock database
+        use_mock = os.getenv('USE_MOCK_DATABASE', 'false').lower() == 'true'
+        if use_mock:
+            mock_db = MockURLMapping()
+            version = mock_db.update_mapping(short_code, updates)
+            if version is not None:
+                URLMapping._announce_change(short_code, version)
+            return version
+            
+        try:
+            db, collection = get_shard(short_code)
+            if not collection:
+                return None
+            
+            doc_ref = collection.document(short_code)
+            
+            # Bump the version in the same transaction so invalidations are totally ordered
+            @firestore.transactional
+            def apply_update(transaction):
+                doc = doc_ref.get(transaction=transaction)
+                if not doc.exists:
+                    return None
+                version = doc.to_dict().get("version", 1) + 1
+                transaction.update(doc_ref, dict(updates, version=version,
+                                                 updated_at=datetime.utcnow().isoformat()))
+                return version
+            
+            version = apply_update(db.transaction()) if db else None
+            if version is not None:
+                URLMapping._announce_change(short_code, version)
+            return version
+            
+        except Exception as e:
+            logging.error(f"Failed to update URL mapping: {e}")
+            return None
+    
+    @staticmethod
+    def deactivate_mapping(short_code):
+        """
+        Deactivate a URL mapping (soft delete)
+        Args:
+            short_code: The short code to deactivate
+        Returns:
+            boolean: True if successful, False otherwise
+        """
+        if URLMapping.update_mapping(short_code, {"is_active": False}) is None:
+            return False
+        
+        logging.info(f"Deactivated URL mapping: {short_code}")
+        return True
+    
+    @staticmethod
+    def _after_create(short_code, mapping_data):
+        """Write the new mapping through to the shared cache, evict cached misses and schedule expiry"""
+        invalidation_bus.publish(short_code, mapping_data.get("version", 1))
+        URLMapping._cache_shared(short_code, URLMapping._lookup_result(mapping_data))
+        if mapping_data.get("expires_at"):
+            expiry_sweeper.schedule(short_code, mapping_data["expires_at"])
+    
+    @staticmethod
+    def _announce_change(short_code, version):
+        """Evict a changed mapping from the shared cache and every instance's local cache"""
+        shared = get_shared_cache()
+        if shared:
+            try:
+                shared.invalidate(MAPPING_KEY_PREFIX + short_code, version, SHARED_INVALIDATION_TTL)
+                shared.delete(STATS_KEY_PREFIX + short_code)
+            except Exception as e:
+                logging.error(f"Shared cache eviction failed: {e}")
+        # Evict locally first so the writer reads its own change even without a bus subscription
+        mapping_cache.invalidate(short_code, version)
+        invalidation_bus.publish(short_code, version)
 
 # Helper functions for teammates to use
 def get_original_url_for_redirect(short_code):
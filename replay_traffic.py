@@ -0,0 +1,217 @@
+# Replays traffic recorded with TRAFFIC_CAPTURE_DIR (utils/traffic_capture.py)
+# against a local create_app() instance on the mock database, then reports
+# latency percentiles, status counts and backend (database) calls.
+#
+# Examples:
+#   python replay_traffic.py captures/*.tsv.gz                  # original pacing
+#   python replay_traffic.py captures/*.tsv.gz --speed 10       # 10x faster
+#   python replay_traffic.py captures/*.tsv.gz --max-gap 1      # squeeze idle gaps to 1s
+#   python replay_traffic.py captures/*.tsv.gz --speed 0        # as fast as the workers go
+#   FAST_PATH_ENABLED=true python replay_traffic.py captures/*.tsv.gz --backend-latency-ms 5
+#
+# Short codes that redirected during capture are created before the replay, so
+# hits stay hits and 404 probes stay 404s. Latency is measured from each request's
+# scheduled send time: when the app falls behind, the queueing shows up in the
+# percentiles instead of silently slowing the replay down. App settings (caches,
+# fast path, admission control) come from the environment as usual.
+import argparse
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+os.environ['USE_MOCK_DATABASE'] = 'true'
+os.environ['TRAFFIC_CAPTURE_DIR'] = ''  # never capture the replay itself
+os.environ.setdefault('EXPIRY_SWEEPER_ENABLED', 'false')
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from config.mock_database import MockURLMapping
+from utils.mapping_cache import mapping_cache
+from utils.traffic_capture import SHORTEN_PATH, read_capture
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def load_traffic(paths, limit=None):
+    """Merge capture files from any number of instances into one arrival-ordered list"""
+    records = sorted((record for path in paths for record in read_capture(path)), key=lambda record: record[0])
+    return records[:limit] if limit else records
+
+
+def schedule(records, speed=1.0, max_gap=None):
+    """
+    Send offsets (seconds from the start) for captured requests
+    Args:
+        records: read_capture() tuples in arrival order
+        speed: Replay speed multiplier; 0 sends everything immediately
+        max_gap: Optional cap (seconds, before speed-up) on the pause between two requests
+    Returns:
+        list: Offsets, one per record
+    """
+    offsets, offset, previous = [], 0.0, None
+    for ts_ms, *_ in records:
+        if previous is not None and speed:
+            gap = (ts_ms - previous) / 1000.0
+            if max_gap is not None:
+                gap = min(gap, max_gap)
+            offset += gap / speed
+        offsets.append(offset)
+        previous = ts_ms
+    return offsets
+
+
+def seed_mappings(records):
+    """
+    Create a mapping for every code that redirected during capture
+    Returns:
+        int: Mappings created
+    """
+    from models.url_mapping import URLMapping
+    codes = {path[1:] for _, method, path, status, _ in records
+             if method == 'GET' and 300 <= status < 400}
+    for code in codes:
+        URLMapping.create_mapping(f"https://example.com/{code}", code)
+    mapping_cache.clear()
+    return len(codes)
+
+
+def count_backend_calls(latency_ms=0.0):
+    """
+    Count (and optionally slow down) every call into the mock database
+    Args:
+        latency_ms: Delay added to each call, to stand in for a network round trip
+    Returns:
+        Counter: Calls per method, updated as the replay runs
+    """
+    calls = Counter()
+    lock = threading.Lock()
+
+    def counted(name, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with lock:
+                calls[name] += 1
+            if latency_ms:
+                time.sleep(latency_ms / 1000.0)
+            return func(*args, **kwargs)
+        return staticmethod(wrapper)
+
+    for name, attr in list(vars(MockURLMapping).items()):
+        if isinstance(attr, staticmethod):
+            setattr(MockURLMapping, name, counted(name, attr.__func__))
+    return calls
+
+
+def replay(app, records, offsets, workers=16):
+    """
+    Send each captured request at its offset from a pool of client threads
+    Returns:
+        list: (route, status, latency_ms from scheduled time, service_ms) per request
+    """
+    local = threading.local()
+    results = []
+    results_lock = threading.Lock()
+
+    def send(index, scheduled):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        _, method, path, _, _ = records[index]
+        started = time.perf_counter()
+        try:
+            if path == SHORTEN_PATH:
+                response = client.post(path, json={"url": f"https://example.com/replay/{index}"})
+            else:
+                response = client.open(path, method=method)
+            status = response.status_code
+            response.close()
+        except Exception as e:
+            # Reported as status 0 rather than lost with the worker's exception
+            print(f"Request {index} ({method} {path}) failed: {e}", file=sys.stderr)
+            status = 0
+        finished = time.perf_counter()
+        route = "shorten" if path == SHORTEN_PATH else "redirect"
+        with results_lock:
+            results.append((route, status, (finished - scheduled) * 1000, (finished - started) * 1000))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        start = time.perf_counter()
+        for index, offset in enumerate(offsets):
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, index, start + offset)
+    return results
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(p / 100.0 * len(values)) - 1)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay captured traffic against a local instance")
+    parser.add_argument("captures", nargs="+", help="Capture files (traffic-*.tsv.gz)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Speed multiplier, 0 for no pacing")
+    parser.add_argument("--max-gap", type=float, default=None,
+                        help="Compress pauses between requests to at most this many seconds")
+    parser.add_argument("--workers", type=int, default=16, help="Concurrent client threads")
+    parser.add_argument("--limit", type=int, default=None, help="Replay only the first N requests")
+    parser.add_argument("--backend-latency-ms", type=float, default=0.0,
+                        help="Simulated database round trip added to every backend call")
+    args = parser.parse_args(argv)
+
+    records = load_traffic(args.captures, args.limit)
+    if not records:
+        print("No requests in the capture files")
+        return 1
+
+    from app import create_app
+    app = create_app()
+    seeded = seed_mappings(records)
+    calls = count_backend_calls(args.backend_latency_ms)
+    offsets = schedule(records, args.speed, args.max_gap)
+
+    print(f"Replaying {len(records):,} requests ({seeded:,} seeded links) over "
+          f"{offsets[-1]:.1f}s scheduled, {args.workers} workers")
+    started = time.perf_counter()
+    results = replay(app, records, offsets, args.workers)
+    elapsed = time.perf_counter() - started
+
+    print(f"Done in {elapsed:.1f}s ({len(results) / elapsed:,.0f} req/s)\n")
+    print(f"{'latency ms':<10} {'count':>8} " + " ".join(f"{'p' + format(p, 'g'):>8}" for p in PERCENTILES) +
+          f" {'max':>8}   service p99   captured p50/p99")
+    for route in ("redirect", "shorten"):
+        latencies = sorted(result[2] for result in results if result[0] == route)
+        if not latencies:
+            continue
+        service = sorted(result[3] for result in results if result[0] == route)
+        captured = sorted(record[4] / 1000.0 for record in records
+                          if (record[2] == SHORTEN_PATH) == (route == "shorten"))
+        print(f"{route:<10} {len(latencies):>8,} " +
+              " ".join(f"{percentile(latencies, p):>8.2f}" for p in PERCENTILES) +
+              f" {latencies[-1]:>8.2f} {percentile(service, 99):>13.2f} "
+              f"{percentile(captured, 50):>10.2f}/{percentile(captured, 99):.2f}")
+
+    print()
+    for label, statuses in (("status", Counter(result[1] for result in results)),
+                            ("captured", Counter(record[3] for record in records))):
+        print(f"{label + ':':<10}" + ", ".join(f"{status}={count:,}" for status, count in sorted(statuses.items())))
+    print("backend:  " + (", ".join(f"{name}={count:,}" for name, count in calls.most_common()) or "no calls") +
+          f" ({sum(calls.values()) / len(results):.3f} calls per request)")
+    cache = mapping_cache.stats()
+    print(f"cache:    {cache['hits']:,} hits, {cache['misses']:,} misses, {cache['stale_hits']:,} stale hits")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+# Resharding helper: moves mappings from FIRESTORE_PREVIOUS_SHARDS to FIRESTORE_SHARDS
+#
+# 1. Run `python reshard.py --indexes` and deploy the index files it writes
+#    (`firebase deploy --only firestore:indexes`); each shard collection needs
+#    its own composite indexes before it serves list/bulk queries.
+# 2. Deploy with FIRESTORE_SHARDS set to the new layout and FIRESTORE_PREVIOUS_SHARDS
+#    to the old one; instances write to the new layout and dual-read the old one.
+# 3. Run this script (safe while serving, and safe to re-run).
+# 4. Deploy again without FIRESTORE_PREVIOUS_SHARDS.
+import json
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from config.database import db_config, index_definitions, DEFAULT_DATABASE
+
+
+def index_file(database):
+    """Index file name for a Firestore database id"""
+    return "firestore.indexes.json" if database == DEFAULT_DATABASE else f"firestore.{database}.indexes.json"
+
+
+def write_indexes():
+    """Write composite index files for every current and previous shard collection"""
+    for database, definitions in index_definitions(db_config.shards + db_config.previous_shards).items():
+        path = index_file(database)
+        with open(path, "w") as f:
+            json.dump(definitions, f, indent=2)
+            f.write("\n")
+        print(f"✅ Wrote {len(definitions['indexes'])} indexes for database {database} to {path}")
+    return 0
+
+
+def main():
+    if sys.argv[1:2] == ["--indexes"]:
+        return write_indexes()
+    if db_config.previous_ring is None:
+        print("FIRESTORE_PREVIOUS_SHARDS is not set; nothing to migrate")
+        return 1
+    if not db_config.init_db():
+        print("❌ Could not connect to Firestore")
+        return 1
+
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    counts = db_config.migrate_shards(batch_size=batch_size)
+    print(f"✅ Moved {counts['moved']} mappings ({counts['kept']} already in place)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from functools import wraps
+from utils.heavy_hitters import hot_links, SpaceSaving
+from utils.mapping_cache import mapping_cache
+from utils.single_flight import lookup_flight
+from utils.circuit_breaker import backend_breaker
+from utils.logging_setup import logging_setup
+from utils.fast_path import FastRedirectMiddleware
+from utils.admission import admission_controller
+from utils.tracing import tracer
+from utils.segment_store import segment_store
+from utils.click_spool import click_spool
+from utils.traffic_capture import traffic_capture
+from utils.idempotency import idempotency_store
+from models.url_mapping import URLMapping
+from utils.bulk_admin import ACTIONS, DEFAULT_MAX_RATE, parse_selector, run_bulk
+import hmac
+import json
+import logging
+import math
+import os
+
+# Create blueprint for admin / operations endpoints
+admin_bp = Blueprint('admin', __name__)
+
+MAX_TOP_N = 1000
+
+
+def is_admin_request():
+    """
+    Check whether the current request carries admin rights
+    Returns: True with a valid X-Admin-Key, or with no key configured in debug/testing mode
+    """
+    admin_key = os.getenv('ADMIN_API_KEY')
+    if admin_key:
+        provided = request.headers.get('X-Admin-Key', '')
+        return hmac.compare_digest(provided.encode(), admin_key.encode())
+    return current_app.debug or current_app.testing
+
+
+def require_admin(view):
+    """
+    Decorator that protects admin endpoints with the ADMIN_API_KEY secret
+    The key is sent in the X-Admin-Key header. When no key is configured the
+    endpoints are only reachable in debug or testing mode.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if is_admin_request():
+            return view(*args, **kwargs)
+        if os.getenv('ADMIN_API_KEY'):
+            return jsonify({
+                "success": False,
+                "error": "Admin key required"
+            }), 401
+        return jsonify({
+            "success": False,
+            "error": "Admin API is disabled"
+        }), 403
+    return wrapper
+
+
+def _top_response(summary, n, include_sketch):
+    data = {
+        "top": [
+            {"short_code": key, "clicks": round(count, 2), "error": round(error, 2)}
+            for key, count, error in summary.top(n)
+        ],
+        "window_seconds": hot_links.window_seconds * hot_links.num_windows
+    }
+    if include_sketch:
+        data["sketch"] = summary.to_dict()
+    return jsonify({"success": True, "data": data}), 200
+
+
+@admin_bp.route('/api/admin/top', methods=['GET'])
+@require_admin
+def top_links():
+    """
+    Get the hottest short codes on this instance
+    Query params: n (default 10), sketch=true to include the serialized summary
+    Returns: JSON response with the top short codes and their approximate click counts
+    """
+    try:
+        n = min(max(int(request.args.get('n', 10)), 1), MAX_TOP_N)
+        include_sketch = request.args.get('sketch', 'false').lower() == 'true'
+        return _top_response(hot_links.snapshot(), n, include_sketch)
+
+    except ValueError:
+        return jsonify({
+            "success": False,
+            "error": "n must be an integer"
+        }), 400
+    except Exception as e:
+        logging.error(f"Error getting top links: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Internal server error"
+        }), 500
+
+
+@admin_bp.route('/api/admin/top', methods=['POST'])
+@require_admin
+def merge_top_links():
+    """
+    Merge sketches collected from other workers with this instance's sketch
+    Request body: {"sketches": [<sketch from GET ?sketch=true>, ...], "n": 10, "include_local": true}
+    Returns: JSON response with the combined top short codes
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not data or not isinstance(data.get('sketches'), list):
+            return jsonify({
+                "success": False,
+                "error": "sketches list is required"
+            }), 400
+
+        n = min(max(int(data.get('n', 10)), 1), MAX_TOP_N)
+        combined = hot_links.snapshot() if data.get('include_local', True) else SpaceSaving(hot_links.capacity)
+        for sketch in data['sketches']:
+            combined.merge(SpaceSaving.from_dict(sketch))
+
+        return _top_response(combined, n, bool(data.get('include_sketch')))
+
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    except Exception as e:
+        logging.error(f"Error merging top links: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Internal server error"
+        }), 500
+
+
+@admin_bp.route('/api/admin/metrics', methods=['GET'])
+@require_admin
+def metrics():
+    """
+    Get in-process counters for this instance
+    Returns: JSON response with cache, lookup coalescing, circuit breaker, logging, admission, tracing, cold tier, click spool, traffic capture, idempotency and fast path counters
+    """
+    try:
+        data = {
+            "mapping_cache": mapping_cache.stats(),
+            "lookup_coalescing": lookup_flight.stats(),
+            "backend_breaker": backend_breaker.stats(),
+            "logging": logging_setup.stats(),
+            "admission": admission_controller.stats(),
+            "tracing": tracer.stats(),
+            "cold_tier": segment_store.stats(),
+            "click_spool": click_spool.stats(),
+            "traffic_capture": traffic_capture.stats(),
+            "idempotency": idempotency_store.stats()
+        }
+        # The fast path may sit under other middleware (traffic capture wraps it)
+        wsgi_app = current_app.wsgi_app
+        while wsgi_app is not None and not isinstance(wsgi_app, FastRedirectMiddleware):
+            wsgi_app = getattr(wsgi_app, 'wsgi_app', None)
+        if wsgi_app is not None:
+            data["fast_path"] = wsgi_app.stats()
+        return jsonify({
+            "success": True,
+            "data": data
+        }), 200
+
+    except Exception as e:
+        logging.error(f"Error collecting metrics: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Internal server error"
+        }), 500
+
+
+@admin_bp.route('/api/admin/export', methods=['GET'])
+@require_admin
+def export_mappings():
+    """
+    Export every mapping as newline-delimited JSON, streamed across all shards
+    Returns: application/x-ndjson response, one mapping per line
+    """
+    def generate():
+        try:
+            for mapping in URLMapping.export_mappings():
+                yield json.dumps(mapping, default=str) + "\n"
+        except Exception as e:
+            logging.error(f"Error exporting mappings: {e}")
+            yield json.dumps({"error": "Export interrupted"}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@admin_bp.route('/api/admin/bulk/<string:action>', methods=['POST'])
+@require_admin
+def bulk_action(action):
+    """
+    Deactivate or delete many links at once
+    Request body: {"short_codes": [...]} or {"created_by_ip": "...", "created_after": "...",
+                  "created_before": "..."}, plus optional "dry_run" (boolean) and "max_rate" (writes/second)
+    Returns: application/x-ndjson stream of progress events ending with "done" or "error"
+    """
+    if action not in ACTIONS:
+        return jsonify({
+            "success": False,
+            "error": f"Unknown action, expected one of: {', '.join(ACTIONS)}"
+        }), 404
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({
+            "success": False,
+            "error": "JSON body is required"
+        }), 400
+
+    try:
+        selector = parse_selector(data)
+        # Callers may slow a job down but not lift the configured ceiling
+        max_rate = data.get('max_rate', DEFAULT_MAX_RATE)
+        if isinstance(max_rate, bool) or not isinstance(max_rate, (int, float)) \
+                or not math.isfinite(max_rate) or max_rate <= 0:
+            raise ValueError("max_rate must be a positive number")
+        max_rate = min(max_rate, DEFAULT_MAX_RATE)
+        # A string like "false" would be truthy and run the job for real
+        dry_run = data.get('dry_run', False)
+        if not isinstance(dry_run, bool):
+            raise ValueError("dry_run must be true or false")
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+
+    logging.warning(f"Bulk {action} requested by {request.remote_addr} (dry_run={dry_run}): {selector}")
+
+    def generate():
+        for event in run_bulk(action, selector, dry_run=dry_run, max_rate=max_rate):
+            yield json.dumps(event) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
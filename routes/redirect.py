@@ -1,8 +1,19 @@
 # routes/redirect.py
 
-from flask import Blueprint, redirect, render_template, abort, jsonify
+from flask import Blueprint, redirect, abort, jsonify, request
 from routes.shorten import get_original_url_for_redirect, increment_click_count_for_redirect
+from utils.heavy_hitters import hot_links
+from utils.unique_visitors import visitor_tracker
+from utils.click_spool import click_spool
+from utils.rate_limiter import rate_limit
+from utils.http_cache import redirect_cache_policy, conditional_json
+from utils.static_pages import static_pages
+from utils.destinations import pick_destination
 import logging
+import os
+
+# Seconds clients are told to wait when a lookup fails because the backend is down
+UNAVAILABLE_RETRY_AFTER = int(os.getenv('UNAVAILABLE_RETRY_AFTER_SECONDS', '5'))
 
 redirect_bp = Blueprint('redirect', __name__)
 
@@ -13,34 +24,74 @@ def redirect_url(short_code):
         # Validate short code format (basic length check)
         if not short_code or len(short_code) > 20:
             logging.warning(f"Invalid short code format: {short_code}")
-            return render_template('404.html'), 404
+            return static_pages.response('404.html', 404)
 
         # Retrieve URL from database using Luis's function
         result = get_original_url_for_redirect(short_code)
 
         if result['exists'] and result['original_url']:
-            # Increment click count using Luis's function
-            increment_click_count_for_redirect(short_code)
-            
-            logging.info(f"Redirecting {short_code} to {result['original_url']}")
+            # Routing rules and weighted destinations are evaluated from cached, precompiled tables
+            destination, variant = pick_destination(result, request.headers.get)
+            try:
+                record_redirect(short_code, destination, request.remote_addr,
+                                request.headers.get('User-Agent'), variant)
+            except Exception as e:
+                # Analytics failures must not turn a known redirect into a 503
+                logging.error(f"Failed to record redirect for {short_code}: {e}")
             
-            # Redirect to original URL
-            return redirect(result['original_url'], code=302)
+            # Redirect to original URL, cacheable according to the link's policy
+            status_code, cache_control = redirect_cache_policy(result)
+            response = redirect(destination, code=status_code)
+            response.headers['Cache-Control'] = cache_control
+            return response
+        elif result.get('unavailable'):
+            # Backend down and nothing cached: tell clients to retry instead of 404ing
+            logging.warning(f"503 for {short_code}: {result.get('error')}")
+            return _unavailable_response()
         else:
             # Log the reason for 404
             error_reason = result.get('error', 'Short code not found')
-            logging.info(f"404 for {short_code}: {error_reason}")
+            logging.info("404 for %s: %s", short_code, error_reason,
+                         extra={"route": "redirect_miss", "short_code": short_code})
             
             # Return 404 page
-            return render_template('404.html'), 404
+            return static_pages.response('404.html', 404)
             
     except Exception as e:
         logging.error(f"Error in redirect_url: {e}")
-        return render_template('404.html'), 404
+        return _unavailable_response()
+
+
+def record_redirect(short_code, original_url, remote_addr, user_agent, variant=None):
+    """
+    Side effects of a successful redirect (shared with the WSGI fast path)
+    Args:
+        short_code: The short code being followed
+        original_url: Where it redirects to
+        remote_addr: Client IP address
+        user_agent: Client User-Agent header or None
+        variant: Index of the chosen destination for weighted links, or "r<index>" of a matched rule
+    """
+    # Spool the click for batched replay; count it directly when there's no spool
+    if not click_spool.record(short_code, variant):
+        increment_click_count_for_redirect(short_code, variant)
+    hot_links.add(short_code)
+    visitor_tracker.record(short_code, remote_addr, user_agent)
+    
+    logging.info("Redirecting %s to %s", short_code, original_url,
+                 extra={"route": "redirect", "short_code": short_code})
+
+
+def _unavailable_response():
+    response = static_pages.response('503.html', 503)
+    response.headers['Retry-After'] = str(UNAVAILABLE_RETRY_AFTER)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
 
 # Analytics endpoint (using Luis's function)
 @redirect_bp.route('/api/stats/<string:short_code>', methods=['GET'])
+@rate_limit('stats')
 def get_url_stats(short_code):
     """Get statistics for a short URL"""
     try:
@@ -49,16 +100,17 @@ def get_url_stats(short_code):
         stats = URLMapping.get_url_stats(short_code)
 
         if stats:
-            return jsonify({
+            return conditional_json({
                 'success': True,
                 'data': {
                     'original_url': stats['original_url'],
                     'short_code': stats['short_code'],
                     'click_count': stats['click_count'],
+                    'unique_visitors': stats['unique_visitors'],
                     'created_at': stats['created_at'],
                     'is_active': stats['is_active']
                 }
-            }), 200
+            }, last_modified=stats['updated_at'])
         else:
             return jsonify({
                 'success': False,
@@ -77,4 +129,4 @@ def get_url_stats(short_code):
 @redirect_bp.app_errorhandler(404)
 def not_found(error):
     """Handle 404 errors for redirect blueprint"""
-    return render_template('404.html'), 404
+    return static_pages.response('404.html', 404)
@@ -1,6 +1,14 @@
 from flask import Blueprint, request, jsonify
 from utils.url_encoder import URLEncoder
+from utils.rate_limiter import rate_limit
+from utils.idempotency import idempotent
+from utils.http_cache import conditional_json
+from utils.expiry import parse_expiry
+from utils.destinations import parse_destinations
+from utils.routing import parse_rules
+from utils.cursors import encode_cursor, decode_cursor
 from models.url_mapping import URLMapping, get_original_url_for_redirect
+from routes.admin import is_admin_request
 from datetime import datetime
 import logging
 
@@ -8,10 +16,16 @@ import logging
 shorten_bp = Blueprint('shorten', __name__)
 
 @shorten_bp.route('/api/shorten', methods=['POST'])
+@idempotent('shorten')
+@rate_limit('shorten')
 def shorten_url():
     """
     Create a short URL from a long URL
-    Request body: {"url": "https://example.com", "custom_alias": "optional"}
+    Retries that send the same Idempotency-Key header get the original response.
+    Request body: {"url": "https://example.com", "custom_alias": "optional", "immutable": false,
+                   "expires_at": "optional ISO-8601" | "ttl_seconds": optional int,
+                   "destinations": optional [{"url": "...", "weight": 70}, ...] instead of "url",
+                   "rules": optional [{"url": "...", "country": "DE", "device": "mobile", ...}]}
     Returns: JSON response with short URL details or error
     """
     try:
@@ -26,6 +40,20 @@ def shorten_url():
         
         original_url = data.get('url')
         custom_alias = data.get('custom_alias')
+        immutable = data.get('immutable', False)
+        
+        # Split links: weighted destinations, the first one doubles as original_url.
+        # Rules are compiled here too, so a rule set that can't be compiled is a 400
+        try:
+            destinations = parse_destinations(data, URLEncoder.validate_url)
+            rules = parse_rules(data, URLEncoder.validate_url)
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
+        if destinations and not original_url:
+            original_url = destinations[0]["url"]
         
         # Validate required fields
         if not original_url:
@@ -41,6 +69,21 @@ def shorten_url():
                 "error": "Invalid URL format"
             }), 400
         
+        if not isinstance(immutable, bool):
+            return jsonify({
+                "success": False,
+                "error": "immutable must be true or false"
+            }), 400
+        
+        # Validate optional expiry
+        try:
+            expires_at = parse_expiry(data)
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
+        
         # Handle custom alias
         if custom_alias:
             # Validate custom alias format
@@ -79,7 +122,11 @@ def shorten_url():
         mapping_data = URLMapping.create_mapping(
             original_url=original_url,
             short_code=short_code,
-            client_ip=client_ip
+            client_ip=client_ip,
+            immutable=immutable,
+            expires_at=expires_at,
+            destinations=destinations,
+            rules=rules
         )
         
         if not mapping_data:
@@ -98,10 +145,17 @@ def shorten_url():
             "short_url": short_url,
             "short_code": short_code,
             "original_url": original_url,
-            "created_at": mapping_data.get("created_at")
+            "created_at": mapping_data.get("created_at"),
+            "immutable": immutable,
+            "expires_at": expires_at
         }
+        if destinations:
+            response["destinations"] = destinations
+        if rules:
+            response["rules"] = rules
         
-        logging.info(f"Created short URL: {short_code} -> {original_url}")
+        logging.info("Created short URL: %s -> %s", short_code, original_url,
+                     extra={"route": "shorten", "short_code": short_code})
         return jsonify(response), 200
         
     except Exception as e:
@@ -112,6 +166,7 @@ def shorten_url():
         }), 500
 
 @shorten_bp.route('/api/stats/<short_code>', methods=['GET'])
+@rate_limit('stats')
 def get_url_statistics(short_code):
     """
     Get statistics for a short URL
@@ -127,13 +182,119 @@ def get_url_statistics(short_code):
                 "error": "Short URL not found"
             }), 404
         
+        return conditional_json({
+            "success": True,
+            "data": stats
+        }, last_modified=stats.get("updated_at"))
+        
+    except Exception as e:
+        logging.error(f"Error getting URL stats: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Internal server error"
+        }), 500
+
+MAX_BATCH_STATS = 100
+
+def _batch_stats_cost():
+    """Charge batch stats requests one token per 10 codes"""
+    data = request.get_json(silent=True) or {}
+    codes = data.get('short_codes')
+    return max(1, len(codes) // 10) if isinstance(codes, list) else 1
+
+@shorten_bp.route('/api/stats/batch', methods=['POST'])
+@rate_limit('stats', cost=_batch_stats_cost)
+def get_batch_statistics():
+    """
+    Get statistics for several short URLs in one request
+    Request body: {"short_codes": ["abc123", "xyz789"]}
+    Returns: JSON response mapping each short code to its statistics (null if not found)
+    """
+    try:
+        data = request.get_json(silent=True)
+        short_codes = data.get('short_codes') if isinstance(data, dict) else None
+        
+        if not isinstance(short_codes, list) or not short_codes \
+                or not all(isinstance(code, str) and code for code in short_codes):
+            return jsonify({
+                "success": False,
+                "error": "short_codes must be a non-empty list of strings"
+            }), 400
+        
+        if len(short_codes) > MAX_BATCH_STATS:
+            return jsonify({
+                "success": False,
+                "error": f"At most {MAX_BATCH_STATS} short codes per request"
+            }), 400
+        
+        stats = URLMapping.get_url_stats_many(short_codes)
+        if not is_admin_request():
+            # Anyone can ask for many codes at once; creator IPs are for admins only
+            stats = {code: {key: value for key, value in data.items() if key != "created_by_ip"}
+                     if data else data
+                     for code, data in stats.items()}
+        
         return jsonify({
             "success": True,
             "data": stats
         }), 200
         
     except Exception as e:
-        logging.error(f"Error getting URL stats: {e}")
+        logging.error(f"Error getting batch URL stats: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Internal server error"
+        }), 500
+
+DEFAULT_LIST_LIMIT = 50
+MAX_LIST_LIMIT = 100
+
+@shorten_bp.route('/api/links', methods=['GET'])
+@rate_limit('stats')
+def list_links():
+    """
+    List links created from an IP address, newest first (admin only: clients behind one
+    NAT or proxy share an address, so the caller's IP can't prove who created a link)
+    Query params: creator (default: the caller's IP),
+                  limit (default 50, max 100), cursor (next_cursor from the previous page)
+    Returns: JSON response with one page of links and the cursor for the next page
+    """
+    try:
+        if not is_admin_request():
+            return jsonify({
+                "success": False,
+                "error": "Listing links requires the admin key"
+            }), 403
+        creator = request.args.get('creator') or request.remote_addr
+        
+        try:
+            limit = min(max(int(request.args.get('limit', DEFAULT_LIST_LIMIT)), 1), MAX_LIST_LIMIT)
+        except ValueError:
+            return jsonify({
+                "success": False,
+                "error": "limit must be an integer"
+            }), 400
+        
+        cursor = request.args.get('cursor')
+        try:
+            after = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
+        
+        links, next_after = URLMapping.list_by_creator(creator, limit, after)
+        return jsonify({
+            "success": True,
+            "data": {
+                "links": links,
+                "next_cursor": encode_cursor(next_after)
+            }
+        }), 200
+        
+    except Exception as e:
+        logging.error(f"Error listing links: {e}")
         return jsonify({
             "success": False,
             "error": "Internal server error"
@@ -177,12 +338,13 @@ def get_original_url_for_redirect(short_code):
     """
     return URLMapping.get_mapping(short_code)
 
-def increment_click_count_for_redirect(short_code):
+def increment_click_count_for_redirect(short_code, variant=None):
     """
     Helper function for Eli to increment click counter
     Args:
         short_code: The short code to increment
+        variant: Index of the chosen destination for weighted links, or "r<index>" of a matched rule
     Returns:
         boolean: True if successful
     """
-    return URLMapping.increment_clicks(short_code)
+    return URLMapping.increment_clicks(short_code, variant)
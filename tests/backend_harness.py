@@ -0,0 +1,106 @@
+# Storage backends the URLMapping contract and benchmarks run against
+# Each backend is a context manager that points URLMapping at a fresh, empty
+# store for the duration of the block. Register new backends with @backend.
+import os
+import contextlib
+
+import config.database as database
+from config.database import DatabaseConfig
+from config.mock_database import MockURLMapping
+from utils.mapping_cache import mapping_cache
+from utils.shared_cache import get_shared_cache, set_shared_cache
+from tests.firestore_fake import FakeFirestoreClient
+
+BACKENDS = {}
+
+
+def backend(name, available=lambda: True):
+    """Register a backend context manager under a name"""
+    def register(factory):
+        BACKENDS[name] = (contextlib.contextmanager(factory), available)
+        return factory
+    return register
+
+
+def available_backends():
+    """Names of the backends that can run in this environment"""
+    return [name for name, (_, available) in BACKENDS.items() if available()]
+
+
+def use_backend(name):
+    """Context manager activating a registered backend"""
+    return BACKENDS[name][0]()
+
+
+@contextlib.contextmanager
+def _isolated(use_mock, db_config=None):
+    """Swap the database mode and config, with empty caches, restoring both afterwards"""
+    previous_mock = os.environ.get('USE_MOCK_DATABASE')
+    previous_config = database.db_config
+    previous_shared = get_shared_cache()
+    os.environ['USE_MOCK_DATABASE'] = 'true' if use_mock else 'false'
+    if db_config is not None:
+        database.db_config = db_config
+    set_shared_cache(None)
+    mapping_cache.clear()
+    try:
+        yield
+    finally:
+        mapping_cache.clear()
+        set_shared_cache(previous_shared)
+        database.db_config = previous_config
+        if previous_mock is None:
+            os.environ.pop('USE_MOCK_DATABASE', None)
+        else:
+            os.environ['USE_MOCK_DATABASE'] = previous_mock
+
+
+def _fake_config(shards):
+    client = FakeFirestoreClient()
+    config = DatabaseConfig(shards=shards, previous_shards=[],
+                            client_factory=lambda project, database_id: client)
+    config.use_mock = False
+    return config
+
+
+@backend("mock")
+def mock_backend():
+    """In-memory development store (config/mock_database.py)"""
+    saved = dict(MockURLMapping._storage)
+    MockURLMapping._storage.clear()
+    try:
+        with _isolated(use_mock=True):
+            yield
+    finally:
+        MockURLMapping._storage.clear()
+        MockURLMapping._storage.update(saved)
+
+
+@backend("firestore-fake")
+def firestore_fake_backend():
+    """Firestore code paths against the in-memory fake client"""
+    with _isolated(use_mock=False, db_config=_fake_config([("(default)", "url_mappings")])):
+        yield
+
+
+@backend("firestore-fake-sharded")
+def firestore_fake_sharded_backend():
+    """Firestore code paths across three consistent-hash shards"""
+    shards = [("(default)", f"url_mappings_{i}") for i in range(3)]
+    with _isolated(use_mock=False, db_config=_fake_config(shards)):
+        yield
+
+
+@backend("firestore-emulator", available=lambda: bool(os.getenv('FIRESTORE_EMULATOR_HOST')))
+def firestore_emulator_backend():
+    """Real Firestore client against the emulator in FIRESTORE_EMULATOR_HOST"""
+    collection = f"contract_{os.getpid()}_{id(object())}"
+    config = DatabaseConfig(shards=[("(default)", collection)], previous_shards=[])
+    config.use_mock = False
+    config.project_id = config.project_id or "url-shortener-test"
+    with _isolated(use_mock=False, db_config=config):
+        try:
+            yield
+        finally:
+            for doc in config.get_collection().stream():
+                doc.reference.delete()
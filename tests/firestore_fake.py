@@ -0,0 +1,287 @@
+# In-memory stand-in for the parts of google-cloud-firestore the app uses
+# Lets tests exercise the Firestore code paths (sharding, transactions, queries)
+# without credentials or the emulator.
+import copy
+import itertools
+import threading
+from datetime import datetime, timezone
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound
+
+_clock = itertools.count(1)
+
+
+def _timestamp():
+    # Strictly increasing update times so preconditions are meaningful
+    return (datetime.now(timezone.utc), next(_clock))
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data, update_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.update_time = update_time
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return self._data.get(field) if self._data else None
+
+
+class FakeDocumentReference:
+    def __init__(self, collection, doc_id):
+        self._collection = collection
+        self.id = doc_id
+
+    @property
+    def _store(self):
+        return self._collection._docs
+
+    def get(self, transaction=None, timeout=None, field_paths=None):
+        with self._collection._client._lock:
+            self._collection._client.reads += 1
+            entry = self._store.get(self.id)
+            if entry is None:
+                return FakeSnapshot(self, None)
+            data = entry[0]
+            if field_paths is not None:
+                data = {key: value for key, value in data.items() if key in field_paths}
+            return FakeSnapshot(self, copy.deepcopy(data), entry[1])
+
+    def set(self, data, merge=False):
+        with self._collection._client._lock:
+            current = self._store.get(self.id)
+            base = dict(current[0]) if (merge and current) else {}
+            base.update(copy.deepcopy(data))
+            self._store[self.id] = (base, _timestamp())
+
+    def create(self, data):
+        with self._collection._client._lock:
+            if self.id in self._store:
+                raise AlreadyExists(f"Document already exists: {self.id}")
+            self._store[self.id] = (copy.deepcopy(data), _timestamp())
+
+    def update(self, data, option=None):
+        with self._collection._client._lock:
+            current = self._store.get(self.id)
+            if current is None:
+                raise NotFound(f"No document to update: {self.id}")
+            if option is not None and current[1] != option:
+                raise FailedPrecondition(f"Document changed: {self.id}")
+            updated = dict(current[0])
+            updated.update(copy.deepcopy(data))
+            self._store[self.id] = (updated, _timestamp())
+
+    def delete(self, option=None):
+        with self._collection._client._lock:
+            current = self._store.get(self.id)
+            if option is not None and (current is None or current[1] != option):
+                raise FailedPrecondition(f"Document changed: {self.id}")
+            self._store.pop(self.id, None)
+
+
+class FakeQuery:
+    def __init__(self, collection, filters=(), orders=(), limit=None, start_after=None, fields=None):
+        self._collection = collection
+        self._filters = filters
+        self._orders = orders
+        self._limit = limit
+        self._start_after = start_after
+        self._fields = fields
+
+    def _copy(self, **changes):
+        state = dict(filters=self._filters, orders=self._orders, limit=self._limit,
+                     start_after=self._start_after, fields=self._fields)
+        state.update(changes)
+        return FakeQuery(self._collection, **state)
+
+    def where(self, field, op, value):
+        return self._copy(filters=self._filters + ((field, op, value),))
+
+    def order_by(self, field, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, snapshot):
+        return self._copy(start_after=snapshot)
+
+    def select(self, fields):
+        return self._copy(fields=list(fields))
+
+    @staticmethod
+    def _value(doc_id, data, field):
+        return doc_id if field == "__name__" else data.get(field)
+
+    def _matches(self, doc_id, data):
+        for field, op, value in self._filters:
+            actual = self._value(doc_id, data, field)
+            if op == "==":
+                if actual != value:
+                    return False
+                continue
+            if op == "in":
+                if actual not in value:
+                    return False
+                continue
+            # Range filters skip missing/null values, like Firestore
+            if actual is None:
+                return False
+            if not {"<": actual < value, "<=": actual <= value,
+                    ">": actual > value, ">=": actual >= value}[op]:
+                return False
+        # Ordering on a field excludes documents that don't have it
+        return all(field == "__name__" or data.get(field) is not None for field, _ in self._orders)
+
+    def _sort_key(self, doc_id, data):
+        return tuple(self._value(doc_id, data, field) for field, _ in self._orders) + (doc_id,)
+
+    def stream(self, transaction=None):
+        client = self._collection._client
+        with client._lock:
+            client.queries += 1
+            rows = [(doc_id, entry) for doc_id, entry in self._collection._docs.items()
+                    if self._matches(doc_id, entry[0])]
+        orders = self._orders or (("__name__", "ASCENDING"),)
+        # Stable multi-key sort, last key first
+        rows.sort(key=lambda row: row[0])
+        for field, direction in reversed(orders):
+            rows.sort(key=lambda row: self._value(row[0], row[1][0], field), reverse=direction == "DESCENDING")
+
+        if self._start_after is not None:
+            if isinstance(self._start_after, dict):
+                # Field-value cursor; __name__ is the document id
+                cursor = self._sort_key(self._start_after.get("__name__"), self._start_after)
+            else:
+                cursor = self._sort_key(self._start_after.id, self._start_after._data or {})
+            keyed = [(self._sort_key(doc_id, entry[0]), doc_id, entry) for doc_id, entry in rows]
+            descending = orders[0][1] == "DESCENDING"
+            rows = [(doc_id, entry) for key, doc_id, entry in keyed
+                    if (key < cursor if descending else key > cursor)]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+
+        for doc_id, (data, update_time) in rows:
+            if self._fields is not None:
+                data = {key: value for key, value in data.items() if key in self._fields}
+            yield FakeSnapshot(self._collection.document(doc_id), copy.deepcopy(data), update_time)
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, client, name):
+        super().__init__(self)
+        self._client = client
+        self.id = name
+        self._docs = client._data.setdefault(name, {})
+
+    def document(self, doc_id):
+        return FakeDocumentReference(self, doc_id)
+
+
+class FakeTransaction:
+    """Serializes transactions with a client-wide lock and applies writes on commit"""
+
+    _read_only = False
+    _max_attempts = 5
+
+    def __init__(self, client):
+        self._client = client
+        self._id = None
+        self._writes = []
+
+    def _clean_up(self):
+        self._writes = []
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._client._transaction_lock.acquire()
+        self._id = b"fake-transaction"
+
+    def _rollback(self):
+        self._clean_up()
+        self._client._transaction_lock.release()
+
+    def _commit(self):
+        try:
+            for write in self._writes:
+                write()
+        finally:
+            self._clean_up()
+            self._client._transaction_lock.release()
+
+    def set(self, reference, data, merge=False):
+        self._writes.append(lambda: reference.set(data, merge=merge))
+
+    def create(self, reference, data):
+        self._writes.append(lambda: reference.create(data))
+
+    def update(self, reference, data):
+        self._writes.append(lambda: reference.update(data))
+
+    def delete(self, reference, option=None):
+        self._writes.append(lambda: reference.delete(option=option))
+
+
+class FakeWriteBatch:
+    """Applies every write or none: preconditions are checked before anything is written"""
+
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference, data, merge=False):
+        self._writes.append((reference, None, lambda: reference.set(data, merge=merge)))
+
+    def update(self, reference, data, option=None):
+        self._writes.append((reference, option, lambda: reference.update(data)))
+
+    def delete(self, reference, option=None):
+        self._writes.append((reference, option, lambda: reference.delete()))
+
+    def commit(self):
+        if len(self._writes) > 500:
+            raise ValueError("A batch can contain at most 500 writes")
+        with self._client._lock:
+            self._client.commits += 1
+            for reference, option, _ in self._writes:
+                current = reference._store.get(reference.id)
+                if option is not None and (current is None or current[1] != option):
+                    raise FailedPrecondition(f"Document changed: {reference.id}")
+            for _, _, write in self._writes:
+                write()
+        self._writes = []
+
+
+class FakeFirestoreClient:
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.RLock()
+        self._transaction_lock = threading.RLock()
+        self.reads = 0
+        self.queries = 0
+        self.commits = 0
+
+    def collection(self, name):
+        return FakeCollectionReference(self, name)
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        for reference in references:
+            yield reference.get(field_paths=field_paths)
+
+    def write_option(self, last_update_time=None):
+        return last_update_time
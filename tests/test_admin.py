@@ -0,0 +1,202 @@
+import unittest
+import json
+import os
+import sys
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from utils.heavy_hitters import SpaceSaving, SlidingTopK, hot_links
+from utils.bulk_admin import parse_selector, run_bulk
+from models.url_mapping import URLMapping
+from tests.backend_harness import use_backend
+import config.database as database
+
+class TestHeavyHitters(unittest.TestCase):
+    def test_space_saving_fixed_memory(self):
+        """Test that the summary never tracks more than its capacity"""
+        summary = SpaceSaving(capacity=10)
+        for i in range(1000):
+            summary.add(f"code{i}")
+        for _ in range(50):
+            summary.add("hot")
+
+        self.assertLessEqual(len(summary.counters), 10)
+        self.assertEqual(summary.top(1)[0][0], "hot")
+
+    def test_space_saving_merge(self):
+        """Test merging summaries from two workers"""
+        a = SpaceSaving(capacity=5)
+        b = SpaceSaving(capacity=5)
+        for _ in range(30):
+            a.add("viral")
+        for _ in range(20):
+            b.add("viral")
+            b.add("other")
+
+        restored = SpaceSaving.from_dict(json.loads(json.dumps(b.to_dict())))
+        a.merge(restored)
+
+        self.assertEqual(a.top(1)[0][:2], ("viral", 50))
+
+    def test_space_saving_rejects_bad_payloads(self):
+        """Test that client sketches are validated before anything is allocated"""
+        for payload in ({"capacity": 0, "items": []},
+                        {"capacity": 10 ** 9, "items": []},
+                        {"capacity": 1, "items": [["a", 1, 0], ["b", 1, 0]]},
+                        {"capacity": 2, "items": [["a", "nan", 0]]},
+                        {"capacity": 2, "items": [["a", 1, 5]]},
+                        {"capacity": 2}):
+            with self.assertRaises(ValueError):
+                SpaceSaving.from_dict(payload)
+
+    def test_sliding_window_expires_old_buckets(self):
+        """Test that counts fall out of the window"""
+        tracker = SlidingTopK(capacity=10, window_seconds=10, num_windows=3, decay=1.0)
+        tracker.add("old", now=0)
+        tracker.add("new", now=35)
+
+        keys = [key for key, _, _ in tracker.top(10, now=35)]
+        self.assertEqual(keys, ["new"])
+
+class TestAdminAPI(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        # Force mock database for testing
+        os.environ['USE_MOCK_DATABASE'] = 'true'
+
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+        hot_links.reset()
+
+    def test_top_links_endpoint(self):
+        """Test that redirects show up in the top links"""
+        response = self.client.post('/api/shorten',
+                                  data=json.dumps({'url': 'https://example.com'}),
+                                  content_type='application/json')
+        short_code = json.loads(response.data)['short_code']
+
+        for _ in range(3):
+            self.client.get(f'/{short_code}', follow_redirects=False)
+
+        response = self.client.get('/api/admin/top?n=5&sketch=true')
+        self.assertEqual(response.status_code, 200)
+
+        data = json.loads(response.data)['data']
+        self.assertEqual(data['top'][0]['short_code'], short_code)
+        self.assertEqual(data['top'][0]['clicks'], 3)
+        self.assertIn('sketch', data)
+
+    def test_merge_worker_sketches(self):
+        """Test merging sketches posted from other workers"""
+        worker = SpaceSaving(capacity=10)
+        for _ in range(7):
+            worker.add("remote")
+
+        response = self.client.post('/api/admin/top',
+                                  data=json.dumps({'sketches': [worker.to_dict()]}),
+                                  content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        data = json.loads(response.data)['data']
+        self.assertEqual(data['top'][0]['short_code'], 'remote')
+
+    def test_admin_key_required(self):
+        """Test that a configured admin key is enforced"""
+        os.environ['ADMIN_API_KEY'] = 'secret'
+        try:
+            response = self.client.get('/api/admin/top')
+            self.assertEqual(response.status_code, 401)
+
+            response = self.client.get('/api/admin/top', headers={'X-Admin-Key': 'secret'})
+            self.assertEqual(response.status_code, 200)
+        finally:
+            del os.environ['ADMIN_API_KEY']
+
+class TestBulkAdmin(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        os.environ['USE_MOCK_DATABASE'] = 'true'
+
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+
+    def _bulk(self, action, body):
+        response = self.client.post(f'/api/admin/bulk/{action}', data=json.dumps(body),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        return [json.loads(line) for line in response.data.decode().splitlines()]
+
+    def test_deactivate_by_ip_with_dry_run(self):
+        """Test that a dry run changes nothing and the real run only hits the abusive IP"""
+        with use_backend('mock'):
+            for i in range(5):
+                URLMapping.create_mapping(f'https://spam.example.com/{i}', f'spam{i}', '203.0.113.7')
+            URLMapping.create_mapping('https://example.com', 'keepme', '198.51.100.1')
+
+            events = self._bulk('deactivate', {'created_by_ip': '203.0.113.7', 'dry_run': True})
+            self.assertEqual(events[-1]['event'], 'done')
+            self.assertEqual(events[-1]['matched'], 5)
+            self.assertTrue(URLMapping.get_mapping('spam0')['exists'])
+
+            events = self._bulk('deactivate', {'created_by_ip': '203.0.113.7'})
+            self.assertEqual([e['event'] for e in events][0], 'start')
+            self.assertEqual(events[-1]['updated'], 5)
+            self.assertFalse(URLMapping.get_mapping('spam3')['exists'])
+            self.assertTrue(URLMapping.get_mapping('keepme')['exists'])
+
+    def test_delete_by_codes(self):
+        """Test deleting an explicit list, counting unknown codes"""
+        with use_backend('mock'):
+            URLMapping.create_mapping('https://example.com', 'campaign1')
+            events = self._bulk('delete', {'short_codes': ['campaign1', 'unknown1']})
+            self.assertEqual(events[-1]['deleted'], 1)
+            self.assertEqual(events[-1]['missing'], 1)
+            self.assertFalse(URLMapping.validate_short_code_exists('campaign1'))
+
+    def test_invalid_selection(self):
+        """Test that missing or mixed selectors are rejected"""
+        response = self.client.post('/api/admin/bulk/deactivate', data=json.dumps({}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        with self.assertRaises(ValueError):
+            parse_selector({'short_codes': ['a'], 'created_by_ip': '1.2.3.4'})
+        with self.assertRaises(ValueError):
+            parse_selector({'created_after': '2025-02-01', 'created_before': '2025-01-01'})
+        response = self.client.post('/api/admin/bulk/purge', data=json.dumps({'short_codes': ['a']}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+        for options in ({'dry_run': 'false'}, {'dry_run': 1}, {'max_rate': 'fast'}, {'max_rate': True},
+                        {'max_rate': 0}, {'max_rate': -5}):
+            response = self.client.post('/api/admin/bulk/deactivate',
+                                        data=json.dumps(dict({'short_codes': ['a']}, **options)),
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400, options)
+        response = self.client.post('/api/admin/bulk/deactivate', content_type='application/json',
+                                    data='{"short_codes": ["a"], "max_rate": NaN}')
+        self.assertEqual(response.status_code, 400)
+
+    def test_batched_writes_and_throttle(self):
+        """Test chunked batch commits on Firestore and pacing between chunks"""
+        with use_backend('firestore-fake'):
+            client = database.db_config.get_client()
+            for i in range(25):
+                URLMapping.create_mapping(f'https://example.com/{i}', f'bulk{i:02d}', '203.0.113.9')
+            URLMapping.deactivate_mapping('bulk00')
+
+            pauses = []
+            selector = parse_selector({'created_by_ip': '203.0.113.9', 'created_after': '2000-01-01'})
+            events = list(run_bulk('deactivate', selector, chunk_size=10, max_rate=50, sleep=pauses.append))
+            self.assertEqual(events[-1]['matched'], 25)
+            self.assertEqual(events[-1]['updated'], 24)
+            self.assertEqual(events[-1]['skipped'], 1)
+            self.assertEqual(client.commits, 3)
+            self.assertEqual(len(pauses), 3)
+            self.assertFalse(URLMapping.get_mapping('bulk17')['exists'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+import json
+import os
+import sys
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models.url_mapping import URLMapping
+from utils.admission import AdaptiveLimit, AdmissionController, admission_controller, parse_class_limits
+
+class TestAdaptiveLimit(unittest.TestCase):
+    def test_grows_while_latency_is_flat(self):
+        """Test that a saturated limit grows while latency stays at the baseline"""
+        limit = AdaptiveLimit(initial=20, max_limit=100)
+        for _ in range(200):
+            limit.on_sample(0.01, inflight=int(limit.limit))
+        self.assertEqual(limit.limit, 100)
+
+    def test_idle_limit_does_not_grow(self):
+        """Test that the limit only probes upward when demand reaches it"""
+        limit = AdaptiveLimit(initial=20)
+        for _ in range(200):
+            limit.on_sample(0.01, inflight=1)
+        self.assertEqual(limit.limit, 20)
+
+    def test_shrinks_when_latency_inflates(self):
+        """Test that queueing latency drives the limit down to its floor"""
+        limit = AdaptiveLimit(initial=100, min_limit=8)
+        for _ in range(50):
+            limit.on_sample(0.01, inflight=100)
+        for _ in range(200):
+            limit.on_sample(0.2, inflight=100)
+        self.assertEqual(limit.limit, 8)
+
+class TestAdmissionController(unittest.TestCase):
+    def test_low_priority_shed_first(self):
+        """Test that stats are shed before shorten, and shorten before redirects"""
+        controller = AdmissionController(AdaptiveLimit(initial=10, min_limit=1))
+        slots = [controller.try_acquire("stats") for _ in range(10)]
+        self.assertEqual(slots.count(None), 4)  # stats may use 60% of the limit
+        self.assertIsNotNone(controller.try_acquire("shorten"))
+        self.assertIsNotNone(controller.try_acquire("shorten"))
+        self.assertIsNone(controller.try_acquire("shorten"))  # 80%
+        self.assertIsNotNone(controller.try_acquire("redirect"))
+        self.assertIsNotNone(controller.try_acquire("redirect"))
+        self.assertIsNone(controller.try_acquire("redirect"))
+
+        stats = controller.stats()
+        self.assertEqual(stats["inflight"], 10)
+        self.assertEqual(stats["shed"], {"redirect": 1, "shorten": 1, "stats": 4, "admin": 0})
+
+        controller.release("redirect", 0.01, 10)
+        self.assertIsNotNone(controller.try_acquire("redirect"))
+
+    def test_admin_latency_not_sampled(self):
+        """Test that long admin requests (bulk jobs, exports) don't shrink the limit"""
+        controller = AdmissionController(AdaptiveLimit(initial=50))
+        controller.release("redirect", 0.01, controller.try_acquire("redirect"))
+        for _ in range(100):
+            controller.release("admin", 30.0, controller.try_acquire("admin"))
+        self.assertEqual(controller.limit.latency, 0.01)
+        self.assertEqual(controller.stats()["inflight"], 0)
+
+    def test_class_budgets(self):
+        """Test per-class budgets and their parsing"""
+        controller = AdmissionController(AdaptiveLimit(initial=100), parse_class_limits("shorten=1"))
+        self.assertIsNotNone(controller.try_acquire("shorten"))
+        self.assertIsNone(controller.try_acquire("shorten"))
+        self.assertIsNotNone(controller.try_acquire("stats"))
+        with self.assertRaises(ValueError):
+            parse_class_limits("uploads=3")
+
+class TestLoadShedding(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        # Force mock database for testing
+        os.environ['USE_MOCK_DATABASE'] = 'true'
+
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+
+    def test_overloaded_requests_get_fast_503(self):
+        """Test the shed responses and that health checks are never shed"""
+        URLMapping.create_mapping('https://example.com', 'shedme')
+        shed_before = admission_controller.stats()["shed"]
+
+        with patch.object(admission_controller, 'inflight', 10000):
+            response = self.client.get('/api/stats/shedme')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers['Retry-After'], str(admission_controller.retry_after))
+            self.assertFalse(json.loads(response.data)['success'])
+
+            response = self.client.get('/shedme')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers['Cache-Control'], 'no-store')
+
+            self.assertEqual(self.client.get('/health').status_code, 200)
+
+        shed = admission_controller.stats()["shed"]
+        self.assertEqual(shed["stats"], shed_before["stats"] + 1)
+        self.assertEqual(shed["redirect"], shed_before["redirect"] + 1)
+        self.assertEqual(self.client.get('/shedme').status_code, 302)
+        self.assertEqual(admission_controller.stats()["inflight"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,213 @@
+import unittest
+import contextlib
+import os
+import random
+import sys
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.url_mapping import URLMapping
+from utils.hyperloglog import HyperLogLog
+from utils.segment_store import MemoryBackend, segment_store
+from tests.backend_harness import available_backends, use_backend
+
+class BackendContract:
+    """
+    Behaviour every storage backend must share
+    A TestCase subclass is generated per registered backend (see the bottom of this file).
+    """
+
+    BACKEND = None
+
+    def setUp(self):
+        self._stack = contextlib.ExitStack()
+        self._stack.enter_context(use_backend(self.BACKEND))
+
+    def tearDown(self):
+        self._stack.close()
+
+    def test_create_and_lookup(self):
+        """Test that a created mapping is returned by lookups"""
+        self.assertIsNotNone(URLMapping.create_mapping('https://example.com/a', 'contract1', '10.0.0.1'))
+        result = URLMapping.get_mapping('contract1')
+        self.assertTrue(result['exists'])
+        self.assertEqual(result['original_url'], 'https://example.com/a')
+        self.assertEqual(result['version'], 1)
+        self.assertEqual(URLMapping._fetch_mapping('contract1')['original_url'], 'https://example.com/a')
+
+    def test_missing_code(self):
+        """Test the not-found shape"""
+        result = URLMapping.get_mapping('nosuchcode')
+        self.assertFalse(result['exists'])
+        self.assertEqual(result['version'], 0)
+        self.assertFalse(URLMapping.validate_short_code_exists('nosuchcode'))
+        self.assertIsNone(URLMapping.get_url_stats('nosuchcode'))
+        self.assertFalse(URLMapping.increment_clicks('nosuchcode'))
+        self.assertFalse(URLMapping.deactivate_mapping('nosuchcode'))
+
+    def test_exists(self):
+        """Test existence checks used for alias collisions"""
+        URLMapping.create_mapping('https://example.com', 'contract2')
+        self.assertTrue(URLMapping.validate_short_code_exists('contract2'))
+        # An expired link that hasn't been swept yet is deleted and its code is free
+        URLMapping.create_mapping('https://example.com', 'contract2x', expires_at='2000-01-01T00:00:00.000000')
+        self.assertFalse(URLMapping.validate_short_code_exists('contract2x'))
+        self.assertIsNotNone(URLMapping.create_mapping('https://example.com/again', 'contract2x'))
+
+    def test_clicks_and_stats(self):
+        """Test click counting and the statistics shape"""
+        URLMapping.create_mapping('https://example.com/s', 'contract3', '10.0.0.3')
+        self.assertTrue(URLMapping.increment_clicks('contract3'))
+        self.assertTrue(URLMapping.increment_clicks('contract3'))
+        stats = URLMapping.get_url_stats('contract3')
+        self.assertEqual(stats['click_count'], 2)
+        self.assertEqual(stats['original_url'], 'https://example.com/s')
+        self.assertEqual(stats['created_by_ip'], '10.0.0.3')
+        self.assertTrue(stats['is_active'])
+        self.assertIsNotNone(stats['updated_at'])
+
+    def test_batch_stats(self):
+        """Test batch statistics with present and missing codes"""
+        for i in range(3):
+            URLMapping.create_mapping(f'https://example.com/{i}', f'batch{i}')
+        stats = URLMapping.get_url_stats_many(['batch0', 'batch2', 'missing'])
+        self.assertEqual(stats['batch2']['original_url'], 'https://example.com/2')
+        self.assertIsNone(stats['missing'])
+
+    def test_deactivate(self):
+        """Test that deactivation hides the link but keeps its stats"""
+        URLMapping.create_mapping('https://example.com', 'contract4')
+        URLMapping.get_mapping('contract4')  # warm the cache
+        self.assertTrue(URLMapping.deactivate_mapping('contract4'))
+        result = URLMapping.get_mapping('contract4')
+        self.assertFalse(result['exists'])
+        self.assertEqual(result['error'], 'URL deactivated')
+        self.assertFalse(URLMapping.get_url_stats('contract4')['is_active'])
+
+    def test_update_bumps_version(self):
+        """Test that every update yields a new version"""
+        URLMapping.create_mapping('https://example.com', 'contract5')
+        self.assertEqual(URLMapping.update_mapping('contract5', {'immutable': True}), 2)
+        self.assertEqual(URLMapping.update_mapping('contract5', {'immutable': False}), 3)
+        self.assertIsNone(URLMapping.update_mapping('nosuchcode', {'immutable': True}))
+
+    def test_expiry_queries(self):
+        """Test the expiring range query and conditional delete"""
+        URLMapping.create_mapping('https://example.com/1', 'expiring2', expires_at='2990-01-02T00:00:00.000000')
+        URLMapping.create_mapping('https://example.com/2', 'expiring1', expires_at='2990-01-01T00:00:00.000000')
+        URLMapping.create_mapping('https://example.com/3', 'later', expires_at='2999-01-01T00:00:00.000000')
+        URLMapping.create_mapping('https://example.com/4', 'forever')
+
+        expiring = URLMapping.find_expiring('2995-01-01T00:00:00.000000')
+        self.assertEqual([code for code, _ in expiring], ['expiring1', 'expiring2'])
+        self.assertEqual(len(URLMapping.find_expiring('2995-01-01T00:00:00.000000', limit=1)), 1)
+
+        # Backdate directly (not through create) so the background sweeper doesn't race the test
+        URLMapping.update_mapping('expiring1', {'expires_at': '2020-01-01T00:00:00.000000'})
+        self.assertTrue(URLMapping.delete_if_expired('expiring1'))
+        self.assertFalse(URLMapping.delete_if_expired('later'))
+        self.assertFalse(URLMapping.validate_short_code_exists('expiring1'))
+
+    def test_visitor_sketch(self):
+        """Test merging visitor sketches into the stored mapping"""
+        URLMapping.create_mapping('https://example.com', 'contract6')
+        rng = random.Random(6)
+        for _ in range(2):
+            sketch = HyperLogLog()
+            for _ in range(500):
+                sketch.add_hash(rng.getrandbits(64))
+            self.assertTrue(URLMapping.merge_visitor_sketch('contract6', sketch.to_bytes()))
+        self.assertAlmostEqual(URLMapping.get_url_stats('contract6')['unique_visitors'], 1000, delta=100)
+        self.assertIsNone(URLMapping.merge_visitor_sketch('nosuchcode', HyperLogLog().to_bytes()))
+
+    def test_export(self):
+        """Test that exports list every mapping once"""
+        for i in range(5):
+            URLMapping.create_mapping(f'https://example.com/{i}', f'export{i}')
+        exported = sorted(mapping['short_code'] for mapping in URLMapping.export_mappings())
+        self.assertEqual(exported, [f'export{i}' for i in range(5)])
+
+    def test_list_by_creator(self):
+        """Test keyset pagination of a creator's links with projected fields"""
+        for i in range(7):
+            URLMapping.create_mapping(f'https://example.com/{i}', f'mine{i}', '10.0.0.7')
+        URLMapping.create_mapping('https://example.com/other', 'theirs', '10.0.0.8')
+        URLMapping.increment_clicks('mine6')
+        
+        codes = []
+        after = None
+        while True:
+            links, after = URLMapping.list_by_creator('10.0.0.7', 3, after)
+            codes += [link['short_code'] for link in links]
+            if after is None:
+                break
+        self.assertEqual(codes, [f'mine{i}' for i in reversed(range(7))])
+        
+        links, after = URLMapping.list_by_creator('10.0.0.7', 1)
+        self.assertEqual(links[0]['click_count'], 1)
+        self.assertNotIn('created_by_ip', links[0])
+        self.assertEqual(URLMapping.list_by_creator('10.0.0.9', 3), ([], None))
+
+    def test_archive_and_promote(self):
+        """Test that idle mappings move to the cold tier and back on lookup"""
+        segment_store.open(MemoryBackend(shared=True))
+        self.addCleanup(segment_store.open, None)
+        for i in range(3):
+            URLMapping.create_mapping(f'https://example.com/{i}', f'idle{i}')
+        
+        counts = URLMapping.archive_idle('9999-12-31T00:00:00', batch_size=2)
+        self.assertEqual(counts, {"archived": 3, "kept": 0})
+        self.assertEqual(segment_store.stats()["segments"], 2)
+        self.assertEqual(list(URLMapping.export_mappings()), [])
+        
+        result = URLMapping._fetch_mapping('idle1')
+        self.assertEqual(result['original_url'], 'https://example.com/1')
+        self.assertEqual(result['version'], 3)
+        self.assertIsNone(segment_store.get('idle1'))
+        self.assertEqual([m['short_code'] for m in URLMapping.export_mappings()], ['idle1'])
+        self.assertTrue(URLMapping.increment_clicks('idle1'))
+
+    def test_apply_clicks_idempotent(self):
+        """Test that replayed click batches apply once per spool sequence"""
+        URLMapping.create_mapping('https://example.com/c', 'spooled1')
+        self.assertTrue(URLMapping.apply_clicks('s1', {'spooled1': (3, 100, {}), 'nosuchcode': (1, 100, {})}))
+        self.assertTrue(URLMapping.apply_clicks('s1', {'spooled1': (3, 100, {})}))
+        self.assertTrue(URLMapping.apply_clicks('s2', {'spooled1': (2, 50, {})}))
+        self.assertTrue(URLMapping.apply_clicks('s1', {'spooled1': (1, 101, {})}))
+        self.assertEqual(URLMapping.get_url_stats('spooled1')['click_count'], 6)
+        self.assertNotIn('click_spools', next(URLMapping.export_mappings()))
+    
+    def test_weighted_destinations(self):
+        """Test that split links carry an alias table and count clicks per variant"""
+        destinations = [{'url': 'https://a.example.com', 'weight': 3}, {'url': 'https://b.example.com', 'weight': 1}]
+        URLMapping.create_mapping('https://a.example.com', 'split1', destinations=destinations)
+        result = URLMapping._fetch_mapping('split1')
+        self.assertEqual(result['destinations'], ['https://a.example.com', 'https://b.example.com'])
+        self.assertEqual(len(result['alias_table'][0]), 2)
+        
+        self.assertTrue(URLMapping.increment_clicks('split1', 1))
+        self.assertTrue(URLMapping.apply_clicks('s1', {'split1': (3, 100, {'0': 2, '1': 1})}))
+        stats = URLMapping.get_url_stats('split1')
+        self.assertEqual(stats['click_count'], 4)
+        self.assertEqual([d['click_count'] for d in stats['destinations']], [2, 2])
+
+    def test_routing_rules(self):
+        """Test that rule links carry their compiled table and count clicks per rule"""
+        rules = [{'url': 'https://example.de', 'country': ['DE']}, {'url': 'https://m.example.com', 'device': ['mobile']}]
+        URLMapping.create_mapping('https://example.com', 'routed1', rules=rules)
+        result = URLMapping._fetch_mapping('routed1')
+        self.assertEqual(result['routing']['urls'], ['https://example.de', 'https://m.example.com'])
+        
+        self.assertTrue(URLMapping.increment_clicks('routed1', 'r1'))
+        stats = URLMapping.get_url_stats('routed1')
+        self.assertEqual([rule['click_count'] for rule in stats['rules']], [0, 1])
+        self.assertEqual(stats['rules'][0]['country'], ['DE'])
+
+# One concrete TestCase per backend, e.g. TestContract_firestore_fake
+for _name in available_backends():
+    _class_name = 'TestContract_' + _name.replace('-', '_')
+    globals()[_class_name] = type(_class_name, (BackendContract, unittest.TestCase), {'BACKEND': _name})
+
+if __name__ == '__main__':
+    unittest.main()
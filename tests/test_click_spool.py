@@ -0,0 +1,184 @@
+import unittest
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models.url_mapping import URLMapping
+from config.mock_database import MockURLMapping
+from utils.mapping_cache import mapping_cache
+from utils.click_spool import ClickSpool, click_spool, read_segment, MARKER_RETENTION_SECONDS
+
+
+class FlakyBackend:
+    """Idempotent click store that can be told to fail"""
+
+    def __init__(self):
+        self.counts = {}
+        self.applied = {}
+        self.fail_after = None
+        self.calls = 0
+
+    def apply(self, spool_id, clicks):
+        self.calls += 1
+        if self.fail_after is not None and self.calls > self.fail_after:
+            return False
+        for code, (count, seq, _) in clicks.items():
+            if self.applied.get((spool_id, code), 0) >= seq:
+                continue
+            self.applied[(spool_id, code)] = seq
+            self.counts[code] = self.counts.get(code, 0) + count
+        return True
+
+
+class TestClickSpool(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.directory = self._directory.name
+        self.backend = FlakyBackend()
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def spool(self, **options):
+        spool = ClickSpool(self.directory, self.backend.apply, **options)
+        self.addCleanup(spool.close)
+        return spool
+
+    def test_group_commit(self):
+        """Test that concurrent clicks are all durable and share fsyncs"""
+        spool = self.spool()
+        threads = [threading.Thread(target=lambda: [spool.record('abc') for _ in range(50)]) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(spool.stats()['spooled'], 400)
+        self.assertLessEqual(spool.stats()['fsyncs'], 400)
+
+        self.assertEqual(spool.replay(), 400)
+        self.assertEqual(self.backend.counts, {'abc': 400})
+        self.assertEqual(spool.stats()['pending_bytes'], 0)
+
+    def test_interrupted_replay_does_not_double_count(self):
+        """Test that batches applied before a failure are skipped when the replay runs again"""
+        spool = self.spool(replay_batch=10)
+        for i in range(35):
+            spool.record(f'code{i % 3}')
+        self.backend.fail_after = 2
+        self.assertEqual(spool.replay(), 20)
+        self.backend.fail_after = None
+        self.backend.calls = 0
+
+        # The whole segment is replayed again; the first two batches are skipped
+        spool.replay()
+        self.assertEqual(sum(self.backend.counts.values()), 35)
+        self.assertEqual(self.backend.counts['code0'], 12)
+
+    def test_restart_recovers_spooled_clicks(self):
+        """Test that a new process takes over the slot, its spool ID and a torn segment"""
+        spool = ClickSpool(self.directory, self.backend.apply)
+        spool_id = spool.spool_id
+        for _ in range(5):
+            spool.record('abc')
+        spool.close()
+        segment = os.path.join(self.directory, 'slot-0', 'clicks-000000000001.log')
+        with open(segment, 'ab') as f:
+            f.write(b'123 abc 1')  # torn write from the crash
+
+        restarted = self.spool()
+        self.assertEqual(restarted.spool_id, spool_id)
+        restarted.record('abc')
+        self.assertEqual(restarted.replay(), 6)
+        self.assertEqual(self.backend.counts, {'abc': 6})
+
+    def test_workers_get_separate_slots(self):
+        """Test that two spools on one directory never share a slot"""
+        first = self.spool()
+        second = self.spool()
+        self.assertNotEqual(first.directory, second.directory)
+        self.assertNotEqual(first.spool_id, second.spool_id)
+
+    def test_rotation_and_compaction(self):
+        """Test that a backlog built up during an outage is merged and replays exactly once"""
+        spool = self.spool(segment_bytes=200, compact_segments=3)
+        self.backend.fail_after = 0
+        for i in range(60):
+            spool.record(f'code{i % 4}')
+        spool.replay()
+        # The oldest segment, the merged backlog and the new active segment
+        segments = sorted(name for name in os.listdir(spool.directory) if name.endswith('.log'))
+        self.assertEqual(len(segments), 3)
+        replaces, records, _ = read_segment(os.path.join(spool.directory, segments[1]))
+        self.assertTrue(replaces)
+        self.assertEqual(len(records), 4)
+
+        self.backend.fail_after = None
+        spool.replay()
+        self.assertEqual(self.backend.counts, {f'code{i}': 15 for i in range(4)})
+
+    def test_variants(self):
+        """Test that per-destination clicks survive the spool and compaction"""
+        spool = self.spool(segment_bytes=100, compact_segments=2)
+        seen = []
+        self.backend.fail_after = 0
+        for variant in [0, 1, 1, None, 1, 0]:
+            spool.record('split', variant)
+        spool.replay()
+        self.backend.apply = lambda spool_id, clicks: seen.append(clicks) or True
+        spool.apply_func = self.backend.apply
+        spool.replay()
+        variants = {}
+        for clicks in seen:
+            for variant, count in clicks['split'][2].items():
+                variants[variant] = variants.get(variant, 0) + count
+        self.assertEqual(variants, {'0': 2, '1': 3})
+        self.assertEqual(sum(clicks['split'][0] for clicks in seen), 6)
+
+class TestSpooledRedirects(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment with a spool in a temporary directory"""
+        # Force mock database for testing
+        os.environ['USE_MOCK_DATABASE'] = 'true'
+
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+        self._directory = tempfile.TemporaryDirectory()
+        click_spool.open(self._directory.name)
+
+    def tearDown(self):
+        click_spool.open(None)
+        self._directory.cleanup()
+
+    def test_clicks_counted_after_replay(self):
+        """Test that redirects spool clicks and the replay applies them once"""
+        URLMapping.create_mapping('https://example.com/spooled', 'spooled')
+        mapping_cache.invalidate('spooled')
+        for _ in range(3):
+            self.assertEqual(self.client.get('/spooled').status_code, 302)
+        self.assertEqual(URLMapping.get_url_stats('spooled')['click_count'], 0)
+
+        self.assertEqual(click_spool.replay(), 3)
+        self.assertEqual(URLMapping.get_url_stats('spooled')['click_count'], 3)
+        self.assertTrue(URLMapping.apply_clicks(click_spool.spool_id, {'spooled': (3, 1, {})}))
+        self.assertEqual(URLMapping.get_url_stats('spooled')['click_count'], 3)
+
+    def test_old_replay_markers_pruned(self):
+        """Test that markers of spools idle past the retention window don't pile up on a mapping"""
+        URLMapping.create_mapping('https://example.com/markers', 'markers')
+        now = time.time_ns()
+        stale = now - int(MARKER_RETENTION_SECONDS * 1e9) - 1
+        for spool_id in ('sold1', 'sold2'):
+            self.assertTrue(URLMapping.apply_clicks(spool_id, {'markers': (1, stale, {})}))
+        self.assertTrue(URLMapping.apply_clicks('srecent', {'markers': (1, now, {})}))
+        self.assertEqual(MockURLMapping._storage['markers']['click_spools'], {'srecent': now})
+        self.assertEqual(URLMapping.get_url_stats('markers')['click_count'], 3)
+
+if __name__ == '__main__':
+    unittest.main()
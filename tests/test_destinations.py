@@ -0,0 +1,101 @@
+import unittest
+import json
+import os
+import random
+import sys
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models.url_mapping import URLMapping
+from utils.mapping_cache import mapping_cache
+from utils.url_encoder import URLEncoder
+from utils.destinations import build_alias_table, choose_variant, parse_destinations
+
+
+def implied_weights(alias_table):
+    """Probability of each index implied by an alias table"""
+    prob, alias = alias_table
+    weights = [0.0] * len(prob)
+    for column, p in enumerate(prob):
+        weights[column] += p / len(prob)
+        weights[alias[column]] += (1 - p) / len(prob)
+    return weights
+
+
+class TestAliasTable(unittest.TestCase):
+    def test_table_matches_weights(self):
+        """Test that the alias table reproduces the normalized weights exactly"""
+        for weights in ([70, 30], [1, 1, 1], [5, 0.5, 2, 10, 1], list(range(1, 101))):
+            total = sum(weights)
+            for implied, weight in zip(implied_weights(build_alias_table(weights)), weights):
+                self.assertAlmostEqual(implied, weight / total)
+
+    def test_sampling(self):
+        """Test a 70/30 split over many draws and the single-draw column/coin split"""
+        table = build_alias_table([70, 30])
+        rng = random.Random(42)
+        picks = [choose_variant(table, rng.random) for _ in range(20000)]
+        self.assertAlmostEqual(picks.count(0) / len(picks), 0.7, delta=0.02)
+
+        # Column 1 (weight 0.6 of a column) falls back to its alias above that
+        self.assertEqual(choose_variant(table, lambda: 0.75), 1)
+        self.assertEqual(choose_variant(table, lambda: 0.9), 0)
+
+    def test_parse_destinations(self):
+        """Test validation of the request's destination list"""
+        parsed = parse_destinations({'destinations': [{'url': 'https://a.example.com', 'weight': 70},
+                                                      {'url': 'https://b.example.com'}]},
+                                    URLEncoder.validate_url)
+        self.assertEqual(parsed[1], {'url': 'https://b.example.com', 'weight': 1})
+        self.assertIsNone(parse_destinations({}, URLEncoder.validate_url))
+
+        for bad in ([{'url': 'https://a.example.com'}],
+                    [{'url': 'https://a.example.com'}, {'url': 'not a url'}],
+                    [{'url': 'https://a.example.com', 'weight': 0}, {'url': 'https://b.example.com'}],
+                    [{'url': 'https://a.example.com', 'weight': True}, {'url': 'https://b.example.com'}],
+                    'https://a.example.com'):
+            with self.assertRaises(ValueError):
+                parse_destinations({'destinations': bad}, URLEncoder.validate_url)
+
+class TestWeightedLinks(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        # Force mock database for testing
+        os.environ['USE_MOCK_DATABASE'] = 'true'
+
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+
+    def test_split_link(self):
+        """Test creating a split link, redirects to both variants and per-variant clicks"""
+        response = self.client.post('/api/shorten', json={
+            'custom_alias': 'splitab',
+            'immutable': True,
+            'destinations': [{'url': 'https://a.example.com', 'weight': 70},
+                             {'url': 'https://b.example.com', 'weight': 30}]
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['original_url'], 'https://a.example.com')
+        mapping_cache.invalidate('splitab')
+
+        with patch('utils.destinations.random') as rng:
+            rng.random.side_effect = [0.1, 0.75, 0.9]
+            locations = [self.client.get('/splitab').headers['Location'] for _ in range(3)]
+        self.assertEqual(locations, ['https://a.example.com', 'https://b.example.com', 'https://a.example.com'])
+
+        response = self.client.get('/splitab')
+        self.assertEqual(response.status_code, 302)  # never a shared permanent redirect
+        self.assertTrue(response.headers['Cache-Control'].startswith('private'))
+
+        stats = URLMapping.get_url_stats('splitab')
+        self.assertEqual(stats['click_count'], 4)
+        b_clicks = 1 + (response.headers['Location'] == 'https://b.example.com')
+        self.assertEqual([d['click_count'] for d in stats['destinations']], [4 - b_clicks, b_clicks])
+        self.assertEqual(stats['destinations'][0]['weight'], 70)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+import unittest
+import json
+import os
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models.url_mapping import URLMapping
+from utils.rate_limiter import rate_limiter
+from utils.shared_cache import InMemorySharedCache
+from utils.idempotency import IdempotencyStore, IdempotencyConflict, IdempotencyInProgress, idempotency_store
+
+
+class TestIdempotencyStore(unittest.TestCase):
+    def test_runs_once_and_replays(self):
+        """Test that a key runs once, later calls replay, and errors aren't stored"""
+        store = IdempotencyStore(shared_cache=lambda: None)
+        calls = []
+        run = lambda status: lambda: calls.append(status) or (status, b'{}', 'application/json')
+
+        self.assertEqual(store.run('k1', 'a', run(200)), ((200, b'{}', 'application/json'), False))
+        self.assertEqual(store.run('k1', 'a', run(200)), ((200, b'{}', 'application/json'), True))
+        with self.assertRaises(IdempotencyConflict):
+            store.run('k1', 'b', run(200))
+
+        store.run('k2', 'a', run(500))
+        store.run('k2', 'a', run(201))  # the 500 wasn't stored, so this runs
+        self.assertEqual(calls, [200, 500, 201])
+
+    def test_eviction(self):
+        """Test that the store is bounded by max_keys and ttl_seconds"""
+        store = IdempotencyStore(max_keys=2, ttl_seconds=60, shared_cache=lambda: None)
+        for key in ('a', 'b', 'c'):
+            store.run(key, 'f', lambda: (200, b'', 'text/plain'))
+        store.run('d', 'f', lambda: (200, b'', 'text/plain'))
+        self.assertEqual(store.stats()['entries'], 2)
+        self.assertFalse(store.run('a', 'f', lambda: (200, b'', 'text/plain'))[1])
+
+        store = IdempotencyStore(ttl_seconds=0.01, shared_cache=lambda: None)
+        store.run('a', 'f', lambda: (200, b'', 'text/plain'))
+        time.sleep(0.02)
+        self.assertFalse(store.run('a', 'f', lambda: (200, b'', 'text/plain'))[1])
+
+    def test_concurrent_duplicates_wait(self):
+        """Test that duplicates arriving while the first request runs wait for its response"""
+        store = IdempotencyStore(shared_cache=lambda: None)
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 200, b'first', 'text/plain'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(store.run('k', 'f', slow)))
+        leader.start()
+        started.wait(5)
+        waiters = [threading.Thread(target=lambda: results.append(store.run('k', 'f', slow))) for _ in range(3)]
+        for thread in waiters:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in [leader] + waiters:
+            thread.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(replayed for _, replayed in results), [False, True, True, True])
+        self.assertTrue(all(record[1] == b'first' for record, _ in results))
+
+    def test_wait_timeout(self):
+        """Test that a duplicate gives up after wait_seconds"""
+        store = IdempotencyStore(wait_seconds=0.05, shared_cache=lambda: None)
+        release = threading.Event()
+        leader = threading.Thread(target=store.run, args=('k', 'f', lambda: release.wait(5) and (200, b'', 'text/plain')))
+        leader.start()
+        time.sleep(0.02)
+        with self.assertRaises(IdempotencyInProgress):
+            store.run('k', 'f', lambda: (200, b'', 'text/plain'))
+        release.set()
+        leader.join(5)
+
+    def test_shared_tier_across_instances(self):
+        """Test that two instances sharing a cache run a key once"""
+        shared = InMemorySharedCache()
+        first, second = IdempotencyStore(shared_cache=lambda: shared), IdempotencyStore(shared_cache=lambda: shared)
+        calls = []
+        run = lambda: calls.append(1) or (200, b'{"short_code": "abc"}', 'application/json')
+
+        self.assertFalse(first.run('k', 'f', run)[1])
+        record, replayed = second.run('k', 'f', run)
+        self.assertTrue(replayed)
+        self.assertEqual(record, (200, b'{"short_code": "abc"}', 'application/json'))
+        self.assertEqual(len(calls), 1)
+        # The other instance knows the key only through the shared tier
+        second.run('k2', 'f', run)
+        with self.assertRaises(IdempotencyConflict):
+            first.run('k2', 'g', run)
+
+    def test_shared_tier_pending_claim(self):
+        """Test that an instance waits for a claim another instance holds in the shared tier"""
+        shared = InMemorySharedCache()
+        first, second = IdempotencyStore(shared_cache=lambda: shared), IdempotencyStore(shared_cache=lambda: shared)
+        started, release = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return 201, b'done', 'text/plain'
+
+        leader = threading.Thread(target=first.run, args=('k', 'f', slow))
+        leader.start()
+        started.wait(5)
+        threading.Timer(0.1, release.set).start()
+        self.assertEqual(second.run('k', 'f', lambda: (500, b'', 'text/plain')), ((201, b'done', 'text/plain'), True))
+        leader.join(5)
+
+
+class TestIdempotentShorten(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        # Force mock database for testing
+        os.environ['USE_MOCK_DATABASE'] = 'true'
+
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+        idempotency_store.reset()
+        rate_limiter.reset()
+
+    def shorten(self, key, body=None, client=None):
+        return (client or self.client).post('/api/shorten', json=body or {'url': 'https://example.com/retry'},
+                                            headers={'Idempotency-Key': key})
+
+    def test_retry_returns_original_response(self):
+        """Test that a retry gets the same short code without touching the backend"""
+        with patch.object(URLMapping, 'create_mapping', wraps=URLMapping.create_mapping) as create, \
+                patch.object(URLMapping, 'validate_short_code_exists',
+                             wraps=URLMapping.validate_short_code_exists) as exists:
+            first = self.shorten('retry-1')
+            reads = exists.call_count
+            second = self.shorten('retry-1')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(json.loads(second.data)['short_code'], json.loads(first.data)['short_code'])
+        self.assertEqual(second.headers['Idempotent-Replayed'], 'true')
+        self.assertNotIn('Idempotent-Replayed', first.headers)
+        self.assertEqual(create.call_count, 1)
+        self.assertEqual(exists.call_count, reads)
+
+        # A new key is a new request
+        self.assertNotEqual(json.loads(self.shorten('retry-2').data)['short_code'], json.loads(first.data)['short_code'])
+
+    def test_key_scoped_to_client_and_body(self):
+        """Test that keys are per client and can't be reused for another body"""
+        first = self.shorten('shared-key')
+        other_client = self.app.test_client()
+        other_client.environ_base['REMOTE_ADDR'] = '203.0.113.9'
+        other = self.shorten('shared-key', client=other_client)
+        self.assertNotEqual(json.loads(other.data)['short_code'], json.loads(first.data)['short_code'])
+
+        reused = self.shorten('shared-key', {'url': 'https://example.com/different'})
+        self.assertEqual(reused.status_code, 422)
+
+    def test_failures_are_not_replayed(self):
+        """Test that a server error is retried for real and invalid keys are rejected"""
+        with patch.object(URLMapping, 'create_mapping', return_value=None):
+            self.assertEqual(self.shorten('flaky').status_code, 500)
+        self.assertEqual(self.shorten('flaky').status_code, 200)
+
+        self.assertEqual(self.shorten('x' * 256).status_code, 400)
+
+    def test_concurrent_retries_create_one_link(self):
+        """Test that duplicates sent at once wait for the first and share its link"""
+        original = URLMapping.create_mapping
+
+        def slow_create(*args, **kwargs):
+            time.sleep(0.1)
+            return original(*args, **kwargs)
+
+        codes = []
+        with patch.object(URLMapping, 'create_mapping', side_effect=slow_create) as create:
+            threads = [threading.Thread(target=lambda: codes.append(
+                json.loads(self.shorten('burst', client=self.app.test_client()).data)['short_code']))
+                for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(5)
+        self.assertEqual(create.call_count, 1)
+        self.assertEqual(len(codes), 4)
+        self.assertEqual(len(set(codes)), 1)
+
+if __name__ == '__main__':
+    unittest.main()
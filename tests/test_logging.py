@@ -0,0 +1,71 @@
+import unittest
+import io
+import json
+import logging
+import os
+import sys
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.logging_setup import LoggingSetup, RouteSampler, parse_sample_rates
+
+class TestStructuredLogging(unittest.TestCase):
+    def setUp(self):
+        """Route logging through a private setup writing to a buffer"""
+        self.stream = io.StringIO()
+        self.setup = LoggingSetup()
+        self.previous_level = logging.getLogger().level
+
+    def tearDown(self):
+        self.setup.stop()
+        logging.getLogger().setLevel(self.previous_level)
+
+    def _records(self):
+        self.setup.stop()  # flushes the queue
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_json_records_with_extra_fields(self):
+        """Test that records are written as JSON with extra fields at the top level"""
+        self.setup.configure(stream=self.stream)
+        logging.getLogger("test").info("Redirecting %s to %s", "abc", "https://example.com",
+                                       extra={"short_code": "abc"})
+        records = self._records()
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["message"], "Redirecting abc to https://example.com")
+        self.assertEqual(records[0]["short_code"], "abc")
+        self.assertEqual(records[0]["level"], "INFO")
+
+    def test_sampling_never_drops_errors(self):
+        """Test that sampled routes drop success records but keep errors"""
+        self.setup.configure(stream=self.stream, sample_rates={"redirect": 0.0})
+        logger = logging.getLogger("test")
+        for _ in range(5):
+            logger.info("ok", extra={"route": "redirect"})
+        logger.error("failed", extra={"route": "redirect"})
+        logger.info("untagged")
+
+        messages = [record["message"] for record in self._records()]
+        self.assertEqual(messages, ["failed", "untagged"])
+        self.assertEqual(self.setup.sampler.sampled_out, 5)
+
+    def test_sampler_rate(self):
+        """Test that a route keeps roughly its configured fraction"""
+        values = iter([0.005, 0.5, 0.009, 0.9])
+        sampler = RouteSampler({"redirect": 0.01}, rng=lambda: next(values))
+        record = logging.makeLogRecord({"levelno": logging.INFO, "route": "redirect"})
+        self.assertEqual([sampler.filter(record) for _ in range(4)], [True, False, True, False])
+
+    def test_parse_sample_rates(self):
+        """Test the LOG_SAMPLE_RATES format"""
+        self.assertEqual(parse_sample_rates("redirect=0.01, shorten=1"), {"redirect": 0.01, "shorten": 1.0})
+        self.assertEqual(parse_sample_rates(""), {})
+
+    def test_malformed_sample_rates_ignored(self):
+        """Test that bad LOG_SAMPLE_RATES entries are skipped instead of failing startup"""
+        with self.assertLogs(level='WARNING'):
+            rates = parse_sample_rates("redirect=2, shorten=lots, =0.5, junk, redirect_miss=0.5")
+        self.assertEqual(rates, {"redirect": 0.01, "redirect_miss": 0.5})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,302 @@
+import unittest
+import json
+import os
+import sys
+import threading
+import asyncio
+import time
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models.url_mapping import URLMapping
+from utils.mapping_cache import MappingCache, mapping_cache
+from utils.invalidation import UDPInvalidationBus
+from utils.shared_cache import InMemorySharedCache, set_shared_cache, get_shared_cache
+from config.mock_database import MockURLMapping
+from utils.single_flight import SingleFlight, AsyncSingleFlight
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError, backend_breaker
+from unittest.mock import patch
+
+class TestMappingCache(unittest.TestCase):
+    def test_reordered_invalidation_cannot_resurrect(self):
+        """Test that versions order invalidations and late reads"""
+        cache = MappingCache(ttl_seconds=60)
+        cache.put("abc", {"exists": True, "original_url": "https://v1.example.com"}, version=1)
+
+        cache.invalidate("abc", version=3)
+        cache.invalidate("abc", version=2)  # delivered out of order
+        self.assertIsNone(cache.get("abc"))
+
+        # A read that started before the change finishes late
+        self.assertFalse(cache.put("abc", {"exists": True, "original_url": "https://v2.example.com"}, version=2))
+        self.assertTrue(cache.put("abc", {"exists": False}, version=3))
+
+    def test_lru_bound(self):
+        """Test that the cache never exceeds its size"""
+        cache = MappingCache(max_entries=3)
+        for i in range(10):
+            cache.put(f"code{i}", {"exists": True}, version=1)
+        self.assertEqual(cache.stats()["entries"], 3)
+        self.assertIsNotNone(cache.get("code9"))
+        self.assertIsNone(cache.get("code0"))
+
+    def test_stale_window(self):
+        """Test that expired entries are served as stale until the stale window ends"""
+        cache = MappingCache(ttl_seconds=10, stale_seconds=100)
+        cache.put("abc", {"exists": True}, version=1, now=0)
+        self.assertEqual(cache.lookup("abc", now=5), ({"exists": True}, True))
+        self.assertEqual(cache.lookup("abc", now=50), ({"exists": True}, False))
+        self.assertIsNone(cache.get("abc", now=50))
+        self.assertIsNone(cache.get_stale("abc", now=200))
+
+    def test_udp_bus_between_instances(self):
+        """Test that an invalidation published on one bus evicts another instance's cache"""
+        receiver = UDPInvalidationBus()
+        sender = UDPInvalidationBus(peers=[receiver.address])
+        remote_cache = MappingCache()
+        remote_cache.put("abc", {"exists": True}, version=1)
+
+        delivered = threading.Event()
+        receiver.subscribe(remote_cache.invalidate)
+        receiver.subscribe(lambda short_code, version: delivered.set())
+        receiver.start()
+        try:
+            sender.publish("abc", 2)
+            self.assertTrue(delivered.wait(2))
+            self.assertIsNone(remote_cache.get("abc"))
+        finally:
+            sender.close()
+            receiver.close()
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_calls_coalesce(self):
+        """Test that concurrent callers share one backend call"""
+        flight = SingleFlight()
+        backend_calls = []
+        release = threading.Event()
+
+        def slow_lookup(code):
+            backend_calls.append(code)
+            release.wait(2)
+            return {"exists": True, "code": code}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do("viral", slow_lookup, "viral")))
+                   for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        while flight.coalesced < 19:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(backend_calls), 1)
+        self.assertEqual(len(results), 20)
+        self.assertEqual(flight.stats(), {"executed": 1, "coalesced": 19, "in_flight": 0})
+
+    def test_errors_propagate_to_waiters(self):
+        """Test that every waiter sees the leader's exception"""
+        flight = SingleFlight()
+        with self.assertRaises(RuntimeError):
+            flight.do("code", lambda: (_ for _ in ()).throw(RuntimeError("backend down")))
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_async_coalescing(self):
+        """Test the asyncio implementation"""
+        flight = AsyncSingleFlight()
+        backend_calls = []
+
+        async def lookup(code):
+            backend_calls.append(code)
+            await asyncio.sleep(0.01)
+            return code.upper()
+
+        async def run():
+            return await asyncio.gather(*[flight.do("abc", lookup, "abc") for _ in range(10)])
+
+        self.assertEqual(asyncio.run(run()), ["ABC"] * 10)
+        self.assertEqual(len(backend_calls), 1)
+        self.assertEqual(flight.coalesced, 9)
+
+class TestCachedLookups(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        # Force mock database for testing
+        os.environ['USE_MOCK_DATABASE'] = 'true'
+
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+        mapping_cache.clear()
+
+    def test_deactivate_evicts_cached_mapping(self):
+        """Test that deactivation takes effect despite a warm cache"""
+        response = self.client.post('/api/shorten',
+                                  data=json.dumps({'url': 'https://example.com'}),
+                                  content_type='application/json')
+        short_code = json.loads(response.data)['short_code']
+
+        response = self.client.get(f'/{short_code}', follow_redirects=False)
+        self.assertEqual(response.status_code, 302)
+        self.assertIsNotNone(mapping_cache.get(short_code))
+
+        self.assertTrue(URLMapping.deactivate_mapping(short_code))
+        response = self.client.get(f'/{short_code}', follow_redirects=False)
+        self.assertEqual(response.status_code, 404)
+
+    def test_create_evicts_negative_entry(self):
+        """Test that a cached "not found" is dropped when the code is created"""
+        response = self.client.get('/fresh-alias', follow_redirects=False)
+        self.assertEqual(response.status_code, 404)
+
+        self.client.post('/api/shorten',
+                       data=json.dumps({'url': 'https://example.com', 'custom_alias': 'fresh-alias'}),
+                       content_type='application/json')
+        response = self.client.get('/fresh-alias', follow_redirects=False)
+        self.assertEqual(response.status_code, 302)
+
+class TestBackendFailures(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        os.environ['USE_MOCK_DATABASE'] = 'true'
+
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+        mapping_cache.clear()
+        backend_breaker.reset()
+
+    def tearDown(self):
+        backend_breaker.reset()
+
+    def test_breaker_opens_and_half_opens(self):
+        """Test that the breaker fails fast and lets one trial call through after the cool-down"""
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05)
+
+        def failing():
+            raise RuntimeError("backend down")
+
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                breaker.call(failing)
+        self.assertEqual(breaker.stats()["state"], "open")
+        with self.assertRaises(CircuitOpenError):
+            breaker.call(lambda: "ok")
+
+        time.sleep(0.06)
+        self.assertEqual(breaker.call(lambda: "ok"), "ok")
+        self.assertEqual(breaker.stats()["state"], "closed")
+
+    def test_stale_entry_served_when_backend_fails(self):
+        """Test that a known link keeps redirecting after its cache entry goes stale"""
+        response = self.client.post('/api/shorten',
+                                  data=json.dumps({'url': 'https://example.com'}),
+                                  content_type='application/json')
+        short_code = json.loads(response.data)['short_code']
+        URLMapping.get_mapping(short_code)
+
+        with patch.object(URLMapping, '_fetch_mapping', side_effect=RuntimeError("deadline exceeded")):
+            result = URLMapping._load_mapping(short_code)
+        self.assertTrue(result['exists'])
+        self.assertEqual(result['original_url'], 'https://example.com')
+
+    def test_unknown_code_with_backend_down_is_503(self):
+        """Test that a lookup with nothing cached returns 503 rather than 404"""
+        with patch.object(URLMapping, '_fetch_mapping', side_effect=RuntimeError("deadline exceeded")):
+            response = self.client.get('/neverseen1', follow_redirects=False)
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response.headers)
+
+class TestSharedCacheTier(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment with the in-process shared cache"""
+        os.environ['USE_MOCK_DATABASE'] = 'true'
+
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+        self.previous_cache = get_shared_cache()
+        self.shared = InMemorySharedCache()
+        set_shared_cache(self.shared)
+        mapping_cache.clear()
+
+    def tearDown(self):
+        """Restore the configured shared cache"""
+        set_shared_cache(self.previous_cache)
+
+    def _shorten(self, url='https://example.com'):
+        response = self.client.post('/api/shorten',
+                                  data=json.dumps({'url': url}),
+                                  content_type='application/json')
+        return json.loads(response.data)['short_code']
+
+    def test_write_through_and_read_through(self):
+        """Test that a cold instance is served from the shared tier"""
+        short_code = self._shorten()
+        mapping_cache.clear()  # simulate a freshly started instance
+
+        # Remove the backing record; only the shared cache still knows the link
+        stored = MockURLMapping._storage.pop(short_code)
+        try:
+            result = URLMapping.get_mapping(short_code)
+            self.assertTrue(result['exists'])
+            self.assertEqual(result['original_url'], 'https://example.com')
+        finally:
+            MockURLMapping._storage[short_code] = stored
+
+    def test_deactivate_evicts_shared_entry(self):
+        """Test that deactivation removes the shared entry"""
+        short_code = self._shorten()
+        self.assertIsNotNone(self.shared.get('m:' + short_code))
+
+        URLMapping.deactivate_mapping(short_code)
+        self.assertIsNone(self.shared.get('m:' + short_code))
+        self.assertFalse(URLMapping.get_mapping(short_code)['exists'])
+
+    def test_stale_read_not_written_through(self):
+        """Test that a lookup racing a deactivation can't put the old mapping back in the shared tier"""
+        short_code = self._shorten()
+        mapping_cache.invalidate(short_code)
+        stale = URLMapping._fetch_mapping(short_code)
+        URLMapping.deactivate_mapping(short_code)
+        self.assertIsNone(self.shared.get('m:' + short_code))
+
+        # The read finishing after the invalidation is refused here and in the shared tier
+        self.assertFalse(URLMapping._cache_locally(short_code, stale))
+        URLMapping._cache_shared(short_code, stale)
+        self.assertIsNone(self.shared.get('m:' + short_code))
+        with patch.object(URLMapping, '_fetch_mapping', return_value=stale):
+            URLMapping._load_mapping(short_code)
+        self.assertIsNone(self.shared.get('m:' + short_code))
+        self.assertFalse(URLMapping.get_mapping(short_code)['exists'])
+
+    def test_batch_stats_single_round_trip(self):
+        """Test that cached batch stats come back in one multi-get"""
+        codes = [self._shorten(f'https://example.com/{i}') for i in range(3)]
+
+        response = self.client.post('/api/stats/batch',
+                                  data=json.dumps({'short_codes': codes + ['missing1']}),
+                                  content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)['data']
+        self.assertEqual(data[codes[0]]['original_url'], 'https://example.com/0')
+        self.assertIsNone(data['missing1'])
+
+        # Creator IPs only go to admins
+        os.environ['ADMIN_API_KEY'] = 'batch-secret'
+        try:
+            for headers in ({}, {'X-Admin-Key': 'batch-secret'}):
+                response = self.client.post('/api/stats/batch', json={'short_codes': codes[:1]}, headers=headers)
+                self.assertEqual('created_by_ip' in json.loads(response.data)['data'][codes[0]], bool(headers))
+        finally:
+            del os.environ['ADMIN_API_KEY']
+
+        round_trips = self.shared.round_trips
+        URLMapping.get_url_stats_many(codes)
+        self.assertEqual(self.shared.round_trips, round_trips + 1)
+
+if __name__ == '__main__':
+    unittest.main()
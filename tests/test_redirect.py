@@ -7,6 +7,12 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import create_app
+from utils.hyperloglog import HyperLogLog
+from utils.unique_visitors import visitor_tracker, VisitorTracker
+from utils.fast_path import FastRedirectMiddleware
+from utils.mapping_cache import mapping_cache
+from models.url_mapping import URLMapping
+from unittest.mock import patch
 
 class TestRedirectAPI(unittest.TestCase):
     def setUp(self):
@@ -45,6 +51,22 @@ class TestRedirectAPI(unittest.TestCase):
         response = self.client.get('/nonexistent', follow_redirects=False)
         self.assertEqual(response.status_code, 404)
     
+    def test_static_pages_precompressed(self):
+        """Test that 404 and index pages are served from precompressed buffers"""
+        import gzip
+        
+        response = self.client.get('/nonexistent', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn(b'<html', gzip.decompress(response.data).lower())
+        
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response.headers)
+        
+        response = self.client.get('/', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+    
     def test_redirect_malformed_short_code(self):
         """Test handling of malformed short codes"""
         # Test with special characters
@@ -99,6 +121,53 @@ class TestRedirectAPI(unittest.TestCase):
         self.assertIn('original_url', stats_data)
         self.assertEqual(stats_data['original_url'], 'https://example.com')
     
+    def test_redirect_cache_headers(self):
+        """Test short-lived 302 for normal links and cacheable 301 for immutable ones"""
+        response = self.client.post('/api/shorten',
+                                  data=json.dumps({'url': 'https://example.com'}),
+                                  content_type='application/json')
+        short_code = json.loads(response.data)['short_code']
+        
+        response = self.client.get(f'/{short_code}', follow_redirects=False)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.headers['Cache-Control'], 'private, max-age=60')
+        
+        response = self.client.post('/api/shorten',
+                                  data=json.dumps({'url': 'https://example.com', 'immutable': True}),
+                                  content_type='application/json')
+        short_code = json.loads(response.data)['short_code']
+        
+        response = self.client.get(f'/{short_code}', follow_redirects=False)
+        self.assertEqual(response.status_code, 301)
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=86400')
+    
+    def test_redirect_survives_analytics_failure(self):
+        """Test that a failing click counter still redirects instead of returning 503"""
+        URLMapping.create_mapping('https://example.com/analytics', 'nocount')
+        with patch.object(visitor_tracker, 'record', side_effect=RuntimeError('sketch store down')):
+            response = self.client.get('/nocount', follow_redirects=False)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.headers['Location'], 'https://example.com/analytics')
+    
+    def test_stats_conditional_request(self):
+        """Test ETag revalidation of the stats endpoint"""
+        response = self.client.post('/api/shorten',
+                                  data=json.dumps({'url': 'https://example.com'}),
+                                  content_type='application/json')
+        short_code = json.loads(response.data)['short_code']
+        
+        response = self.client.get(f'/api/stats/{short_code}')
+        etag = response.headers['ETag']
+        self.assertIn('Last-Modified', response.headers)
+        
+        response = self.client.get(f'/api/stats/{short_code}', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        
+        # A click changes the stats, so the old ETag no longer matches
+        self.client.get(f'/{short_code}', follow_redirects=False)
+        response = self.client.get(f'/api/stats/{short_code}', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+    
     def test_stats_nonexistent_code(self):
         """Test stats endpoint for non-existent codes"""
         response = self.client.get('/api/stats/nonexistent')
@@ -130,5 +199,136 @@ class TestRedirectAPI(unittest.TestCase):
         self.assertEqual(stats_data['click_count'], 1)
         self.assertEqual(stats_data['original_url'], original_url)
 
+class TestUniqueVisitors(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        # Force mock database for testing
+        os.environ['USE_MOCK_DATABASE'] = 'true'
+        
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+        visitor_tracker.reset()
+    
+    def test_hyperloglog_accuracy_and_encoding(self):
+        """Test estimate accuracy and sparse/dense round trips"""
+        small = HyperLogLog()
+        for i in range(50):
+            small.add_hash(visitor_tracker.visitor_hash(f"10.0.0.{i}", "ua"))
+        self.assertTrue(small.is_sparse)
+        self.assertEqual(HyperLogLog.from_bytes(small.to_bytes()).estimate(), small.estimate())
+        self.assertAlmostEqual(small.estimate(), 50, delta=3)
+        
+        large = HyperLogLog()
+        for i in range(20000):
+            large.add_hash(visitor_tracker.visitor_hash(f"ip{i}", "ua"))
+        self.assertFalse(large.is_sparse)
+        self.assertLessEqual(len(large.to_bytes()), 4096 + 2)
+        self.assertAlmostEqual(large.estimate(), 20000, delta=20000 * 0.05)
+    
+    def test_unique_visitors_in_stats(self):
+        """Test that repeat visits count once and flushed sketches persist"""
+        response = self.client.post('/api/shorten',
+                                  data=json.dumps({'url': 'https://example.com'}),
+                                  content_type='application/json')
+        short_code = json.loads(response.data)['short_code']
+        
+        for user_agent in ['browser-a', 'browser-a', 'browser-b']:
+            self.client.get(f'/{short_code}', headers={'User-Agent': user_agent})
+        
+        response = self.client.get(f'/api/stats/{short_code}')
+        self.assertEqual(json.loads(response.data)['data']['unique_visitors'], 2)
+        
+        # After a flush the count comes from the stored sketch
+        visitor_tracker.flush()
+        response = self.client.get(f'/api/stats/{short_code}')
+        data = json.loads(response.data)['data']
+        self.assertEqual(data['unique_visitors'], 2)
+        self.assertNotIn('visitor_hll', data)
+    
+    def test_flush_drops_deleted_links(self):
+        """Test that sketches for missing links are dropped while failed ones are retried"""
+        results = {'gone': None, 'flaky': False}
+        tracker = VisitorTracker(flush_func=lambda code, sketch: results[code])
+        tracker.record('gone', '10.0.0.1', 'ua')
+        tracker.record('flaky', '10.0.0.1', 'ua')
+        self.assertEqual(tracker.flush(), 0)
+        self.assertEqual(tracker.dropped, 1)
+        self.assertEqual(tracker.estimate('gone'), 0)
+        self.assertEqual(tracker.estimate('flaky'), 1)
+
+class TestFastPath(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        # Force mock database for testing
+        os.environ['USE_MOCK_DATABASE'] = 'true'
+        
+        with patch.dict(os.environ, {'FAST_PATH_ENABLED': 'true'}):
+            self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+        self.fast_path = self.app.wsgi_app
+        self.assertIsInstance(self.fast_path, FastRedirectMiddleware)
+    
+    def test_cached_redirect_skips_flask(self):
+        """Test that cache hits are answered by the middleware with the same redirect and side effects"""
+        URLMapping.create_mapping('https://example.com/fast', 'fastpath1')
+        mapping_cache.invalidate('fastpath1')
+        
+        slow = self.client.get('/fastpath1')  # miss: Flask loads and caches the mapping
+        hits = self.fast_path.hits
+        fast = self.client.get('/fastpath1', headers={'User-Agent': 'fast-client'})
+        self.assertEqual(self.fast_path.hits, hits + 1)
+        
+        for response in (slow, fast):
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(response.headers['Location'], 'https://example.com/fast')
+        self.assertEqual(fast.headers['Cache-Control'], slow.headers['Cache-Control'])
+        self.assertEqual(URLMapping.get_url_stats('fastpath1')['click_count'], 2)
+    
+    def test_weighted_link(self):
+        """Test that the middleware picks weighted destinations and counts each variant"""
+        URLMapping.create_mapping('https://a.example.com', 'fastsplit', destinations=[
+            {'url': 'https://a.example.com', 'weight': 1}, {'url': 'https://b.example.com', 'weight': 1}])
+        mapping_cache.invalidate('fastsplit')
+        self.client.get('/fastsplit')
+        
+        hits = self.fast_path.hits
+        with patch('utils.destinations.random') as rng:
+            rng.random.side_effect = [0.1, 0.9]
+            locations = [self.client.get('/fastsplit').headers['Location'] for _ in range(2)]
+        self.assertEqual(self.fast_path.hits, hits + 2)
+        self.assertEqual(locations, ['https://a.example.com', 'https://b.example.com'])
+        stats = URLMapping.get_url_stats('fastsplit')
+        self.assertEqual(sum(d['click_count'] for d in stats['destinations']), 3)
+        self.assertGreaterEqual(stats['destinations'][1]['click_count'], 1)
+    
+    def test_routed_link(self):
+        """Test that the middleware evaluates routing rules against the request headers"""
+        URLMapping.create_mapping('https://example.com', 'fastrule', rules=[
+            {'url': 'https://example.de', 'country': ['DE']}])
+        mapping_cache.invalidate('fastrule')
+        self.client.get('/fastrule')
+        
+        hits = self.fast_path.hits
+        german = self.client.get('/fastrule', headers={'CF-IPCountry': 'DE'})
+        other = self.client.get('/fastrule', headers={'CF-IPCountry': 'FR'})
+        self.assertEqual(self.fast_path.hits, hits + 2)
+        self.assertEqual(german.headers['Location'], 'https://example.de')
+        self.assertEqual(other.headers['Location'], 'https://example.com')
+        self.assertEqual(URLMapping.get_url_stats('fastrule')['rules'][0]['click_count'], 1)
+    
+    def test_falls_through(self):
+        """Test that other routes, misses and deactivated links still go through Flask"""
+        self.assertEqual(self.client.get('/health').status_code, 200)
+        self.assertEqual(self.client.get('/nosuchfastcode').status_code, 404)
+        
+        URLMapping.create_mapping('https://example.com', 'fastpath2')
+        self.client.get('/fastpath2')
+        URLMapping.deactivate_mapping('fastpath2')
+        hits = self.fast_path.hits
+        self.assertEqual(self.client.get('/fastpath2').status_code, 404)
+        self.assertEqual(self.fast_path.hits, hits)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,148 @@
+import unittest
+import json
+import os
+import sys
+from datetime import datetime
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from utils.mapping_cache import mapping_cache
+from utils.url_encoder import URLEncoder
+from utils.routing import classify_user_agent, compile_rules, evaluate, parse_rules
+
+IPHONE = 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148'
+IPAD = 'Mozilla/5.0 (iPad; CPU OS 17_0 like Mac OS X) AppleWebKit/605.1.15'
+ANDROID_TABLET = 'Mozilla/5.0 (Linux; Android 14; SM-X700) AppleWebKit/537.36 Chrome/120.0 Safari/537.36'
+WINDOWS = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36'
+
+
+def parse(rules):
+    return parse_rules({'rules': rules}, URLEncoder.validate_url)
+
+
+def headers(**values):
+    """get_header callable over a dict of header values"""
+    named = {name.replace('_', '-').lower(): value for name, value in values.items()}
+    return lambda name: named.get(name.lower())
+
+
+class TestRuleEngine(unittest.TestCase):
+    def test_user_agent_classification(self):
+        """Test the precompiled device and OS matchers"""
+        self.assertEqual(classify_user_agent(IPHONE), ('mobile', 'ios'))
+        self.assertEqual(classify_user_agent(IPAD), ('tablet', 'ios'))
+        self.assertEqual(classify_user_agent(ANDROID_TABLET), ('tablet', 'android'))
+        self.assertEqual(classify_user_agent(WINDOWS), ('desktop', 'windows'))
+        self.assertEqual(classify_user_agent('Googlebot/2.1'), ('bot', 'other'))
+        self.assertEqual(classify_user_agent(None), ('desktop', 'other'))
+
+    def test_first_matching_rule_wins(self):
+        """Test that rules combine their conditions and earlier rules take precedence"""
+        table = compile_rules(parse([
+            {'url': 'https://de-mobile.example.com', 'country': ['de', 'AT'], 'device': 'mobile'},
+            {'url': 'https://de.example.com', 'country': 'DE'},
+            {'url': 'https://ios.example.com', 'os': 'ios'},
+            {'url': 'https://fr.example.com', 'language': 'fr'},
+        ]))
+        self.assertEqual(evaluate(table, headers(X_AppEngine_Country='DE', User_Agent=IPHONE)), 0)
+        self.assertEqual(evaluate(table, headers(CF_IPCountry='at', User_Agent=IPHONE)), 0)
+        self.assertEqual(evaluate(table, headers(X_AppEngine_Country='DE', User_Agent=WINDOWS)), 1)
+        self.assertEqual(evaluate(table, headers(X_AppEngine_Country='US', User_Agent=IPAD)), 2)
+        self.assertEqual(evaluate(table, headers(Accept_Language='fr-CA,fr;q=0.9,en;q=0.8')), 3)
+        self.assertIsNone(evaluate(table, headers(X_AppEngine_Country='US', User_Agent=WINDOWS)))
+        self.assertIsNone(evaluate(table, headers()))
+
+    def test_time_windows(self):
+        """Test weekday windows, windows wrapping past midnight and past Sunday"""
+        table = compile_rules(parse([
+            {'url': 'https://office.example.com', 'time': {'start': '09:00', 'end': '17:00',
+                                                            'days': ['mon', 'tue', 'wed', 'thu', 'fri']}},
+            {'url': 'https://night.example.com', 'time': {'start': '22:00', 'end': '06:00', 'days': ['sun']}},
+        ]))
+        at = lambda *args: evaluate(table, headers(), datetime(*args))
+        self.assertEqual(at(2024, 1, 1, 9, 0), 0)       # Monday 09:00
+        self.assertIsNone(at(2024, 1, 1, 17, 0))        # end is exclusive
+        self.assertIsNone(at(2024, 1, 6, 12, 0))        # Saturday
+        self.assertEqual(at(2024, 1, 7, 23, 30), 1)     # Sunday night
+        self.assertEqual(at(2024, 1, 8, 5, 59), 1)      # ... wraps into Monday morning
+        self.assertIsNone(at(2024, 1, 8, 6, 0))
+        self.assertIsNone(at(2024, 1, 6, 23, 0))        # Saturday night isn't in the window
+
+    def test_many_rules(self):
+        """Test that hundreds of rules compile and keep first-match semantics"""
+        countries = [f"{chr(65 + i // 26)}{chr(65 + i % 26)}" for i in range(500)]
+        table = compile_rules(parse([{'url': f'https://{c.lower()}.example.com', 'country': c}
+                                     for c in countries]))
+        self.assertEqual(evaluate(table, headers(X_AppEngine_Country=countries[499])), 499)
+        self.assertEqual(evaluate(table, headers(X_AppEngine_Country=countries[0])), 0)
+
+    def test_parse_rules(self):
+        """Test validation and normalization of the request's rules"""
+        parsed = parse([{'url': 'https://a.example.com', 'country': 'de',
+                         'time': {'start': '08:00', 'end': '24:00', 'days': ['fri', 'mon']}}])
+        self.assertEqual(parsed, [{'url': 'https://a.example.com', 'country': ['DE'],
+                                   'time': {'start': '08:00', 'end': '24:00', 'days': ['mon', 'fri']}}])
+        self.assertIsNone(parse_rules({}, URLEncoder.validate_url))
+
+        for bad in ([],
+                    [{'url': 'https://a.example.com'}],
+                    [{'url': 'not a url', 'country': 'DE'}],
+                    [{'url': 'https://a.example.com', 'planet': 'mars'}],
+                    [{'url': 'https://a.example.com', 'device': 'fridge'}],
+                    [{'url': 'https://a.example.com', 'country': []}],
+                    [{'url': 'https://a.example.com', 'time': {'start': '9:00', 'end': '17:00'}}],
+                    [{'url': 'https://a.example.com', 'time': {'start': '09:00', 'end': '09:00'}}],
+                    [{'url': 'https://a.example.com', 'time': {'start': '09:00', 'end': '17:00',
+                                                               'days': ['someday']}}],
+                    {'url': 'https://a.example.com', 'country': 'DE'}):
+            with self.assertRaises(ValueError):
+                parse(bad)
+
+
+class TestRoutedLinks(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        # Force mock database for testing
+        os.environ['USE_MOCK_DATABASE'] = 'true'
+
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+
+    def test_routed_link(self):
+        """Test creating a link with rules, redirects per request headers and per-rule clicks"""
+        response = self.client.post('/api/shorten', json={
+            'url': 'https://example.com/default',
+            'custom_alias': 'routedln',
+            'immutable': True,
+            'rules': [{'url': 'https://example.com/app-store', 'os': 'ios'},
+                      {'url': 'https://example.de', 'country': 'DE'}]
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['rules'][1]['country'], ['DE'])
+        mapping_cache.invalidate('routedln')
+
+        requests = [({'User-Agent': IPHONE, 'X-AppEngine-Country': 'DE'}, 'https://example.com/app-store'),
+                    ({'User-Agent': WINDOWS, 'X-AppEngine-Country': 'DE'}, 'https://example.de'),
+                    ({'User-Agent': WINDOWS}, 'https://example.com/default')]
+        for request_headers, location in requests:
+            response = self.client.get('/routedln', headers=request_headers)
+            self.assertEqual(response.status_code, 302)  # never a shared permanent redirect
+            self.assertEqual(response.headers['Location'], location)
+        self.assertTrue(response.headers['Cache-Control'].startswith('private'))
+
+        response = self.client.get('/api/stats/routedln')
+        data = json.loads(response.data)['data']
+        self.assertEqual(data['click_count'], 3)
+        self.assertEqual([rule['click_count'] for rule in data['rules']], [1, 1])
+
+    def test_invalid_rules_rejected(self):
+        """Test that rule sets that don't validate are a 400"""
+        response = self.client.post('/api/shorten', json={
+            'url': 'https://example.com', 'rules': [{'url': 'https://example.de', 'country': 7}]})
+        self.assertEqual(response.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
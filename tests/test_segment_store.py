@@ -0,0 +1,165 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from config.mock_database import MockURLMapping
+from models.url_mapping import URLMapping
+from utils.mapping_cache import mapping_cache
+from utils.segment_store import SegmentStore, MemoryBackend, DirectoryBackend, segment_store
+
+
+def make_records(count, prefix="c"):
+    return {f"{prefix}{i:04d}": {"original_url": f"https://example.com/{i}", "version": 1,
+                                 "visitor_hll": bytes([i % 256])} for i in range(count)}
+
+
+class TestSegmentStore(unittest.TestCase):
+    def setUp(self):
+        self.backend = MemoryBackend()
+        self.store = SegmentStore(self.backend)
+
+    def test_lookup_through_sparse_index(self):
+        """Test point lookups, one block read per hit and Bloom rejections for misses"""
+        self.store.write_segment(make_records(500))
+        record = self.store.get("c0321")
+        self.assertEqual(record["original_url"], "https://example.com/321")
+        self.assertEqual(record["visitor_hll"], bytes([321 % 256]))
+        self.assertEqual(self.store.stats()["block_reads"], 1)
+        self.assertEqual(self.store.stats()["index_blocks"], 8)
+
+        self.assertIsNone(self.store.get("nothere"))
+        self.assertIsNone(self.store.get("c9999"))
+        self.assertGreaterEqual(self.store.stats()["bloom_rejects"], 1)
+
+    def test_tombstones_hide_older_copies_only(self):
+        """Test that a discarded code can be archived again and that other processes see tombstones"""
+        self.store.write_segment(make_records(10))
+        self.assertTrue(self.store.discard("c0003"))
+        self.assertFalse(self.store.discard("c0003"))
+        self.assertIsNone(self.store.get("c0003"))
+
+        other = SegmentStore(self.backend)
+        self.assertIsNone(other.get("c0003"))
+        self.assertIsNotNone(other.get("c0004"))
+
+        self.store.write_segment({"c0003": {"original_url": "https://example.com/again", "version": 5}})
+        self.assertEqual(self.store.get("c0003")["version"], 5)
+
+    def test_compaction(self):
+        """Test that compaction keeps the newest live copy of every code"""
+        self.store.write_segment(make_records(100))
+        self.store.write_segment({"c0001": {"original_url": "https://example.com/new", "version": 3}})
+        self.store.discard("c0002")
+
+        self.assertEqual(self.store.compact(), {"segments": 2, "records": 99})
+        self.assertEqual(self.store.stats()["segments"], 1)
+        self.assertEqual(self.store.get("c0001")["version"], 3)
+        self.assertIsNone(self.store.get("c0002"))
+        self.assertIsNotNone(self.store.get("c0099"))
+
+    def test_compaction_trims_tombstones(self):
+        """Test that compaction drops tombstones that hide nothing and other processes reload the log"""
+        self.store.write_segment(make_records(50))
+        reader = SegmentStore(self.backend, refresh_seconds=3600)
+        for i in range(40):
+            self.store.discard(f"c{i:04d}")
+        self.store.write_segment({"c0001": {"original_url": "https://example.com/back", "version": 4}})
+        reader.refresh()
+        self.assertEqual(reader.stats()["tombstones"], 40)
+
+        self.assertEqual(self.store.compact(), {"segments": 2, "records": 11})
+        self.assertEqual(self.store.stats()["tombstones"], 0)
+        self.assertLess(len(self.backend.objects["tombstones.log"]), 40)
+
+        # A discard after the rewrite is seen by a process that read the old, longer log
+        self.assertTrue(self.store.discard("c0045"))
+        reader.refresh()
+        self.assertEqual(reader.stats()["tombstones"], 1)
+        self.assertIsNone(reader.get("c0045"))
+        self.assertEqual(reader.get("c0001")["version"], 4)
+        self.assertIsNotNone(reader.get("c0046"))
+
+    def test_directory_backend(self):
+        """Test segments on disk and a reader that refreshes after compaction"""
+        with tempfile.TemporaryDirectory() as directory:
+            store = SegmentStore(DirectoryBackend(directory))
+            reader = SegmentStore(DirectoryBackend(directory), refresh_seconds=3600)
+            store.write_segment(make_records(10))
+            store.write_segment(make_records(10, prefix="d"))
+            reader.refresh()
+            store.compact()
+            self.assertEqual(reader.get("d0005")["original_url"], "https://example.com/5")
+            self.assertFalse(os.path.exists(os.path.join(directory, "tombstones.log")))
+
+class TestTiering(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment with an in-memory cold tier"""
+        # Force mock database for testing
+        os.environ['USE_MOCK_DATABASE'] = 'true'
+
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+        segment_store.open(MemoryBackend(shared=True))
+
+    def tearDown(self):
+        segment_store.open(None)
+
+    def archive(self, *codes):
+        for code in codes:
+            MockURLMapping._storage[code]["updated_at"] = "2000-01-01T00:00:00"
+        return URLMapping.archive_idle((datetime.utcnow() - timedelta(days=30)).isoformat())
+
+    def test_refuses_instance_local_storage(self):
+        """Test that nothing is archived into segments other instances can't read"""
+        URLMapping.create_mapping('https://example.com/local', 'locallnk')
+        segment_store.open(MemoryBackend())
+        with self.assertRaises(RuntimeError):
+            self.archive('locallnk')
+        self.assertIn('locallnk', MockURLMapping._storage)
+
+    def test_archived_link_is_promoted_on_access(self):
+        """Test that an idle link leaves the database and comes back when clicked"""
+        URLMapping.create_mapping('https://example.com/cold', 'coldlnk')
+        URLMapping.create_mapping('https://example.com/hot', 'hotlnk')
+        self.client.get('/coldlnk')  # cache the mapping: archiving must evict it
+
+        self.assertEqual(self.archive('coldlnk'), {"archived": 1, "kept": 0})
+        self.assertNotIn('coldlnk', MockURLMapping._storage)
+        self.assertIn('hotlnk', MockURLMapping._storage)
+        self.assertTrue(URLMapping.validate_short_code_exists('coldlnk'))
+        self.assertEqual(URLMapping.get_url_stats('coldlnk')['click_count'], 1)
+
+        response = self.client.get('/coldlnk')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.location, 'https://example.com/cold')
+        self.assertIn('coldlnk', MockURLMapping._storage)
+        self.assertIsNone(segment_store.get('coldlnk'))
+        self.assertEqual(URLMapping.get_url_stats('coldlnk')['click_count'], 2)
+
+    def test_deleting_archived_link(self):
+        """Test that bulk delete removes archived copies"""
+        URLMapping.create_mapping('https://example.com/gone', 'gonelnk')
+        self.archive('gonelnk')
+        mapping_cache.invalidate('gonelnk')
+
+        self.assertEqual(URLMapping.bulk_delete(['gonelnk', 'neverwas'])["deleted"], 1)
+        self.assertEqual(self.client.get('/gonelnk').status_code, 404)
+        self.assertFalse(URLMapping.validate_short_code_exists('gonelnk'))
+
+    def test_metrics_include_cold_tier(self):
+        """Test that admin metrics report the cold tier"""
+        self.app.debug = True
+        response = self.client.get('/api/admin/metrics')
+        data = json.loads(response.data)
+        self.assertTrue(data['data']['cold_tier']['enabled'])
+
+if __name__ == '__main__':
+    unittest.main()
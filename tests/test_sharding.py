@@ -0,0 +1,169 @@
+import unittest
+import json
+import os
+import sys
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config.database as database
+from config.database import DatabaseConfig, HashRing, parse_shards, index_definitions
+from models.url_mapping import URLMapping
+from utils.mapping_cache import mapping_cache
+from tests.firestore_fake import FakeFirestoreClient
+
+OLD_LAYOUT = [("(default)", "url_mappings")]
+NEW_LAYOUT = [("(default)", "url_mappings_0"), ("(default)", "url_mappings_1"), ("(default)", "url_mappings_2")]
+
+
+def make_config(shards, previous_shards=(), client=None):
+    """DatabaseConfig backed by one in-memory fake client"""
+    client = client or FakeFirestoreClient()
+    config = DatabaseConfig(shards=shards, previous_shards=list(previous_shards),
+                            client_factory=lambda project, database_id: client)
+    config.use_mock = False
+    return config, client
+
+class TestHashRing(unittest.TestCase):
+    def test_parse_shards(self):
+        """Test the FIRESTORE_SHARDS format"""
+        self.assertEqual(parse_shards("a, links-eu/b"), [("(default)", "a"), ("links-eu", "b")])
+        self.assertEqual(parse_shards(""), [])
+
+    def test_index_definitions(self):
+        """Test that every shard collection gets the composite indexes, grouped by database"""
+        files = index_definitions(NEW_LAYOUT + parse_shards("links-eu/url_mappings") + NEW_LAYOUT[:1])
+        self.assertEqual(sorted(files), ["(default)", "links-eu"])
+        self.assertEqual([index["collectionGroup"] for index in files["(default)"]["indexes"]],
+                         [collection for _, collection in NEW_LAYOUT for _ in range(2)])
+        self.assertEqual(len(files["links-eu"]["indexes"]), 2)
+        with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               'firestore.indexes.json')) as f:
+            self.assertEqual(json.load(f), index_definitions(OLD_LAYOUT)["(default)"])
+
+    def test_balanced_and_stable(self):
+        """Test that keys spread evenly and adding a shard moves only about 1/N of them"""
+        keys = [f"code{i}" for i in range(20000)]
+        ring = HashRing(NEW_LAYOUT + [("(default)", "url_mappings_3")])
+        counts = {}
+        for key in keys:
+            shard = ring.shard_for(key)
+            counts[shard] = counts.get(shard, 0) + 1
+        for count in counts.values():
+            self.assertGreater(count, len(keys) * 0.15)
+            self.assertLess(count, len(keys) * 0.35)
+
+        grown = HashRing(NEW_LAYOUT + [("(default)", "url_mappings_3"), ("(default)", "url_mappings_4")])
+        moved = sum(ring.shard_for(key) != grown.shard_for(key) for key in keys)
+        self.assertLess(moved, len(keys) * 0.3)
+
+class TestResharding(unittest.TestCase):
+    def setUp(self):
+        """Seed the old single-collection layout"""
+        self.config, self.client = make_config(NEW_LAYOUT, OLD_LAYOUT)
+        old = self.client.collection("url_mappings")
+        self.codes = [f"code{i}" for i in range(60)]
+        for i, code in enumerate(self.codes):
+            old.document(code).set({"original_url": f"https://example.com/{i}", "expires_at": f"2030-01-{i % 28 + 1:02d}"})
+
+    def test_dual_reads_during_migration(self):
+        """Test that unmigrated codes are read from the old layout"""
+        _, collection = self.config.get_shard("code1")
+        self.assertEqual(collection.document("code1").get().to_dict()["original_url"], "https://example.com/1")
+        self.assertEqual(len(self.config.get_documents(self.codes)), 60)
+
+        # New documents always go to the new layout
+        _, collection = self.config.get_shard("brand-new", new=True)
+        self.assertIn(collection.id, [name for _, name in NEW_LAYOUT])
+
+    def test_newer_copy_wins(self):
+        """Test that migration never overwrites a newer copy already in the new layout"""
+        old = self.client.collection("url_mappings")
+        old.document("code1").set({"original_url": "https://example.com/old", "version": 2})
+        old.document("code2").set({"original_url": "https://example.com/moved", "version": 5})
+        _, newer = self.config.get_shard("code1", new=True)
+        newer.document("code1").set({"original_url": "https://example.com/edited", "version": 3})
+        _, stale = self.config.get_shard("code2", new=True)
+        stale.document("code2").set({"original_url": "https://example.com/stale", "version": 4})
+
+        self.config.migrate_shards()
+        _, collection = self.config.get_shard("code1")
+        self.assertEqual(collection.document("code1").get().to_dict()["original_url"], "https://example.com/edited")
+        _, collection = self.config.get_shard("code2")
+        self.assertEqual(collection.document("code2").get().to_dict()["original_url"], "https://example.com/moved")
+        self.assertFalse(old.document("code1").get().exists)
+
+    def test_clicks_during_move_are_kept(self):
+        """Test that clicks landing on either copy while a document moves are all counted"""
+        old = self.client.collection("url_mappings")
+        old.document("code1").set({"original_url": "https://example.com/1", "version": 2, "click_count": 10,
+                                   "variant_clicks": {"0": 4}})
+        _, new = self.config.get_shard("code1", new=True)
+        copy_moved = DatabaseConfig._copy_moved
+        calls = []
+
+        def racing_copy(client, target, source, previous):
+            copy_moved(client, target, source, previous)
+            if not calls:
+                # A redirect that resolved the old shard earlier writes there after the
+                # copy; one that resolves now writes to the copy
+                old.document("code1").update({"click_count": 12, "variant_clicks": {"0": 5}})
+                target.update({"click_count": 11})
+            calls.append(1)
+
+        with patch.object(DatabaseConfig, '_copy_moved', side_effect=racing_copy):
+            self.config._move_document(old.document("code1").get(), OLD_LAYOUT[0])
+        self.assertEqual(len(calls), 2)
+        self.assertFalse(old.document("code1").get().exists)
+        moved = new.document("code1").get().to_dict()
+        self.assertEqual(moved["click_count"], 13)
+        self.assertEqual(moved["variant_clicks"], {"0": 5})
+
+    def test_migrate_then_scatter_gather(self):
+        """Test that migration empties the old layout and queries still see everything"""
+        counts = self.config.migrate_shards(batch_size=7)
+        self.assertEqual(counts["moved"] + counts["kept"], 60)
+        self.assertEqual(len(self.client.collection("url_mappings").get()), counts["kept"])
+
+        expiring = self.config.scatter_query(
+            lambda c: c.where("expires_at", "<=", "2030-01-03").order_by("expires_at").limit(5),
+            sort_key=lambda doc: doc.get("expires_at"), limit=5)
+        self.assertEqual([doc.get("expires_at") for doc in expiring],
+                         ["2030-01-01", "2030-01-01", "2030-01-01", "2030-01-02", "2030-01-02"])
+        self.assertEqual(sorted(doc.id for doc in self.config.iter_documents(page_size=4)), sorted(self.codes))
+
+class TestShardedModel(unittest.TestCase):
+    def setUp(self):
+        """Point the model's Firestore paths at a sharded fake"""
+        self.previous_config = database.db_config
+        self.previous_mock = os.environ.get('USE_MOCK_DATABASE')
+        os.environ['USE_MOCK_DATABASE'] = 'false'
+        database.db_config, self.client = make_config(NEW_LAYOUT)
+        mapping_cache.clear()
+
+    def tearDown(self):
+        database.db_config = self.previous_config
+        os.environ['USE_MOCK_DATABASE'] = self.previous_mock or 'true'
+        mapping_cache.clear()
+
+    def test_callers_unaware_of_shards(self):
+        """Test create, lookup, update and batch stats through URLMapping"""
+        codes = [f"link{i}" for i in range(12)]
+        for code in codes:
+            self.assertIsNotNone(URLMapping.create_mapping(f"https://example.com/{code}", code))
+        used = [name for _, name in NEW_LAYOUT if self.client.collection(name).get()]
+        self.assertGreater(len(used), 1)
+
+        self.assertTrue(URLMapping.increment_clicks("link3"))
+        self.assertEqual(URLMapping.get_mapping("link3")["original_url"], "https://example.com/link3")
+        self.assertIsNotNone(URLMapping.update_mapping("link3", {"is_active": False}))
+        self.assertFalse(URLMapping.get_mapping("link3")["exists"])
+
+        stats = URLMapping._fetch_stats_many(codes + ["missing"])
+        self.assertEqual(stats["link3"]["click_count"], 1)
+        self.assertIsNone(stats["missing"])
+        self.assertEqual(len(list(URLMapping.export_mappings())), 12)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,6 +7,10 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import create_app
+from utils.rate_limiter import rate_limiter, MemoryRateLimitStore
+from utils.expiry import expiry_sweeper
+from config.mock_database import MockURLMapping
+from models.url_mapping import URLMapping
 
 class TestShortenAPI(unittest.TestCase):
     def setUp(self):
@@ -97,5 +101,162 @@ class TestShortenAPI(unittest.TestCase):
         self.assertIn('click_count', stats_data)
         self.assertIn('created_at', stats_data)
 
+class TestRateLimiting(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment with a tight shorten policy"""
+        os.environ['USE_MOCK_DATABASE'] = 'true'
+        
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+        self.original_policies = rate_limiter.policies
+        rate_limiter.policies = {"shorten": (2, 0.01), "stats": (100, 10)}
+        rate_limiter.reset()
+    
+    def tearDown(self):
+        """Restore the default policies"""
+        rate_limiter.policies = self.original_policies
+        rate_limiter.reset()
+    
+    def test_shorten_rate_limited(self):
+        """Test that the bucket runs dry and returns 429 with Retry-After"""
+        for _ in range(2):
+            response = self.client.post('/api/shorten',
+                                      data=json.dumps({'url': 'https://example.com'}),
+                                      content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+        
+        response = self.client.post('/api/shorten',
+                                  data=json.dumps({'url': 'https://example.com'}),
+                                  content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response.headers['Retry-After']), 1)
+        
+        # Other clients have their own bucket
+        response = self.client.post('/api/shorten',
+                                  data=json.dumps({'url': 'https://example.com'}),
+                                  content_type='application/json',
+                                  environ_base={'REMOTE_ADDR': '10.1.2.3'})
+        self.assertEqual(response.status_code, 200)
+    
+    def test_memory_store_evicts_idle_buckets(self):
+        """Test that the in-process store stays bounded"""
+        store = MemoryRateLimitStore(max_keys=3, idle_seconds=10)
+        for i in range(5):
+            store.consume(f"client{i}", capacity=5, refill_rate=1, now=i)
+        self.assertEqual(len(store), 3)
+        
+        store.consume("late", capacity=5, refill_rate=1, now=100)
+        self.assertEqual(len(store), 1)
+
+class TestLinkExpiry(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        os.environ['USE_MOCK_DATABASE'] = 'true'
+        
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+    
+    def test_invalid_expiry_rejected(self):
+        """Test validation of expires_at and ttl_seconds"""
+        for body in [{'ttl_seconds': -5}, {'ttl_seconds': 'soon'}, {'expires_at': '2001-01-01T00:00:00Z'},
+                     {'expires_at': 'tomorrow'}, {'ttl_seconds': 60, 'expires_at': '2999-01-01T00:00:00Z'}]:
+            body['url'] = 'https://example.com'
+            response = self.client.post('/api/shorten',
+                                      data=json.dumps(body),
+                                      content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+    
+    def test_expired_link_enforced_and_swept(self):
+        """Test that expired links stop redirecting and are deleted by the sweeper"""
+        response = self.client.post('/api/shorten',
+                                  data=json.dumps({'url': 'https://example.com', 'ttl_seconds': 30}),
+                                  content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        short_code = data['short_code']
+        self.assertIsNotNone(data['expires_at'])
+        
+        # Cache lifetime never outlives the link
+        response = self.client.get(f'/{short_code}', follow_redirects=False)
+        self.assertEqual(response.status_code, 302)
+        max_age = int(response.headers['Cache-Control'].split('max-age=')[1])
+        self.assertLessEqual(max_age, 30)
+        
+        # Move the expiry into the past (published to the lookup cache)
+        URLMapping.update_mapping(short_code, {'expires_at': '2000-01-01T00:00:00.000000'})
+        response = self.client.get(f'/{short_code}', follow_redirects=False)
+        self.assertEqual(response.status_code, 404)
+        
+        expiry_sweeper.refill()
+        expiry_sweeper.sweep()
+        self.assertNotIn(short_code, MockURLMapping._storage)
+    
+    def test_expired_alias_is_free(self):
+        """Test that an expired alias can be reused before the sweeper deletes it"""
+        URLMapping.create_mapping('https://example.com/old', 'reusable', expires_at='2000-01-01T00:00:00.000000')
+        URLMapping.create_mapping('https://example.com/live', 'stillused', expires_at='2999-01-01T00:00:00.000000')
+        response = self.client.post('/api/shorten', json={'url': 'https://example.com/new', 'custom_alias': 'reusable'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(URLMapping.get_mapping('reusable')['original_url'], 'https://example.com/new')
+        response = self.client.post('/api/shorten', json={'url': 'https://example.com/new', 'custom_alias': 'stillused'})
+        self.assertEqual(response.status_code, 409)
+
+class TestLinkListing(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        os.environ['USE_MOCK_DATABASE'] = 'true'
+        
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+        self.creator = '198.51.100.41'
+        for i in range(5):
+            URLMapping.create_mapping(f'https://example.com/{i}', f'listing{i}', self.creator)
+    
+    def get_links(self, query='', remote_addr='198.51.100.41'):
+        response = self.client.get(f'/api/links{query}', environ_base={'REMOTE_ADDR': remote_addr})
+        return response.status_code, json.loads(response.data)
+    
+    def test_pages_newest_first(self):
+        """Test that cursors walk every link once, newest first"""
+        codes = []
+        cursor = ''
+        for _ in range(3):
+            status, data = self.get_links(f'?limit=2{cursor}')
+            self.assertEqual(status, 200)
+            codes += [link['short_code'] for link in data['data']['links']]
+            next_cursor = data['data']['next_cursor']
+            if not next_cursor:
+                break
+            cursor = f'&cursor={next_cursor}'
+        self.assertEqual(codes, [f'listing{i}' for i in reversed(range(5))])
+        self.assertIsNone(next_cursor)
+        
+        link = data['data']['links'][0]
+        self.assertEqual(set(link), {'short_code', 'original_url', 'created_at', 'click_count',
+                                     'is_active', 'expires_at'})
+    
+    def test_invalid_parameters(self):
+        """Test that bad cursors and limits are rejected"""
+        self.assertEqual(self.get_links('?cursor=not-a-cursor')[0], 400)
+        self.assertEqual(self.get_links('?limit=many')[0], 400)
+    
+    def test_listing_needs_admin(self):
+        """Test that only an admin can list links, even the caller's own IP's"""
+        os.environ['ADMIN_API_KEY'] = 'listing-secret'
+        try:
+            status, data = self.get_links(f'?creator={self.creator}', remote_addr='203.0.113.99')
+            self.assertEqual(status, 403)
+            # Clients sharing a NAT address can't list each other's links
+            self.assertEqual(self.get_links()[0], 403)
+            response = self.client.get(f'/api/links?creator={self.creator}',
+                                       headers={'X-Admin-Key': 'listing-secret'},
+                                       environ_base={'REMOTE_ADDR': '203.0.113.99'})
+            self.assertEqual(len(json.loads(response.data)['data']['links']), 5)
+        finally:
+            del os.environ['ADMIN_API_KEY']
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,157 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models.url_mapping import URLMapping
+from utils.mapping_cache import mapping_cache
+from utils.tracing import (tracer, parse_traceparent, instrument_firestore, TracedFirestoreAPI,
+                           JsonlExporter, OtlpHttpExporter)
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+class CollectingExporter:
+    def __init__(self):
+        self.traces = []
+
+    def export(self, spans):
+        self.traces.append(spans)
+
+
+class StubGapicAPI:
+    """Stands in for the generated Firestore API client"""
+
+    def commit(self, request=None):
+        return "committed"
+
+    def run_query(self, request=None):
+        return iter(["doc1", "doc2"])
+
+
+class TestRequestTracing(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment with an in-memory exporter"""
+        # Force mock database for testing
+        os.environ['USE_MOCK_DATABASE'] = 'true'
+
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+        self.exporter = CollectingExporter()
+        self._patches = [patch.object(tracer, 'exporter', self.exporter),
+                         patch.object(tracer, 'sample_rate', 0.0),
+                         patch.object(tracer, 'tail_latency_ms', None)]
+        for p in self._patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self._patches:
+            p.stop()
+
+    def test_incoming_trace_context_is_continued(self):
+        """Test that a sampled traceparent yields a trace with nested route and model spans"""
+        URLMapping.create_mapping('https://example.com', 'traced1')
+        mapping_cache.invalidate('traced1')
+
+        response = self.client.get('/traced1', headers={'traceparent': f'00-{TRACE_ID}-{PARENT_ID}-01'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.headers['X-Trace-Id'], TRACE_ID)
+
+        self.assertEqual(len(self.exporter.traces), 1)
+        spans = {span['name']: span for span in self.exporter.traces[0]}
+        root = spans['GET /<string:short_code>']
+        self.assertEqual(root['trace_id'], TRACE_ID)
+        self.assertEqual(root['parent_id'], PARENT_ID)
+        self.assertEqual(root['attributes']['http.status_code'], 302)
+        self.assertEqual(spans['URLMapping.get_mapping']['parent_id'], root['span_id'])
+        self.assertEqual(spans['URLMapping._load_mapping']['parent_id'], spans['URLMapping.get_mapping']['span_id'])
+        self.assertEqual(spans['URLMapping.increment_clicks']['parent_id'], root['span_id'])
+
+    def test_head_and_tail_sampling(self):
+        """Test that unsampled requests are only exported when tail sampling catches them"""
+        self.client.get('/health', headers={'traceparent': f'00-{TRACE_ID}-{PARENT_ID}-00'})
+        response = self.client.get('/health')
+        self.assertNotIn('X-Trace-Id', response.headers)
+        self.assertEqual(self.exporter.traces, [])
+
+        with patch.object(tracer, 'tail_latency_ms', 0):
+            self.client.get('/health')
+        self.assertEqual(len(self.exporter.traces), 1)
+        self.assertEqual(self.exporter.traces[0][-1]['name'], 'GET /health')
+
+    def test_errors_are_recorded(self):
+        """Test that exceptions in traced calls mark the span and still propagate"""
+        @tracer.traced("failing_call")
+        def failing_call():
+            raise RuntimeError("backend down")
+
+        root = tracer.start_trace('job', f'00-{TRACE_ID}-{PARENT_ID}-01')
+        with self.assertRaises(RuntimeError):
+            failing_call()
+        tracer.end_trace(root)
+        spans = {span['name']: span for span in self.exporter.traces[0]}
+        self.assertEqual(spans['failing_call']['error'], 'RuntimeError: backend down')
+        self.assertIsNone(spans['job']['error'])
+
+class TestFirestoreSpans(unittest.TestCase):
+    def setUp(self):
+        self.exporter = CollectingExporter()
+        self._patch = patch.object(tracer, 'exporter', self.exporter)
+        self._patch.start()
+
+    def tearDown(self):
+        self._patch.stop()
+
+    def test_rpcs_become_spans(self):
+        """Test unary and streaming RPC spans, and no-op outside a trace"""
+        api = TracedFirestoreAPI(StubGapicAPI())
+        self.assertEqual(api.commit(), "committed")  # no trace: passes straight through
+
+        root = tracer.start_trace('job', f'00-{TRACE_ID}-{PARENT_ID}-01')
+        api.commit()
+        self.assertEqual(list(api.run_query()), ["doc1", "doc2"])
+        tracer.end_trace(root)
+
+        names = [span['name'] for span in self.exporter.traces[0]]
+        self.assertEqual(names, ['firestore.commit', 'firestore.run_query', 'job'])
+
+    def test_instruments_real_client(self):
+        """Test that the Firestore client's GAPIC API is wrapped"""
+        from google.auth.credentials import AnonymousCredentials
+        from google.cloud import firestore
+        client = instrument_firestore(firestore.Client(project='demo', credentials=AnonymousCredentials()))
+        self.assertIsInstance(client._firestore_api, TracedFirestoreAPI)
+
+class TestExporters(unittest.TestCase):
+    def test_traceparent_parsing(self):
+        """Test valid and invalid traceparent headers"""
+        self.assertEqual(parse_traceparent(f'00-{TRACE_ID}-{PARENT_ID}-01'), (TRACE_ID, PARENT_ID, True))
+        for value in [None, 'garbage', f'00-{"0" * 32}-{PARENT_ID}-01', f'00-{TRACE_ID}-{PARENT_ID}']:
+            self.assertIsNone(parse_traceparent(value))
+
+    def test_jsonl_and_otlp_formats(self):
+        """Test the JSONL file output and OTLP span encoding"""
+        span = {"trace_id": TRACE_ID, "span_id": PARENT_ID, "parent_id": None, "name": "GET /health",
+                "start_ns": 1000, "duration_ms": 1.5, "attributes": {"http.status_code": 200}, "error": None}
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'traces.jsonl')
+            JsonlExporter(path).export([span, span])
+            with open(path) as f:
+                self.assertEqual([json.loads(line) for line in f], [span, span])
+
+        otlp = OtlpHttpExporter('http://collector:4318')._otlp_span(span)
+        self.assertEqual(otlp['endTimeUnixNano'], '1501000')
+        self.assertEqual(otlp['kind'], 1)
+        self.assertEqual(otlp['attributes'], [{"key": "http.status_code", "value": {"intValue": "200"}}])
+        self.assertNotIn('parentSpanId', otlp)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+import json
+import os
+import shutil
+import sys
+import tempfile
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models.url_mapping import URLMapping
+from utils.traffic_capture import TrafficCapture, install_traffic_capture, read_capture
+import replay_traffic
+
+
+class TestTrafficCapture(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        # Force mock database for testing
+        os.environ['USE_MOCK_DATABASE'] = 'true'
+
+        self.directory = tempfile.mkdtemp()
+        self.capture = TrafficCapture(self.directory, salt='test-salt', flush_records=1000)
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        install_traffic_capture(self.app, self.capture)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_records_anonymized_requests(self):
+        """Test that redirects, probes and shortens are captured without the short codes"""
+        URLMapping.create_mapping('https://example.com/secret', 'capture1')
+        self.client.get('/capture1')
+        self.client.get('/capture1')
+        self.client.get('/wp-login.php')
+        self.client.post('/api/shorten', json={'url': 'https://example.com/new'})
+        self.client.get('/health')
+        self.client.get('/api/stats/capture1')
+        self.capture.close()
+
+        records = read_capture(self.capture.path)
+        self.assertEqual([(method, status) for _, method, _, status, _ in records],
+                         [('GET', 302), ('GET', 302), ('GET', 404), ('POST', 200)])
+        self.assertEqual(records[0][2], records[1][2])  # one code, one token
+        self.assertNotEqual(records[0][2], records[2][2])
+        self.assertEqual(records[3][2], '/api/shorten')
+        self.assertTrue(all(latency > 0 for *_, latency in records))
+        with open(self.capture.path, 'rb') as f:
+            self.assertNotIn(b'capture1', f.read())
+
+    def test_metrics_see_through_capture(self):
+        """Test that admin metrics report capture and still find the fast path underneath it"""
+        with patch.dict(os.environ, {'FAST_PATH_ENABLED': 'true'}):
+            app = create_app()
+        install_traffic_capture(app, self.capture)
+        app.debug = True
+        data = json.loads(app.test_client().get('/api/admin/metrics').data)['data']
+        self.assertIn('traffic_capture', data)
+        self.assertIn('hits', data['fast_path'])
+
+    def test_sampling_keeps_whole_codes(self):
+        """Test that sampling picks short codes, keeping every request for a sampled code"""
+        capture = TrafficCapture(self.directory, sample_rate=0.5, salt='test-salt')
+        codes = [f"/code{i}" for i in range(200)]
+        for _ in range(3):
+            for code in codes:
+                capture.record_request('GET', code, 302, 100)
+        capture.close()
+
+        counts = {}
+        for _, _, path, _, _ in read_capture(capture.path):
+            counts[path] = counts.get(path, 0) + 1
+        self.assertTrue(60 < len(counts) < 140)
+        self.assertEqual(set(counts.values()), {3})
+
+    def test_schedule(self):
+        """Test replay pacing, speed-up and gap compression"""
+        records = [(1000, 'GET', '/a', 302, 10), (1500, 'GET', '/a', 302, 10), (61500, 'GET', '/b', 404, 10)]
+        self.assertEqual(replay_traffic.schedule(records), [0.0, 0.5, 60.5])
+        self.assertEqual(replay_traffic.schedule(records, speed=10), [0.0, 0.05, 6.05])
+        self.assertEqual(replay_traffic.schedule(records, max_gap=2), [0.0, 0.5, 2.5])
+        self.assertEqual(replay_traffic.schedule(records, speed=0), [0.0, 0.0, 0.0])
+
+    def test_replay(self):
+        """Test that a replay seeds captured links and reproduces hits and misses"""
+        records = [(1000, 'GET', '/replayhit', 302, 10), (1001, 'GET', '/replaymiss', 404, 10),
+                   (1002, 'POST', '/api/shorten', 200, 10), (1003, 'GET', '/replayhit', 302, 10)]
+        self.assertEqual(replay_traffic.seed_mappings(records), 1)
+        results = replay_traffic.replay(self.app, records, replay_traffic.schedule(records, speed=0), workers=1)
+        self.assertEqual(sorted(status for _, status, _, _ in results), [200, 302, 302, 404])
+        self.assertEqual(replay_traffic.percentile([1, 2, 3, 4], 50), 2)
+        self.assertEqual(replay_traffic.percentile([1, 2, 3, 4], 99), 4)
+
+if __name__ == '__main__':
+    unittest.main()
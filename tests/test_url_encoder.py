@@ -0,0 +1,50 @@
+import unittest
+import os
+import random
+import sys
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.url_encoder import URLEncoder, np
+
+class TestBase62(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.numbers = [0, 1, 61, 62, 3843, 3844, 2 ** 63 - 1, 2 ** 80]
+        self.numbers += [rng.randrange(2 ** 63) for _ in range(500)]
+
+    def test_scalar_round_trip(self):
+        """Test known encodings and round trips"""
+        self.assertEqual(URLEncoder.encode_base62(0), 'a')
+        self.assertEqual(URLEncoder.encode_base62(62), 'ba')
+        self.assertEqual(URLEncoder.decode_base62('ba'), 62)
+        for number in self.numbers:
+            self.assertEqual(URLEncoder.decode_base62(URLEncoder.encode_base62(number)), number)
+
+    def test_invalid_input(self):
+        """Test that bad characters and negative numbers are rejected"""
+        with self.assertRaises(ValueError):
+            URLEncoder.decode_base62('ab-c')
+        with self.assertRaises(ValueError):
+            URLEncoder.encode_base62(-1)
+
+    def test_batch_matches_scalar(self):
+        """Test that the pure-Python batch path matches the scalar codec"""
+        encoded = URLEncoder.encode_many(self.numbers, use_numpy=False)
+        self.assertEqual(encoded, [URLEncoder.encode_base62(n) for n in self.numbers])
+        self.assertEqual(URLEncoder.decode_many(encoded, use_numpy=False), self.numbers)
+
+    @unittest.skipIf(np is None, "NumPy not installed")
+    def test_numpy_batch_matches_scalar(self):
+        """Test that the vectorized path matches the scalar codec, including wide values"""
+        encoded = URLEncoder.encode_many(self.numbers, use_numpy=True)
+        self.assertEqual(encoded, [URLEncoder.encode_base62(n) for n in self.numbers])
+        self.assertEqual(URLEncoder.decode_many(encoded + [''], use_numpy=True), self.numbers + [0])
+        with self.assertRaises(ValueError):
+            URLEncoder.decode_many(['abc', 'ab!'], use_numpy=True)
+        with self.assertRaises(ValueError):
+            URLEncoder.encode_many([5, -1], use_numpy=True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+# Hot/cold tiering: moves mappings that haven't been clicked or edited for
+# TIERING_IDLE_DAYS into compressed segment files under TIERING_SEGMENT_DIR.
+# Archived links keep working: a lookup that misses the database finds them in
+# the segments and moves them back. Safe to run while serving (e.g. nightly cron).
+#
+# Examples:
+#   python tier_links.py                 # archive links idle for TIERING_IDLE_DAYS
+#   python tier_links.py --idle-days 90
+#   python tier_links.py --compact       # merge segments, dropping promoted/deleted records
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from config.database import db_config
+from models.url_mapping import URLMapping
+from utils.segment_store import segment_store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive idle short links to the cold tier")
+    parser.add_argument("--idle-days", type=float, default=float(os.getenv('TIERING_IDLE_DAYS', '180')),
+                        help="Archive links not clicked or edited for this many days")
+    parser.add_argument("--batch-size", type=int, default=500, help="Mappings per segment file")
+    parser.add_argument("--compact", action="store_true", help="Merge segment files instead of archiving")
+    args = parser.parse_args(argv)
+
+    if not segment_store.enabled:
+        print("TIERING_SEGMENT_DIR is not set; nothing to do")
+        return 1
+    if not args.compact and not segment_store.shared:
+        print("❌ TIERING_SEGMENT_DIR is not shared storage. Archived links would only exist on this machine;")
+        print("   use gs://bucket/prefix, or a mount every instance sees with TIERING_SHARED_STORAGE=true")
+        return 1
+
+    if args.compact:
+        counts = segment_store.compact()
+        print(f"✅ Compacted into {counts['records']} records (from {counts['segments']} segments)")
+        return 0
+
+    if os.getenv('USE_MOCK_DATABASE', 'false').lower() != 'true' and not db_config.init_db():
+        print("❌ Could not connect to Firestore")
+        return 1
+
+    cutoff = (datetime.utcnow() - timedelta(days=args.idle_days)).isoformat()
+    counts = URLMapping.archive_idle(cutoff, batch_size=args.batch_size)
+    print(f"✅ Archived {counts['archived']} mappings idle since {cutoff} "
+          f"({counts['kept']} became active again and stayed hot)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
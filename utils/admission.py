@@ -0,0 +1,215 @@
+import math
+import os
+import threading
+import time
+from flask import request, jsonify, g
+from utils.static_pages import static_pages
+
+# Lower number = more important; under load the least important classes are shed first
+PRIORITIES = {"redirect": 0, "shorten": 1, "stats": 2, "admin": 2}
+# Fraction of the adaptive concurrency limit each priority may occupy
+PRIORITY_SHARES = {0: 1.0, 1: 0.8, 2: 0.6}
+# Classes whose latency drives the adaptive limit. Admin requests (bulk jobs, streamed
+# exports) run for seconds by design and would read as overload, shrinking the limit
+# for redirects; they still take slots and can be capped with ADMISSION_CLASS_LIMITS.
+SAMPLED_CLASSES = frozenset(("redirect", "shorten", "stats"))
+
+
+class AdaptiveLimit:
+    """
+    Concurrency limit that follows observed latency (gradient algorithm)
+    Compares short-term latency (an EWMA) with a no-load baseline (the lowest
+    smoothed latency seen, drifting slowly upward so it can re-learn). While
+    latency stays within `tolerance` x baseline and the limit is in use, it grows
+    by about sqrt(limit) per sample; once requests start queueing and latency
+    inflates, it shrinks in proportion to baseline / latency.
+    """
+
+    def __init__(self, initial=50, min_limit=8, max_limit=500, tolerance=2.0, smoothing=0.2):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.latency = None  # EWMA of recent latencies (seconds)
+        self.baseline = None  # Estimated no-load latency (seconds)
+        self._lock = threading.Lock()
+
+    def on_sample(self, latency, inflight):
+        """
+        Feed one completed request into the limit
+        Args:
+            latency: Request duration in seconds
+            inflight: Requests in flight when it started (including itself)
+        """
+        with self._lock:
+            if self.latency is None:
+                self.latency = self.baseline = latency
+            self.latency += (latency - self.latency) * 0.1
+            if self.latency < self.baseline:
+                self.baseline = self.latency
+            else:
+                self.baseline += (self.latency - self.baseline) * 0.001
+
+            gradient = max(0.5, min(1.0, self.tolerance * self.baseline / max(self.latency, 1e-9)))
+            # Only probe upward when demand actually reaches the limit
+            headroom = math.sqrt(self.limit) if inflight * 2 >= self.limit else 0
+            target = self.limit * gradient + headroom
+            limit = self.limit + (target - self.limit) * self.smoothing
+            self.limit = min(max(limit, self.min_limit), self.max_limit)
+
+
+class AdmissionController:
+    """
+    Priority-aware concurrency limiter in front of the blueprints
+    Each request is classified (redirect, shorten, stats, admin) and admitted
+    only while the requests in flight stay under its priority's share of the
+    adaptive limit and under its class budget, if one is set. Everything else
+    gets an immediate 503 with Retry-After instead of queueing behind work the
+    instance can't finish in time.
+    """
+
+    def __init__(self, limit, class_limits=None, enabled=True, retry_after=1):
+        self.limit = limit
+        self.class_limits = dict(class_limits or {})
+        self.enabled = enabled
+        self.retry_after = retry_after
+        self.inflight = 0
+        self._inflight = {name: 0 for name in PRIORITIES}
+        self._admitted = {name: 0 for name in PRIORITIES}
+        self._shed = {name: 0 for name in PRIORITIES}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, name):
+        """
+        Take a concurrency slot for a request class
+        Returns:
+            int or None: Requests in flight including this one, None if it must be shed
+        """
+        with self._lock:
+            capacity = self.limit.limit * PRIORITY_SHARES[PRIORITIES[name]]
+            budget = self.class_limits.get(name)
+            if self.inflight >= capacity or (budget is not None and self._inflight[name] >= budget):
+                self._shed[name] += 1
+                return None
+            self.inflight += 1
+            self._inflight[name] += 1
+            self._admitted[name] += 1
+            return self.inflight
+
+    def release(self, name, latency, inflight):
+        """
+        Return a slot and report how long the request took
+        Only SAMPLED_CLASSES feed their latency into the adaptive limit.
+        Args:
+            name: Request class passed to try_acquire
+            latency: Seconds since the slot was taken
+            inflight: Value returned by try_acquire
+        """
+        with self._lock:
+            self.inflight -= 1
+            self._inflight[name] -= 1
+        if name in SAMPLED_CLASSES:
+            self.limit.on_sample(latency, inflight)
+
+    def init_app(self, app):
+        """Install the limiter as before/teardown request hooks"""
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        if not self.enabled:
+            return None
+        name = request_class()
+        if name is None:
+            return None
+        inflight = self.try_acquire(name)
+        if inflight is None:
+            return self._shed_response(name)
+        g.admission = (name, time.monotonic(), inflight)
+        return None
+
+    def _teardown_request(self, exc=None):
+        admission = g.pop('admission', None)
+        if admission is not None:
+            name, started, inflight = admission
+            self.release(name, time.monotonic() - started, inflight)
+
+    def _shed_response(self, name):
+        if name == "redirect":
+            response = static_pages.response('503.html', 503)
+        else:
+            response = jsonify({
+                "success": False,
+                "error": "Server is overloaded. Please try again later."
+            })
+            response.status_code = 503
+        response.headers['Retry-After'] = str(self.retry_after)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    def stats(self):
+        """Limiter counters for metrics"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "limit": round(self.limit.limit, 1),
+                "latency_ms": round(self.limit.latency * 1000, 2) if self.limit.latency is not None else None,
+                "baseline_ms": round(self.limit.baseline * 1000, 2) if self.limit.baseline is not None else None,
+                "inflight": self.inflight,
+                "admitted": dict(self._admitted),
+                "shed": dict(self._shed)
+            }
+
+
+def request_class():
+    """
+    Classify the current request for admission control
+    Returns:
+        str or None: Key of PRIORITIES, None for requests that are never shed
+                     (health checks, the index page, static files, unknown paths)
+    """
+    endpoint = request.endpoint
+    if endpoint == 'redirect.redirect_url':
+        return "redirect"
+    if endpoint == 'shorten.shorten_url':
+        return "shorten"
+    if request.blueprint == 'admin':
+        return "admin"
+    if endpoint is None or endpoint in ('index', 'static', 'shorten.health_check'):
+        return None
+    return "stats"
+
+
+def parse_class_limits(value):
+    """
+    Parse per-class concurrency budgets like "shorten=40,stats=20"
+    Returns:
+        dict: class name -> maximum requests in flight
+    Raises:
+        ValueError: For unknown classes or non-integer budgets
+    """
+    limits = {}
+    for part in (value or '').split(','):
+        if not part.strip():
+            continue
+        name, _, budget = part.partition('=')
+        name = name.strip()
+        if name not in PRIORITIES:
+            raise ValueError(f"Unknown request class: {name}")
+        limits[name] = int(budget)
+    return limits
+
+
+# Global limiter installed by create_app (per process: size it for threaded workers)
+admission_controller = AdmissionController(
+    AdaptiveLimit(
+        initial=int(os.getenv('ADMISSION_INITIAL_LIMIT', '50')),
+        min_limit=int(os.getenv('ADMISSION_MIN_LIMIT', '8')),
+        max_limit=int(os.getenv('ADMISSION_MAX_LIMIT', '500')),
+        tolerance=float(os.getenv('ADMISSION_LATENCY_TOLERANCE', '2.0'))
+    ),
+    class_limits=parse_class_limits(os.getenv('ADMISSION_CLASS_LIMITS')),
+    enabled=os.getenv('ADMISSION_CONTROL_ENABLED', 'true').lower() == 'true',
+    retry_after=int(os.getenv('ADMISSION_RETRY_AFTER_SECONDS', '1'))
+)
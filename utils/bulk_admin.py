@@ -0,0 +1,126 @@
+import os
+import time
+import logging
+from models.url_mapping import URLMapping
+from utils.expiry import format_timestamp
+from utils.http_cache import parse_timestamp
+
+ACTIONS = ("deactivate", "delete")
+MAX_LISTED_CODES = 10000
+DRY_RUN_SAMPLE = 20
+
+# Writes are paced so a large job doesn't starve redirect traffic of Firestore capacity
+DEFAULT_CHUNK_SIZE = int(os.getenv('BULK_ADMIN_CHUNK_SIZE', '200'))
+DEFAULT_MAX_RATE = float(os.getenv('BULK_ADMIN_MAX_WRITES_PER_SECOND', '500'))
+
+
+def parse_selector(data):
+    """
+    Validate which links a bulk operation targets
+    Args:
+        data: Dict with short_codes, or created_by_ip and/or created_after / created_before
+    Returns:
+        dict: Normalized selector
+    Raises:
+        ValueError: If the selection is missing, ambiguous or malformed
+    """
+    short_codes = data.get('short_codes')
+    created_by_ip = data.get('created_by_ip')
+    created_after = data.get('created_after')
+    created_before = data.get('created_before')
+
+    if short_codes is not None:
+        if created_by_ip or created_after or created_before:
+            raise ValueError("short_codes cannot be combined with other filters")
+        if not isinstance(short_codes, list) or not all(isinstance(code, str) for code in short_codes):
+            raise ValueError("short_codes must be a list of strings")
+        if not short_codes or len(short_codes) > MAX_LISTED_CODES:
+            raise ValueError(f"short_codes must contain 1 to {MAX_LISTED_CODES} codes")
+        return {"short_codes": list(dict.fromkeys(short_codes))}
+
+    if not (created_by_ip or created_after or created_before):
+        raise ValueError("Provide short_codes, created_by_ip or a created_after/created_before range")
+    if created_by_ip is not None and not isinstance(created_by_ip, str):
+        raise ValueError("created_by_ip must be a string")
+
+    selector = {"created_by_ip": created_by_ip}
+    for key, value in (("created_after", created_after), ("created_before", created_before)):
+        moment = parse_timestamp(value) if value else None
+        if value and moment is None:
+            raise ValueError(f"{key} must be an ISO-8601 timestamp")
+        selector[key] = format_timestamp(moment) if moment else None
+    if selector["created_after"] and selector["created_before"] and \
+            selector["created_after"] >= selector["created_before"]:
+        raise ValueError("created_after must be before created_before")
+    return selector
+
+
+def _selected_codes(selector):
+    if "short_codes" in selector:
+        return iter(selector["short_codes"])
+    return URLMapping.find_codes(selector["created_by_ip"], selector["created_after"], selector["created_before"])
+
+
+def _chunks(codes, size):
+    chunk = []
+    for code in codes:
+        chunk.append(code)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_bulk(action, selector, dry_run=False, chunk_size=None, max_rate=None, sleep=time.sleep):
+    """
+    Apply a bulk action chunk by chunk, yielding progress events
+    Args:
+        action: "deactivate" or "delete"
+        selector: Result of parse_selector
+        dry_run: Only count (and sample) the matching links
+        chunk_size: Codes per batched write
+        max_rate: Maximum writes per second (None or 0 for unthrottled)
+        sleep: Injected for tests
+    Yields:
+        dict: {"event": "start" | "progress" | "done" | "error", ...}
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"Unknown bulk action: {action}")
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    max_rate = DEFAULT_MAX_RATE if max_rate is None else max_rate
+
+    started = time.monotonic()
+    totals = {"matched": 0}
+    sample = []
+    yield {"event": "start", "action": action, "dry_run": dry_run, "selector": selector}
+
+    try:
+        for chunk in _chunks(_selected_codes(selector), chunk_size):
+            chunk_started = time.monotonic()
+            totals["matched"] += len(chunk)
+            if dry_run:
+                sample.extend(chunk[:DRY_RUN_SAMPLE - len(sample)])
+            else:
+                if action == "delete":
+                    counts = URLMapping.bulk_delete(chunk)
+                else:
+                    counts = URLMapping.bulk_deactivate(chunk)
+                for key, value in counts.items():
+                    totals[key] = totals.get(key, 0) + value
+            yield dict(totals, event="progress")
+
+            if max_rate and not dry_run:
+                remaining = len(chunk) / max_rate - (time.monotonic() - chunk_started)
+                if remaining > 0:
+                    sleep(remaining)
+    except Exception as e:
+        logging.error(f"Bulk {action} failed: {e}")
+        yield dict(totals, event="error", error=str(e))
+        return
+
+    done = dict(totals, event="done", elapsed_seconds=round(time.monotonic() - started, 3))
+    if dry_run:
+        done["sample"] = sample
+    logging.info(f"Bulk {action} finished: {done}")
+    yield done
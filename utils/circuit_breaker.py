@@ -0,0 +1,113 @@
+import logging
+import os
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the backend while the breaker is open"""
+    pass
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing backend and probes it again after a cool-down
+    After `failure_threshold` consecutive failures the breaker opens and calls fail
+    fast with CircuitOpenError. Once `reset_timeout` seconds have passed, one trial
+    call is let through (half-open); success closes the breaker, failure re-opens it.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.opened = 0
+
+    def call(self, func, *args, **kwargs):
+        """
+        Run func through the breaker
+        Raises:
+            CircuitOpenError: If the breaker is open
+            Any exception raised by func (which counts as a failure)
+        """
+        self._before_call()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self._record_failure()
+            raise
+        self._record_success()
+        return result
+
+    def allow_request(self):
+        """Check whether a call would currently be let through"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                return time.monotonic() - self._opened_at >= self.reset_timeout
+            return not self._trial_running
+
+    def reset(self):
+        """Close the breaker and forget past failures"""
+        with self._lock:
+            self.state = CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def stats(self):
+        """Breaker state and counters for metrics"""
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self._failures,
+                "times_opened": self.opened,
+                "rejected": self.rejected
+            }
+
+    def _before_call(self):
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+            if self.state == OPEN or (self.state == HALF_OPEN and self._trial_running):
+                self.rejected += 1
+                raise CircuitOpenError(f"Circuit '{self.name}' is open")
+            if self.state == HALF_OPEN:
+                self._trial_running = True
+
+    def _record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logging.info(f"Circuit '{self.name}' closed")
+            self.state = CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def _record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opened += 1
+                    logging.warning(f"Circuit '{self.name}' opened after {self._failures} failures")
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+
+# Breaker around Firestore reads on the lookup path
+backend_breaker = CircuitBreaker(
+    "firestore",
+    failure_threshold=int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5')),
+    reset_timeout=float(os.getenv('BREAKER_RESET_SECONDS', '30'))
+)
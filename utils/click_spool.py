@@ -0,0 +1,437 @@
+import atexit
+import fcntl
+import logging
+import os
+import threading
+import time
+import uuid
+import zlib
+
+SEGMENT_PREFIX = "clicks-"
+SEGMENT_SUFFIX = ".log"
+REPLACES_HEADER = "#replaces "
+# Replay markers older than this are pruned from mappings; a spool's segments must be
+# replayed well within it (they normally are within seconds)
+MARKER_RETENTION_SECONDS = float(os.getenv('CLICK_SPOOL_MARKER_RETENTION_DAYS', '7')) * 86400
+
+
+def _segment_name(number):
+    return f"{SEGMENT_PREFIX}{number:012d}{SEGMENT_SUFFIX}"
+
+
+def _encode_record(seq, short_code, count, variants=None):
+    payload = f"{seq} {short_code} {count}"
+    if variants:
+        # Clicks per destination of a weighted link, e.g. "0=3,1=2"
+        payload += " " + ",".join(f"{variant}={variant_count}" for variant, variant_count in variants.items())
+    return f"{payload} {zlib.crc32(payload.encode()):08x}\n".encode()
+
+
+def _merge_click(clicks, seq, short_code, count, variants):
+    # Records arrive in seq order, so the last seq seen is the code's highest
+    total, _, merged = clicks.get(short_code, (0, 0, {}))
+    for variant, variant_count in variants.items():
+        merged[variant] = merged.get(variant, 0) + variant_count
+    clicks[short_code] = (total + count, seq, merged)
+
+
+def prune_markers(applied, keep, now_ns=None):
+    """
+    Drop replay markers of spools that haven't applied clicks for MARKER_RETENTION_SECONDS
+    Sequences are time.time_ns() values, so a marker says when its spool last
+    counted a click for the link. Workers come and go (every slot has its own
+    spool ID), and without pruning each one would leave a marker on every link
+    it ever counted, growing the documents without bound.
+    Args:
+        applied: dict of spool_id -> highest applied seq, modified in place
+        keep: Spool ID being applied, never pruned
+        now_ns: Current time in nanoseconds, defaults to now
+    Returns:
+        dict: applied
+    """
+    horizon = (now_ns if now_ns is not None else time.time_ns()) - int(MARKER_RETENTION_SECONDS * 1e9)
+    for spool_id in [spool_id for spool_id, seq in applied.items() if seq < horizon and spool_id != keep]:
+        del applied[spool_id]
+    return applied
+
+
+def read_segment(path):
+    """
+    Parse a spool segment, skipping torn or corrupt lines
+    Returns:
+        tuple: (names of segments it replaces, [(seq, short_code, count, {variant: count})],
+                corrupt line count)
+    """
+    replaces, records, corrupt = [], [], 0
+    with open(path, "rb") as f:
+        data = f.read()
+    for raw in data.split(b"\n")[:-1]:  # an unterminated last line is a torn write
+        line = raw.decode("utf-8", "replace")
+        if line.startswith(REPLACES_HEADER):
+            replaces = [name for name in line[len(REPLACES_HEADER):].split(",") if name]
+            continue
+        payload, _, checksum = line.rpartition(" ")
+        parts = payload.split(" ")
+        if len(parts) not in (3, 4) or checksum != f"{zlib.crc32(payload.encode()):08x}":
+            corrupt += 1
+            continue
+        variants = {}
+        if len(parts) == 4:
+            for item in parts[3].split(","):
+                variant, _, variant_count = item.partition("=")
+                variants[variant] = int(variant_count)
+        records.append((int(parts[0]), parts[1], int(parts[2]), variants))
+    return replaces, records, corrupt
+
+
+class ClickSpool:
+    """
+    Crash-safe local log of clicks, replayed to the database in batches
+    record() appends a checksummed line to the active segment and, in "batch" sync
+    mode, returns once an fsync covers it: concurrent clicks share one fsync (group
+    commit). In "interval" mode a background fsync every `sync_interval` seconds
+    bounds the loss instead. Segments rotate at `segment_bytes`; the replayer
+    aggregates sealed segments per short code and hands them to
+    `apply_func(spool_id, {short_code: (count, seq, variants)})`, which must skip codes whose
+    stored sequence for this spool is already >= seq, so a replay interrupted at any
+    point can simply run again. A segment is deleted once fully applied.
+
+    Each process claims its own slot directory (flock), so workers sharing
+    CLICK_SPOOL_DIR never interleave writes and a restarted worker takes over the
+    slot, spool ID and unreplayed segments of the one before it.
+    """
+
+    def __init__(self, directory=None, apply_func=None, sync="batch", sync_interval=0.05,
+                 segment_bytes=4 * 1024 * 1024, replay_batch=500, compact_segments=16):
+        if sync not in ("batch", "interval"):
+            raise ValueError(f"Unknown click spool sync mode: {sync}")
+        self.apply_func = apply_func
+        self.sync = sync
+        self.sync_interval = sync_interval
+        self.segment_bytes = segment_bytes
+        self.replay_batch = replay_batch
+        self.compact_segments = compact_segments
+        self._lock = threading.Lock()  # appends and the active file
+        self._io = threading.Lock()  # fsync and rotation
+        self._synced_cond = threading.Condition()
+        self._replaying = threading.Lock()
+        self._thread = None
+        self._file = None
+        self._slot_lock = None
+        self.spooled = 0
+        self.replayed = 0
+        self.corrupt = 0
+        self.fsyncs = 0
+        self.errors = 0
+        self.open(directory)
+
+    @property
+    def enabled(self):
+        return self._file is not None
+
+    def open(self, directory):
+        """Claim a slot under `directory` (None disables the spool) and recover its segments"""
+        self.close()
+        self.directory = None
+        if directory is None:
+            return
+        self.directory, self._slot_lock = self._claim_slot(directory)
+        id_path = os.path.join(self.directory, "spool.id")
+        if not os.path.exists(id_path):
+            with open(id_path + ".tmp", "w") as f:
+                f.write("s" + uuid.uuid4().hex)
+            os.replace(id_path + ".tmp", id_path)
+        with open(id_path) as f:
+            self.spool_id = f.read().strip()
+
+        self._finish_compactions()
+        numbers = [self._segment_number(name) for name in self._segment_names()]
+        self._last_seq = 0
+        for name in self._segment_names():
+            _, records, _ = read_segment(os.path.join(self.directory, name))
+            self._last_seq = max([self._last_seq] + [record[0] for record in records])
+        # Never append to a recovered segment: its last line may be torn
+        self._number = max(numbers, default=0) + 1
+        self._written = self._synced = 0
+        self._syncing = False
+        self._file = open(os.path.join(self.directory, _segment_name(self._number)), "ab", buffering=0)
+        self._file_bytes = 0
+
+    @staticmethod
+    def _claim_slot(directory):
+        slot = 0
+        while True:
+            path = os.path.join(directory, f"slot-{slot}")
+            os.makedirs(path, exist_ok=True)
+            handle = open(os.path.join(path, "lock"), "w")
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return path, handle
+            except BlockingIOError:
+                handle.close()
+                slot += 1
+
+    def close(self):
+        """Make every spooled click durable and release the slot"""
+        if self._file is None:
+            return
+        with self._io, self._lock:
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+        if self._slot_lock is not None:
+            self._slot_lock.close()
+            self._slot_lock = None
+        with self._synced_cond:
+            self._synced = self._written
+            self._synced_cond.notify_all()
+
+    def record(self, short_code, variant=None):
+        """
+        Spool one click
+        Args:
+            short_code: The short code that was followed
+            variant: Index of the destination chosen for a weighted link, or "r<index>" of a matched rule
+        Returns:
+            boolean: True once the click is in the spool (durable in "batch" mode),
+                     False if the spool is disabled or the write failed
+        """
+        try:
+            with self._lock:
+                if self._file is None:
+                    return False
+                seq = self._last_seq = max(time.time_ns(), self._last_seq + 1)
+                line = _encode_record(seq, short_code, 1, None if variant is None else {variant: 1})
+                self._file.write(line)
+                self._file_bytes += len(line)
+                self._written += 1
+                ticket = self._written
+                self.spooled += 1
+                rotate = self._file_bytes >= self.segment_bytes
+        except (OSError, ValueError) as e:
+            self.errors += 1
+            logging.error(f"Failed to spool click for {short_code}: {e}")
+            return False
+
+        # The line is written: from here on failures are logged, not reported, so the
+        # caller doesn't count the click a second time
+        try:
+            if rotate:
+                self._rotate()
+            if self.sync == "batch":
+                self._wait_durable(ticket)
+        except (OSError, ValueError) as e:
+            self.errors += 1
+            logging.error(f"Failed to sync click spool: {e}")
+        return True
+
+    def _wait_durable(self, ticket):
+        # Group commit: one caller fsyncs for everyone who wrote before it started
+        with self._synced_cond:
+            while self._synced < ticket:
+                if not self._syncing:
+                    self._syncing = True
+                    break
+                self._synced_cond.wait()
+            else:
+                return
+        try:
+            self.sync_now()
+        finally:
+            with self._synced_cond:
+                self._syncing = False
+                self._synced_cond.notify_all()
+
+    def sync_now(self):
+        """fsync everything written so far"""
+        with self._io:
+            with self._lock:
+                if self._file is None:
+                    return
+                target = self._written
+                fd = self._file.fileno()
+            os.fsync(fd)
+            self.fsyncs += 1
+        with self._synced_cond:
+            self._synced = max(self._synced, target)
+            self._synced_cond.notify_all()
+
+    def _rotate(self):
+        """Seal the active segment (durably) and start a new one"""
+        with self._io:
+            with self._lock:
+                if self._file is None or self._file_bytes == 0:
+                    return
+                os.fsync(self._file.fileno())
+                self.fsyncs += 1
+                self._file.close()
+                self._number += 1
+                self._file = open(os.path.join(self.directory, _segment_name(self._number)), "ab", buffering=0)
+                self._file_bytes = 0
+                target = self._written
+        with self._synced_cond:
+            self._synced = max(self._synced, target)
+            self._synced_cond.notify_all()
+
+    def _segment_names(self):
+        return sorted(name for name in os.listdir(self.directory)
+                      if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX))
+
+    @staticmethod
+    def _segment_number(name):
+        return int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+    def _sealed_segments(self):
+        with self._lock:
+            active = _segment_name(self._number) if self._file is not None else None
+        return [name for name in self._segment_names() if name != active]
+
+    def _finish_compactions(self):
+        # A compacted segment is renamed into place before its inputs are deleted;
+        # finish the deletes if a crash interrupted them
+        for name in self._segment_names():
+            replaces, _, _ = read_segment(os.path.join(self.directory, name))
+            for replaced in replaces:
+                try:
+                    os.remove(os.path.join(self.directory, replaced))
+                except FileNotFoundError:
+                    pass
+
+    def replay(self):
+        """
+        Apply spooled clicks to the database, oldest segment first
+        Stops at the first batch that fails; it is retried on the next call.
+        Returns:
+            int: Clicks applied
+        """
+        if not self.enabled or not self.apply_func:
+            return 0
+        with self._replaying:
+            self._rotate()
+            applied = 0
+            for name in self._sealed_segments():
+                path = os.path.join(self.directory, name)
+                _, records, corrupt = read_segment(path)
+                for start in range(0, len(records), self.replay_batch):
+                    clicks = {}
+                    for record in records[start:start + self.replay_batch]:
+                        _merge_click(clicks, *record)
+                    try:
+                        ok = self.apply_func(self.spool_id, clicks)
+                    except Exception as e:
+                        logging.error(f"Click replay failed: {e}")
+                        ok = False
+                    if not ok:
+                        self.errors += 1
+                        self._compact()
+                        return applied
+                    batch_clicks = sum(count for count, _, _ in clicks.values())
+                    applied += batch_clicks
+                    self.replayed += batch_clicks
+                if corrupt:
+                    self.corrupt += corrupt
+                    logging.error(f"Skipped {corrupt} corrupt click records in {name}")
+                os.remove(path)
+            return applied
+
+    def _compact(self):
+        """
+        Merge the backlog behind the oldest sealed segment while the database is unavailable
+        The oldest segment may be partly applied, so it is left alone; the others have
+        never been replayed, which makes merging their clicks per code (keeping the
+        highest seq) safe. The merged segment takes the newest input's name.
+        """
+        names = self._sealed_segments()[1:]
+        if len(names) < self.compact_segments:
+            return
+        clicks = {}
+        corrupt = 0
+        for name in names:
+            _, records, bad = read_segment(os.path.join(self.directory, name))
+            corrupt += bad
+            for record in records:
+                _merge_click(clicks, *record)
+        self.corrupt += corrupt
+
+        lines = [f"{REPLACES_HEADER}{','.join(names[:-1])}\n".encode()]
+        # Keep seq order so aggregation on replay still ends at each code's highest seq
+        for short_code, (count, seq, variants) in sorted(clicks.items(), key=lambda item: item[1][1]):
+            lines.append(_encode_record(seq, short_code, count, variants))
+        target = os.path.join(self.directory, names[-1])
+        with open(target + ".tmp", "wb") as f:
+            f.write(b"".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(target + ".tmp", target)
+        self._finish_compactions()
+        logging.info("Compacted %d click spool segments into %s", len(names), names[-1],
+                     extra={"route": "click_spool"})
+
+    def start(self, interval=1.0):
+        """
+        Replay (and in "interval" mode, fsync) in a daemon thread (idempotent)
+        Args:
+            interval: Seconds between replays
+        """
+        if not self.enabled or (self._thread and self._thread.is_alive()):
+            return
+        self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True, name="click-spool")
+        self._thread.start()
+
+    def _run(self, interval):
+        next_replay = 0
+        while True:
+            try:
+                if self.sync == "interval":
+                    self.sync_now()
+                if time.monotonic() >= next_replay:
+                    self.replay()
+                    next_replay = time.monotonic() + interval
+            except Exception as e:
+                logging.error(f"Click spool error: {e}")
+            time.sleep(min(interval, self.sync_interval) if self.sync == "interval" else interval)
+
+    def stats(self):
+        """Spool counters for metrics"""
+        pending = 0
+        if self.enabled:
+            pending = sum(os.path.getsize(os.path.join(self.directory, name)) for name in self._segment_names())
+        return {
+            "enabled": self.enabled,
+            "sync": self.sync,
+            "spooled": self.spooled,
+            "replayed": self.replayed,
+            "pending_bytes": pending,
+            "fsyncs": self.fsyncs,
+            "corrupt": self.corrupt,
+            "errors": self.errors
+        }
+
+
+def _apply_to_storage(spool_id, clicks):
+    from models.url_mapping import URLMapping
+    return URLMapping.apply_clicks(spool_id, clicks)
+
+
+def create_click_spool():
+    """Spool in CLICK_SPOOL_DIR, or a disabled spool when it's not set"""
+    spool = ClickSpool(
+        apply_func=_apply_to_storage,
+        sync=os.getenv('CLICK_SPOOL_SYNC', 'batch'),
+        sync_interval=float(os.getenv('CLICK_SPOOL_SYNC_INTERVAL_SECONDS', '0.05')),
+        segment_bytes=int(os.getenv('CLICK_SPOOL_SEGMENT_BYTES', str(4 * 1024 * 1024))),
+        replay_batch=int(os.getenv('CLICK_SPOOL_REPLAY_BATCH', '500'))
+    )
+    directory = os.getenv('CLICK_SPOOL_DIR')
+    if directory:
+        try:
+            spool.open(directory)
+        except OSError as e:
+            logging.error(f"Click spool disabled, cannot use {directory}: {e}")
+    return spool
+
+
+# Global spool used by the redirect handler; started by create_app()
+click_spool = create_click_spool()
+
+atexit.register(click_spool.close)
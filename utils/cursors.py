@@ -0,0 +1,37 @@
+import base64
+import json
+
+
+def encode_cursor(position):
+    """
+    Turn a listing position into an opaque, URL-safe page token
+    Args:
+        position: (created_at, short_code) of the last item on a page, or None
+    Returns:
+        str: Cursor for the next page, or None when there is no next page
+    """
+    if position is None:
+        return None
+    raw = json.dumps(list(position), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Parse a page token produced by encode_cursor
+    Args:
+        cursor: Cursor string from a client
+    Returns:
+        tuple: (created_at, short_code)
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        position = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not (isinstance(position, list) and len(position) == 2
+            and all(isinstance(value, str) and value for value in position)):
+        raise ValueError("Invalid cursor")
+    return tuple(position)
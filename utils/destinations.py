@@ -0,0 +1,125 @@
+import random
+from utils.routing import evaluate
+
+# Most variants one link may split traffic across
+MAX_DESTINATIONS = 100
+
+
+def parse_destinations(data, validate_url):
+    """
+    Read the optional weighted destination list from a shorten request body
+    Accepts "destinations": [{"url": "https://...", "weight": 70}, ...] with
+    positive weights (they need not add up to 100).
+    Args:
+        data: Request JSON
+        validate_url: Callable(url) -> bool
+    Returns:
+        list or None: Normalized [{"url", "weight"}] destinations
+    Raises:
+        ValueError: If the list or any entry is malformed
+    """
+    destinations = data.get('destinations')
+    if destinations is None:
+        return None
+    if not isinstance(destinations, list) or not 2 <= len(destinations) <= MAX_DESTINATIONS:
+        raise ValueError(f"destinations must be a list of 2 to {MAX_DESTINATIONS} entries")
+
+    normalized = []
+    for entry in destinations:
+        url = entry.get('url') if isinstance(entry, dict) else None
+        weight = entry.get('weight', 1) if isinstance(entry, dict) else None
+        if not isinstance(url, str) or not validate_url(url):
+            raise ValueError("Every destination needs a valid url")
+        if isinstance(weight, bool) or not isinstance(weight, (int, float)) or not 0 < weight < float('inf'):
+            raise ValueError("Destination weights must be positive numbers")
+        normalized.append({"url": url, "weight": weight})
+    return normalized
+
+
+def build_alias_table(weights):
+    """
+    Vose's alias method: O(n) setup for O(1) weighted sampling
+    Column i is chosen uniformly; it yields i with probability prob[i], else alias[i].
+    Args:
+        weights: Positive weights
+    Returns:
+        list: [prob, alias], two lists as long as `weights` (JSON-friendly)
+    """
+    count = len(weights)
+    total = float(sum(weights))
+    scaled = [weight * count / total for weight in weights]
+    prob = [1.0] * count
+    alias = list(range(count))
+    small = [i for i, value in enumerate(scaled) if value < 1.0]
+    large = [i for i, value in enumerate(scaled) if value >= 1.0]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        prob[less] = scaled[less]
+        alias[less] = more
+        scaled[more] -= 1.0 - scaled[less]
+        (small if scaled[more] < 1.0 else large).append(more)
+    # Whatever is left is 1.0 up to rounding error
+    return [prob, alias]
+
+
+def choose_variant(alias_table, rand=None):
+    """
+    Pick a destination index from an alias table with one random draw
+    Args:
+        alias_table: [prob, alias] from build_alias_table
+        rand: Optional callable returning a float in [0, 1)
+    Returns:
+        int: Index into the mapping's destinations
+    """
+    prob, alias = alias_table
+    u = (rand or random.random)() * len(prob)
+    column = int(u)
+    return column if u - column < prob[column] else alias[column]
+
+
+def all_urls(result):
+    """Every URL a lookup result can redirect to"""
+    routing = result.get('routing')
+    return list(dict.fromkeys((result.get('destinations') or [result['original_url']]) +
+                              (routing['urls'] if routing else [])))
+
+
+def lookup_fields(destinations):
+    """
+    Fields a lookup result carries for a weighted link
+    The alias table is built once per backend read and cached with the result.
+    Args:
+        destinations: Stored [{"url", "weight"}] list, or None
+    Returns:
+        dict: {"destinations": [urls], "alias_table": [prob, alias]}, empty for single-URL links
+    """
+    if not destinations:
+        return {}
+    return {
+        "destinations": [destination["url"] for destination in destinations],
+        "alias_table": build_alias_table([destination["weight"] for destination in destinations])
+    }
+
+
+def pick_destination(result, get_header=None, now=None):
+    """
+    Destination for one redirect
+    Routing rules are checked first; without a matching rule, weighted links
+    pick a destination from their alias table.
+    Args:
+        result: URLMapping.get_mapping result
+        get_header: Callable(name) -> request header value, for routing rules
+        now: Optional naive UTC datetime, for time-window rules
+    Returns:
+        tuple: (url, variant: destination index, "r<rule index>" or None for the plain URL)
+    """
+    routing = result.get('routing')
+    if routing and get_header is not None:
+        rule = evaluate(routing, get_header, now)
+        if rule is not None:
+            return routing['urls'][rule], f"r{rule}"
+    destinations = result.get('destinations')
+    if not destinations:
+        return result['original_url'], None
+    variant = choose_variant(result['alias_table'])
+    return destinations[variant], variant
@@ -0,0 +1,234 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from utils.http_cache import parse_timestamp
+
+# Longest allowed link lifetime (10 years)
+MAX_TTL_SECONDS = 10 * 365 * 24 * 3600
+
+
+def format_timestamp(moment):
+    """
+    Format a datetime the way mappings store timestamps (naive UTC, fixed width)
+    The fixed width keeps string comparison and Firestore range queries in time order.
+    """
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment.isoformat(timespec='microseconds')
+
+
+def parse_expiry(data, now=None):
+    """
+    Read the optional expiry from a shorten request body
+    Accepts either "expires_at" (ISO-8601, UTC if no offset) or "ttl_seconds".
+    Args:
+        data: Request JSON
+        now: Optional current time (naive UTC datetime)
+    Returns:
+        str or None: Normalized expires_at timestamp
+    Raises:
+        ValueError: If the value is malformed, in the past or too far away
+    """
+    expires_at = data.get('expires_at')
+    ttl_seconds = data.get('ttl_seconds')
+    now = now or datetime.utcnow()
+
+    if expires_at is not None and ttl_seconds is not None:
+        raise ValueError("Provide either expires_at or ttl_seconds, not both")
+
+    if ttl_seconds is not None:
+        if isinstance(ttl_seconds, bool) or not isinstance(ttl_seconds, int) or ttl_seconds <= 0:
+            raise ValueError("ttl_seconds must be a positive integer")
+        if ttl_seconds > MAX_TTL_SECONDS:
+            raise ValueError("ttl_seconds is too large")
+        return format_timestamp(now + timedelta(seconds=ttl_seconds))
+
+    if expires_at is not None:
+        if not isinstance(expires_at, str):
+            raise ValueError("expires_at must be an ISO-8601 timestamp")
+        moment = parse_timestamp(expires_at)
+        if moment is None:
+            raise ValueError("expires_at must be an ISO-8601 timestamp")
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+        if moment <= now:
+            raise ValueError("expires_at must be in the future")
+        if (moment - now).total_seconds() > MAX_TTL_SECONDS:
+            raise ValueError("expires_at is too far in the future")
+        return format_timestamp(moment)
+
+    return None
+
+
+def seconds_until(expires_at, now=None):
+    """
+    Seconds left before a mapping expires
+    Returns:
+        float or None: Remaining seconds (<= 0 once expired), None if it never expires
+    """
+    moment = parse_timestamp(expires_at)
+    if moment is None:
+        return None
+    now = now or datetime.now(timezone.utc)
+    return (moment - now).total_seconds()
+
+
+def is_expired(expires_at, now=None):
+    """Check whether an expires_at timestamp has passed"""
+    remaining = seconds_until(expires_at, now)
+    return remaining is not None and remaining <= 0
+
+
+class ExpirySweeper:
+    """
+    Deletes expired mappings in the background without scanning the collection
+    Upcoming expirations sit in a min-heap keyed by expiry time. The heap only holds
+    links expiring within `horizon_seconds`; it is refilled from an indexed range
+    query on expires_at, so its size stays bounded however many links exist.
+    """
+
+    def __init__(self, find_func=None, delete_func=None, horizon_seconds=300, batch_size=500):
+        self.find_func = find_func  # (before_timestamp, limit) -> [(short_code, expires_at)]
+        self.delete_func = delete_func  # (short_code) -> bool, must re-check expiry
+        self.horizon_seconds = horizon_seconds
+        self.batch_size = batch_size
+        self._heap = []  # (expires_epoch, short_code)
+        self._scheduled = {}  # short_code -> expires_epoch of its live heap entry
+        self._horizon_end = 0  # everything expiring before this is in the heap
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.deleted_count = 0
+
+    def schedule(self, short_code, expires_at):
+        """
+        Track a newly created link if it expires inside the current horizon
+        Later expirations are picked up by the next range query.
+        """
+        moment = parse_timestamp(expires_at)
+        if moment is None:
+            return
+        expires_epoch = moment.timestamp()
+        with self._lock:
+            if expires_epoch <= self._horizon_end:
+                self._push(short_code, expires_epoch)
+                self._wakeup.set()
+
+    def refill(self, now=None):
+        """
+        Load upcoming expirations from storage via an indexed range query
+        Returns:
+            int: Number of mappings added to the heap
+        """
+        if not self.find_func:
+            return 0
+        now = time.time() if now is None else now
+        horizon_end = now + self.horizon_seconds
+        before = format_timestamp(datetime.fromtimestamp(horizon_end, timezone.utc))
+
+        results = self.find_func(before, self.batch_size)
+        added = 0
+        with self._lock:
+            for short_code, expires_at in results:
+                moment = parse_timestamp(expires_at)
+                if moment is not None and self._push(short_code, moment.timestamp()):
+                    added += 1
+            # A full page means there may be more; only trust the heap up to its last entry
+            if len(results) >= self.batch_size and results:
+                last = parse_timestamp(results[-1][1])
+                horizon_end = min(horizon_end, last.timestamp()) if last else now
+            self._horizon_end = horizon_end
+        return added
+
+    def sweep(self, now=None):
+        """
+        Delete every mapping in the heap whose expiry has passed
+        Returns:
+            int: Number of mappings deleted
+        """
+        now = time.time() if now is None else now
+        deleted = 0
+        while True:
+            with self._lock:
+                if not self._heap or self._heap[0][0] > now:
+                    break
+                expires_epoch, short_code = heapq.heappop(self._heap)
+                if self._scheduled.get(short_code) != expires_epoch:
+                    continue  # superseded by a newer expiry for the same link
+                del self._scheduled[short_code]
+            try:
+                if self.delete_func and self.delete_func(short_code):
+                    deleted += 1
+            except Exception as e:
+                logging.error(f"Failed to delete expired mapping {short_code}: {e}")
+        self.deleted_count += deleted
+        return deleted
+
+    def next_deadline(self):
+        """Epoch time of the next scheduled expiry, or None"""
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def start(self, interval=60):
+        """
+        Run the sweeper in a daemon thread (idempotent)
+        Args:
+            interval: Seconds between range queries
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True, name="expiry-sweeper")
+        self._thread.start()
+
+    def reset(self):
+        """Forget all scheduled expirations"""
+        with self._lock:
+            self._heap = []
+            self._scheduled = {}
+            self._horizon_end = 0
+
+    def _push(self, short_code, expires_epoch):
+        if self._scheduled.get(short_code) == expires_epoch:
+            return False
+        # A changed expiry leaves the old heap entry behind; sweep() skips it
+        heapq.heappush(self._heap, (expires_epoch, short_code))
+        self._scheduled[short_code] = expires_epoch
+        return True
+
+    def _run(self, interval):
+        next_refill = 0
+        while True:
+            now = time.time()
+            try:
+                if now >= next_refill:
+                    self.refill(now)
+                    next_refill = now + min(interval, self.horizon_seconds)
+                self.sweep(now)
+            except Exception as e:
+                logging.error(f"Expiry sweeper error: {e}")
+
+            deadline = self.next_deadline()
+            wait_until = next_refill if deadline is None else min(next_refill, deadline)
+            self._wakeup.wait(max(0.05, wait_until - time.time()))
+            self._wakeup.clear()
+
+
+def _find_expiring(before, limit):
+    from models.url_mapping import URLMapping
+    return URLMapping.find_expiring(before, limit)
+
+
+def _delete_expired(short_code):
+    from models.url_mapping import URLMapping
+    return URLMapping.delete_if_expired(short_code)
+
+
+# Global sweeper, started by create_app() when EXPIRY_SWEEPER_ENABLED is true
+expiry_sweeper = ExpirySweeper(
+    find_func=_find_expiring,
+    delete_func=_delete_expired,
+    horizon_seconds=int(os.getenv('EXPIRY_SWEEP_HORIZON_SECONDS', '300')),
+    batch_size=int(os.getenv('EXPIRY_SWEEP_BATCH_SIZE', '500'))
+)
@@ -0,0 +1,146 @@
+import logging
+from http import HTTPStatus
+from werkzeug.urls import iri_to_uri
+from utils.mapping_cache import mapping_cache
+from utils.http_cache import redirect_cache_policy
+from utils.expiry import is_expired
+from utils.destinations import pick_destination, all_urls
+
+MAX_SHORT_CODE_LENGTH = 20
+
+
+class FastRedirectMiddleware:
+    """
+    WSGI middleware that answers cached redirects before Flask sees the request
+    A GET for /<short_code> whose mapping is fresh in the per-process cache gets
+    a prebuilt minimal redirect (status line and headers, empty body) without a
+    request context, routing or response object. Misses, stale entries, 404s and
+    every other path fall through to the wrapped Flask app unchanged, so the
+    slow path still handles loading, refreshing and error pages.
+    """
+
+    def __init__(self, wsgi_app, reserved_paths=(), record=None, max_prebuilt=10000):
+        """
+        Args:
+            wsgi_app: The wrapped WSGI application (Flask's app.wsgi_app)
+            reserved_paths: Single-segment paths owned by other routes, e.g. "/health"
+            record: Callable(short_code, original_url, remote_addr, user_agent, variant) run
+                    on every fast redirect (click counting, analytics, logging)
+            max_prebuilt: Prebuilt responses kept before the table is reset
+        """
+        self.wsgi_app = wsgi_app
+        self.reserved_paths = frozenset(reserved_paths)
+        self.record = record
+        self.max_prebuilt = max_prebuilt
+        self._prebuilt = {}  # short_code -> (cached lookup result, status line, headers per destination)
+        # Plain counters: approximate under concurrency, which is fine for metrics
+        self.hits = 0
+        self.fallthroughs = 0
+        self.errors = 0
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if environ.get('REQUEST_METHOD') == 'GET' and path not in self.reserved_paths:
+            short_code = path[1:]
+            if 0 < len(short_code) <= MAX_SHORT_CODE_LENGTH and short_code.isascii() and \
+                    short_code.replace('-', '').replace('_', '').isalnum():
+                try:
+                    prebuilt = self._cached_response(short_code)
+                except Exception as e:
+                    self.errors += 1
+                    logging.error(f"Fast path failed for {short_code}: {e}")
+                    prebuilt = None
+                if prebuilt is not None:
+                    result, status, headers = prebuilt
+                    if result.get('destinations') or result.get('routing'):
+                        url, variant = pick_destination(result, lambda name: environ.get(_environ_key(name)))
+                    else:
+                        url, variant = result['original_url'], None
+                    self._record(short_code, url, environ, variant)
+                    self.hits += 1
+                    start_response(status, list(headers[url]))
+                    return [b""]
+        self.fallthroughs += 1
+        return self.wsgi_app(environ, start_response)
+
+    def _record(self, short_code, location, environ, variant):
+        # Analytics failures must not turn a known redirect into an error
+        if self.record is None:
+            return
+        try:
+            self.record(short_code, location, environ.get('REMOTE_ADDR'), environ.get('HTTP_USER_AGENT'), variant)
+        except Exception as e:
+            self.errors += 1
+            logging.error(f"Failed to record fast redirect for {short_code}: {e}")
+
+    def _cached_response(self, short_code):
+        """Prebuilt (result, status, headers) for a fresh cached hit, else None"""
+        result, fresh = mapping_cache.lookup(short_code)
+        if not fresh or not result.get('exists') or not result.get('original_url'):
+            return None
+
+        prebuilt = self._prebuilt.get(short_code)
+        if prebuilt is not None and prebuilt[0] is result:
+            return prebuilt
+
+        if result.get('expires_at'):
+            # max-age shrinks as the expiry approaches, so these are built per request
+            if is_expired(result['expires_at']):
+                return None
+            return self._build(result)
+
+        prebuilt = self._build(result)
+        if len(self._prebuilt) >= self.max_prebuilt:
+            self._prebuilt.clear()
+        self._prebuilt[short_code] = prebuilt
+        return prebuilt
+
+    @staticmethod
+    def _build(result):
+        status_code, cache_control = redirect_cache_policy(result)
+        status = f"{status_code} {HTTPStatus(status_code).phrase}"
+        # One header set per reachable URL; weighted and routed links pick one per request
+        headers = {
+            url: (
+                ('Location', iri_to_uri(url)),
+                ('Cache-Control', cache_control),
+                ('Content-Length', '0')
+            )
+            for url in all_urls(result)
+        }
+        return result, status, headers
+
+    def stats(self):
+        """Fast path counters for metrics"""
+        return {
+            "hits": self.hits,
+            "fallthroughs": self.fallthroughs,
+            "errors": self.errors,
+            "prebuilt_responses": len(self._prebuilt)
+        }
+
+
+def _environ_key(header):
+    # WSGI exposes request headers as HTTP_<NAME> with dashes turned into underscores
+    return 'HTTP_' + header.upper().replace('-', '_')
+
+
+def reserved_paths(app):
+    """Single-segment paths (like /health) owned by routes other than the redirect"""
+    return {rule.rule for rule in app.url_map.iter_rules()
+            if not rule.arguments and rule.rule.count('/') == 1}
+
+
+def install_fast_path(app, record):
+    """
+    Wrap a Flask app's WSGI callable with FastRedirectMiddleware
+    Single-segment routes registered on the app (like /health) are excluded so
+    they are never mistaken for short codes.
+    Args:
+        app: Flask application with its blueprints registered
+        record: Side effects of a redirect, see FastRedirectMiddleware
+    Returns:
+        FastRedirectMiddleware: The installed middleware
+    """
+    app.wsgi_app = FastRedirectMiddleware(app.wsgi_app, reserved_paths(app), record)
+    return app.wsgi_app
@@ -0,0 +1,224 @@
+import heapq
+import math
+import os
+import threading
+import time
+
+# Largest sketch accepted from a client; from_dict allocates one counter per item
+MAX_SKETCH_CAPACITY = 10000
+
+
+class SpaceSaving:
+    """
+    Space-Saving summary of the most frequent keys in a stream
+    Keeps at most `capacity` counters no matter how many distinct keys are seen.
+    Each counter carries an error bound: the true count lies in [count - error, count].
+    """
+
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self.counters = {}  # key -> [count, error]
+        self._heap = []  # lazy min-heap of (count, key); stale entries are skipped
+
+    def add(self, key, weight=1):
+        """
+        Count one (or `weight`) occurrences of a key
+        Args:
+            key: The key to count (e.g. a short code)
+            weight: Amount to add
+        """
+        entry = self.counters.get(key)
+        if entry is not None:
+            entry[0] += weight
+        elif len(self.counters) < self.capacity:
+            entry = self.counters[key] = [weight, 0]
+        else:
+            # Replace the smallest counter; its count becomes the new key's error bound
+            min_count, min_key = self._pop_min()
+            del self.counters[min_key]
+            entry = self.counters[key] = [min_count + weight, min_count]
+
+        heapq.heappush(self._heap, (entry[0], key))
+        if len(self._heap) > 4 * self.capacity:
+            self._rebuild_heap()
+
+    def min_count(self):
+        """
+        Smallest tracked count, or 0 while the summary still has free counters
+        Returns:
+            number: Upper bound for the count of any untracked key
+        """
+        if len(self.counters) < self.capacity:
+            return 0
+        min_count, min_key = self._pop_min()
+        heapq.heappush(self._heap, (min_count, min_key))
+        return min_count
+
+    def merge(self, other):
+        """
+        Merge another summary into this one (counts and error bounds are summed)
+        Args:
+            other: SpaceSaving instance, possibly from another worker
+        """
+        own_min = self.min_count()
+        other_min = other.min_count()
+        merged = {}
+
+        for key in set(self.counters) | set(other.counters):
+            own = self.counters.get(key, [own_min, own_min])
+            theirs = other.counters.get(key, [other_min, other_min])
+            merged[key] = [own[0] + theirs[0], own[1] + theirs[1]]
+
+        if len(merged) > self.capacity:
+            kept = heapq.nlargest(self.capacity, merged.items(), key=lambda item: item[1][0])
+            merged = dict(kept)
+
+        self.counters = merged
+        self._rebuild_heap()
+
+    def scaled(self, factor):
+        """
+        Return a copy with all counts multiplied by `factor` (used for decay)
+        """
+        copy = SpaceSaving(self.capacity)
+        copy.counters = {key: [count * factor, error * factor]
+                         for key, (count, error) in self.counters.items()}
+        copy._rebuild_heap()
+        return copy
+
+    def top(self, n=10):
+        """
+        Return the n keys with the highest counts
+        Returns:
+            list: (key, count, error) tuples, highest count first
+        """
+        items = heapq.nlargest(n, self.counters.items(), key=lambda item: item[1][0])
+        return [(key, count, error) for key, (count, error) in items]
+
+    def to_dict(self):
+        """Serialize the summary to a JSON-friendly dict"""
+        return {
+            "capacity": self.capacity,
+            "items": [[key, count, error] for key, (count, error) in self.counters.items()]
+        }
+
+    @staticmethod
+    def from_dict(data, max_capacity=MAX_SKETCH_CAPACITY):
+        """
+        Build a summary from `to_dict` output
+        Args:
+            data: Serialized summary, possibly sent by a client
+            max_capacity: Largest capacity accepted
+        Raises:
+            ValueError: If the payload is malformed, too large or has more items than its capacity
+        """
+        try:
+            capacity = int(data["capacity"])
+            items = data["items"]
+            if not 1 <= capacity <= max_capacity:
+                raise ValueError(f"capacity must be between 1 and {max_capacity}")
+            if len(items) > capacity:
+                raise ValueError("more items than capacity")
+            summary = SpaceSaving(capacity)
+            for key, count, error in items:
+                count, error = float(count), float(error)
+                if not (math.isfinite(count) and 0 <= error <= count):
+                    raise ValueError("counts must be finite with 0 <= error <= count")
+                summary.counters[str(key)] = [count, error]
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid sketch payload: {e}")
+
+        summary._rebuild_heap()
+        return summary
+
+    def _pop_min(self):
+        while self._heap:
+            count, key = heapq.heappop(self._heap)
+            entry = self.counters.get(key)
+            if entry is not None and entry[0] == count:
+                return count, key
+        # Heap lost track of a counter (only after external edits); rebuild and retry
+        self._rebuild_heap()
+        return heapq.heappop(self._heap)
+
+    def _rebuild_heap(self):
+        self._heap = [(entry[0], key) for key, entry in self.counters.items()]
+        heapq.heapify(self._heap)
+
+
+class SlidingTopK:
+    """
+    Heavy-hitter tracking over a sliding time window
+    The window is split into `num_windows` buckets of `window_seconds`, each with its
+    own Space-Saving summary, so memory stays at capacity * num_windows counters.
+    Older buckets are weighted by `decay` ** age when answering queries.
+    """
+
+    def __init__(self, capacity=200, window_seconds=60, num_windows=5, decay=0.5):
+        self.capacity = capacity
+        self.window_seconds = window_seconds
+        self.num_windows = num_windows
+        self.decay = decay
+        self._buckets = {}  # bucket index -> SpaceSaving
+        self._lock = threading.Lock()
+
+    def add(self, key, weight=1, now=None):
+        """
+        Record an event for a key
+        Args:
+            key: The key to count (e.g. a short code)
+            weight: Amount to add
+            now: Optional timestamp (defaults to time.time())
+        """
+        index = self._bucket_index(now)
+        with self._lock:
+            bucket = self._buckets.get(index)
+            if bucket is None:
+                bucket = self._buckets[index] = SpaceSaving(self.capacity)
+                self._expire(index)
+            bucket.add(key, weight)
+
+    def snapshot(self, now=None):
+        """
+        Merge the live buckets into a single decayed summary
+        Returns:
+            SpaceSaving: Combined summary for the current window
+        """
+        current = self._bucket_index(now)
+        combined = SpaceSaving(self.capacity)
+        with self._lock:
+            self._expire(current)
+            for index, bucket in self._buckets.items():
+                age = current - index
+                combined.merge(bucket if age == 0 or self.decay == 1 else bucket.scaled(self.decay ** age))
+        return combined
+
+    def top(self, n=10, now=None):
+        """
+        Return the n hottest keys in the current window
+        Returns:
+            list: (key, count, error) tuples, highest count first
+        """
+        return self.snapshot(now).top(n)
+
+    def reset(self):
+        """Drop all tracked counts"""
+        with self._lock:
+            self._buckets.clear()
+
+    def _bucket_index(self, now):
+        return int((now if now is not None else time.time()) // self.window_seconds)
+
+    def _expire(self, current):
+        oldest = current - self.num_windows + 1
+        for index in [i for i in self._buckets if i < oldest]:
+            del self._buckets[index]
+
+
+# Global tracker fed by the redirect handler
+hot_links = SlidingTopK(
+    capacity=int(os.getenv('HOT_LINKS_CAPACITY', '200')),
+    window_seconds=int(os.getenv('HOT_LINKS_WINDOW_SECONDS', '60')),
+    num_windows=int(os.getenv('HOT_LINKS_WINDOWS', '5')),
+    decay=float(os.getenv('HOT_LINKS_DECAY', '0.5'))
+)
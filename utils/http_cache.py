@@ -0,0 +1,80 @@
+import logging
+import os
+from datetime import datetime, timezone
+from flask import jsonify, request
+
+
+def redirect_cache_policy(mapping):
+    """
+    Decide the redirect status code and Cache-Control header for a mapping
+    Immutable links get a permanent redirect that browsers and CDNs may cache, but
+    only for REDIRECT_IMMUTABLE_MAX_AGE seconds so a deactivation still takes effect
+    within a bounded time. Other links, and weighted or routed links even when immutable, get a
+    302 with a short private max-age. Neither is cached past the link's expiry.
+    Args:
+        mapping: Result of URLMapping.get_mapping
+    Returns:
+        tuple: (status_code, cache_control_header)
+    """
+    # Shared caches would pin every visitor of a weighted or routed link to one destination
+    if mapping.get('immutable') and not mapping.get('destinations') and not mapping.get('routing'):
+        status = int(os.getenv('REDIRECT_IMMUTABLE_STATUS', '301'))
+        max_age = int(os.getenv('REDIRECT_IMMUTABLE_MAX_AGE', '86400'))
+        scope = "public"
+    else:
+        status = 302
+        max_age = int(os.getenv('REDIRECT_MAX_AGE', '60'))
+        scope = "private"
+
+    expires_at = parse_timestamp(mapping.get('expires_at'))
+    if expires_at:
+        remaining = int((expires_at - datetime.now(timezone.utc)).total_seconds())
+        max_age = min(max_age, remaining)
+
+    if max_age <= 0:
+        return 302, "no-cache"
+    return status, f"{scope}, max-age={max_age}"
+
+
+def parse_timestamp(value):
+    """
+    Parse a stored ISO-8601 timestamp into an aware UTC datetime
+    Returns:
+        datetime or None if the value is missing or malformed
+    """
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            logging.warning(f"Unparseable timestamp: {value}")
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def conditional_json(payload, last_modified=None):
+    """
+    Build a JSON response with ETag / Last-Modified validators
+    Returns 304 Not Modified when the request's If-None-Match or
+    If-Modified-Since headers show the client already has this version.
+    Args:
+        payload: JSON-serializable response body
+        last_modified: Optional timestamp (ISO string or datetime) of the last change
+    Returns:
+        Response: 200 with body, or 304 without
+    """
+    response = jsonify(payload)
+    response.add_etag()
+
+    modified = parse_timestamp(last_modified)
+    if modified:
+        response.last_modified = modified.replace(microsecond=0)
+
+    max_age = int(os.getenv('STATS_MAX_AGE', '0'))
+    response.headers['Cache-Control'] = f"private, max-age={max_age}" if max_age > 0 else "no-cache"
+    return response.make_conditional(request)
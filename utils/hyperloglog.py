@@ -0,0 +1,135 @@
+import math
+import struct
+
+# Serialization markers
+SPARSE_FORMAT = b'S'
+DENSE_FORMAT = b'D'
+
+
+class HyperLogLog:
+    """
+    HyperLogLog cardinality sketch over 64-bit hashes
+    Small sketches use a sparse register map and switch to a dense register array
+    (2 ** precision bytes, 4 KB at the default precision) once that becomes smaller.
+    Standard error is about 1.04 / sqrt(2 ** precision), ~1.6% at precision 12.
+    """
+
+    def __init__(self, precision=12):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16")
+        self.precision = precision
+        self.num_registers = 1 << precision
+        self.sparse = {}  # register index -> rank, while the sketch is small
+        self.registers = None  # bytearray once converted to dense
+
+    @property
+    def is_sparse(self):
+        return self.registers is None
+
+    def add_hash(self, value):
+        """
+        Add a 64-bit hash value to the sketch
+        Args:
+            value: Unsigned 64-bit integer hash of the item
+        """
+        index = value >> (64 - self.precision)
+        remainder = value & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remainder.bit_length() + 1
+        self._set_register(index, rank)
+
+    def merge(self, other):
+        """
+        Merge another sketch into this one (register-wise max)
+        Merging is idempotent, so re-merging the same sketch is harmless.
+        """
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches with different precision")
+        if other.is_sparse:
+            for index, rank in other.sparse.items():
+                self._set_register(index, rank)
+        else:
+            self._to_dense()
+            self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def estimate(self):
+        """
+        Estimate the number of distinct items added
+        Returns:
+            int: Approximate cardinality
+        """
+        m = self.num_registers
+        if self.is_sparse:
+            zeros = m - len(self.sparse)
+            ranks = self.sparse.values()
+        else:
+            zeros = self.registers.count(0)
+            ranks = (rank for rank in self.registers if rank)
+
+        if zeros == m:
+            return 0
+
+        alpha = 0.7213 / (1 + 1.079 / m)
+        harmonic = zeros + sum(2.0 ** -rank for rank in ranks)
+        raw = alpha * m * m / harmonic
+
+        # Linear counting is more accurate for small cardinalities
+        if raw <= 2.5 * m and zeros:
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+    def to_bytes(self):
+        """
+        Serialize the sketch compactly
+        Returns:
+            bytes: Format marker, precision and either sparse entries or dense registers
+        """
+        header = struct.pack('>cB', SPARSE_FORMAT if self.is_sparse else DENSE_FORMAT, self.precision)
+        if self.is_sparse:
+            entries = sorted(self.sparse.items())
+            return header + struct.pack(f'>{len(entries)}I', *((index << 6) | rank for index, rank in entries))
+        return header + bytes(self.registers)
+
+    @staticmethod
+    def from_bytes(data):
+        """
+        Restore a sketch serialized with `to_bytes`
+        Raises:
+            ValueError: If the payload is malformed
+        """
+        if not data or len(data) < 2:
+            raise ValueError("Empty HyperLogLog payload")
+        marker, precision = struct.unpack('>cB', data[:2])
+        sketch = HyperLogLog(precision)
+        body = data[2:]
+
+        if marker == SPARSE_FORMAT:
+            if len(body) % 4:
+                raise ValueError("Truncated sparse HyperLogLog payload")
+            for packed in struct.unpack(f'>{len(body) // 4}I', body):
+                sketch._set_register(packed >> 6, packed & 0x3F)
+        elif marker == DENSE_FORMAT:
+            if len(body) != sketch.num_registers:
+                raise ValueError("Dense HyperLogLog payload has the wrong size")
+            sketch.registers = bytearray(body)
+        else:
+            raise ValueError("Unknown HyperLogLog format")
+        return sketch
+
+    def _set_register(self, index, rank):
+        if self.is_sparse:
+            if rank > self.sparse.get(index, 0):
+                self.sparse[index] = rank
+                # A sparse entry costs 4 bytes, a dense register 1 byte
+                if len(self.sparse) * 4 >= self.num_registers:
+                    self._to_dense()
+        elif rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def _to_dense(self):
+        if not self.is_sparse:
+            return
+        registers = bytearray(self.num_registers)
+        for index, rank in self.sparse.items():
+            registers[index] = rank
+        self.registers = registers
+        self.sparse = {}
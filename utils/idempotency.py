@@ -0,0 +1,293 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request, jsonify, make_response
+from utils.rate_limiter import rate_limiter
+from utils.shared_cache import get_shared_cache, encode_value, decode_value
+
+# Longest Idempotency-Key header accepted
+MAX_KEY_LENGTH = 255
+# Seconds between shared store checks while another instance runs the request
+SHARED_POLL_SECONDS = 0.05
+
+
+class IdempotencyConflict(Exception):
+    """An Idempotency-Key was reused with a different request body"""
+
+
+class IdempotencyInProgress(Exception):
+    """The request holding an Idempotency-Key didn't finish within the wait limit"""
+
+
+class _Entry:
+    """One key in the in-process store: in flight until `done` is set"""
+
+    __slots__ = ("fingerprint", "done", "record", "expires_at")
+
+    def __init__(self, fingerprint, expires_at):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.record = None
+        self.expires_at = expires_at
+
+
+def storable(status):
+    """
+    Whether a response may be replayed for retries
+    Server errors and 429s are not: the retry should actually run again.
+    """
+    return status < 500 and status != 429
+
+
+class IdempotencyStore:
+    """
+    Remembers responses by idempotency key so retried requests get the original one
+    Keys live in an OrderedDict in completion order, bounded by `max_keys` and
+    expired after `ttl_seconds`, like the in-process rate limit store. The first
+    request for a key runs; duplicates arriving meanwhile wait on it instead of
+    racing it. With a shared cache tier, the key is also claimed there with an
+    atomic add, so duplicates landing on other instances wait for (and replay)
+    the same response. A broken shared tier fails open to per-instance behaviour.
+    """
+
+    def __init__(self, max_keys=10000, ttl_seconds=86400, wait_seconds=10, lease_seconds=30,
+                 shared_cache=get_shared_cache):
+        """
+        Args:
+            max_keys: Keys kept in process before the oldest are evicted
+            ttl_seconds: How long a completed response is replayed
+            wait_seconds: How long a duplicate waits for the request holding its key
+            lease_seconds: How long a claim in the shared tier outlives a crashed instance
+            shared_cache: Callable returning the shared cache tier or None
+        """
+        self.max_keys = max_keys
+        self.ttl_seconds = ttl_seconds
+        self.wait_seconds = wait_seconds
+        self.lease_seconds = lease_seconds
+        self.shared_cache = shared_cache
+        self._entries = OrderedDict()  # key -> _Entry
+        self._lock = threading.Lock()
+        # Plain counters: approximate under concurrency, which is fine for metrics
+        self.executed = 0
+        self.replayed = 0
+        self.waited = 0
+        self.conflicts = 0
+        self.timeouts = 0
+        self.evictions = 0
+
+    def run(self, key, fingerprint, func):
+        """
+        Run func() once per key, or return the response an earlier run stored
+        Args:
+            key: Idempotency key, already scoped to the caller
+            fingerprint: Hash of the request; reusing a key for another request is an error
+            func: Callable returning a record (status, body, mimetype)
+        Returns:
+            tuple: (record, replayed)
+        Raises:
+            IdempotencyConflict: The key belongs to a different request
+            IdempotencyInProgress: The key's request is still running after wait_seconds
+        """
+        deadline = time.monotonic() + self.wait_seconds
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry.expires_at <= now and entry.record is not None:
+                    entry = None
+                leader = entry is None
+                if leader:
+                    entry = self._entries[key] = _Entry(fingerprint, now + self.lease_seconds)
+                    self._entries.move_to_end(key)
+                    self._evict(now)
+            if entry.fingerprint != fingerprint:
+                self.conflicts += 1
+                raise IdempotencyConflict(key)
+            if leader:
+                break
+            if entry.record is None:
+                self.waited += 1
+                if not entry.done.wait(max(0.0, deadline - now)):
+                    self.timeouts += 1
+                    raise IdempotencyInProgress(key)
+            if entry.record is not None:
+                self.replayed += 1
+                return entry.record, True
+            # The request holding the key ended without a replayable response: run it here
+
+        try:
+            record, replayed = self._run_shared(key, fingerprint, func, deadline)
+        except BaseException:
+            self._finish(key, entry, None)
+            raise
+        self._finish(key, entry, record if storable(record[0]) else None)
+        if replayed:
+            self.replayed += 1
+        return record, replayed
+
+    def _finish(self, key, entry, record):
+        with self._lock:
+            if record is not None:
+                entry.record = record
+                entry.expires_at = time.monotonic() + self.ttl_seconds
+                if self._entries.get(key) is entry:
+                    self._entries.move_to_end(key)
+            elif self._entries.get(key) is entry:
+                del self._entries[key]
+        entry.done.set()
+
+    def _run_shared(self, key, fingerprint, func, deadline):
+        shared = self.shared_cache()
+        if shared is None:
+            self.executed += 1
+            return func(), False
+
+        shared_key = "idempotency:" + key
+        while True:
+            try:
+                claimed = shared.add(shared_key, encode_value({"fingerprint": fingerprint}), self.lease_seconds)
+                value = None if claimed else decode_value(shared.get(shared_key) or b'')
+            except Exception as e:
+                logging.error(f"Idempotency shared store error, continuing without it: {e}")
+                self.executed += 1
+                return func(), False
+
+            if claimed:
+                break
+            # None: the claim expired or was released between add and get, so try again
+            if value is not None:
+                if value.get("fingerprint") != fingerprint:
+                    self.conflicts += 1
+                    raise IdempotencyConflict(key)
+                if "status" in value:
+                    return (value["status"], value["body"].encode(), value["mimetype"]), True
+            if time.monotonic() >= deadline:
+                self.timeouts += 1
+                raise IdempotencyInProgress(key)
+            time.sleep(SHARED_POLL_SECONDS)
+
+        self.executed += 1
+        try:
+            record = func()
+        except BaseException:
+            self._release_shared(shared, shared_key)
+            raise
+        status, body, mimetype = record
+        try:
+            if storable(status):
+                shared.set(shared_key, encode_value({"fingerprint": fingerprint, "status": status,
+                                                     "body": body.decode(), "mimetype": mimetype}),
+                           self.ttl_seconds)
+            else:
+                shared.delete(shared_key)
+        except Exception as e:
+            logging.error(f"Failed to store idempotent response in the shared store: {e}")
+        return record, False
+
+    @staticmethod
+    def _release_shared(shared, shared_key):
+        try:
+            shared.delete(shared_key)
+        except Exception as e:
+            logging.error(f"Failed to release idempotency claim: {e}")
+
+    def _evict(self, now):
+        # Front of the dict finished first; in-flight entries only go when over capacity
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if len(self._entries) > self.max_keys or entry.expires_at <= now:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            else:
+                break
+
+    def reset(self):
+        """Forget every key (mainly for tests)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Idempotency counters for metrics"""
+        with self._lock:
+            entries = len(self._entries)
+        return {
+            "entries": entries,
+            "executed": self.executed,
+            "replayed": self.replayed,
+            "waited": self.waited,
+            "conflicts": self.conflicts,
+            "timeouts": self.timeouts,
+            "evictions": self.evictions
+        }
+
+
+# Global store for Idempotency-Key handling
+idempotency_store = IdempotencyStore(
+    max_keys=int(os.getenv('IDEMPOTENCY_MAX_KEYS', '10000')),
+    ttl_seconds=float(os.getenv('IDEMPOTENCY_TTL_SECONDS', '86400')),
+    wait_seconds=float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', '10')),
+    lease_seconds=float(os.getenv('IDEMPOTENCY_LEASE_SECONDS', '30')),
+    shared_cache=get_shared_cache if os.getenv('IDEMPOTENCY_SHARED', 'true').lower() == 'true' else lambda: None
+)
+
+
+def idempotent(scope):
+    """
+    Decorator that honours an Idempotency-Key header on a view
+    Requests without the header run as usual. With it, the first request for a
+    key (per caller) runs and its response is replayed to retries, marked with
+    Idempotent-Replayed: true. Reusing a key for a different body is a 422; a
+    duplicate that outwaits the original request gets a 409 with Retry-After.
+    Args:
+        scope: Name separating keys of different endpoints, e.g. "shorten"
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            header = request.headers.get('Idempotency-Key')
+            if header is None:
+                return view(*args, **kwargs)
+            if not 0 < len(header) <= MAX_KEY_LENGTH or not header.isascii() or not header.isprintable():
+                return jsonify({
+                    "success": False,
+                    "error": f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} printable ASCII characters"
+                }), 400
+
+            # Scoped to the caller, so one client's key can never replay another's response
+            key = hashlib.sha256(f"{scope}\n{rate_limiter.client_key()}\n{header}".encode()).hexdigest()
+            fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+            response = None
+
+            def run_view():
+                nonlocal response
+                response = make_response(view(*args, **kwargs))
+                return response.status_code, response.get_data(), response.mimetype
+
+            try:
+                (status, body, mimetype), replayed = idempotency_store.run(key, fingerprint, run_view)
+            except IdempotencyConflict:
+                return jsonify({
+                    "success": False,
+                    "error": "Idempotency-Key was already used for a different request"
+                }), 422
+            except IdempotencyInProgress:
+                conflict = jsonify({
+                    "success": False,
+                    "error": "A request with this Idempotency-Key is still in progress"
+                })
+                conflict.status_code = 409
+                conflict.headers['Retry-After'] = '1'
+                return conflict
+
+            if not replayed:
+                return response
+            replay = make_response(body, status)
+            replay.mimetype = mimetype
+            replay.headers['Idempotent-Replayed'] = 'true'
+            return replay
+        return wrapper
+    return decorator
@@ -0,0 +1,207 @@
+import atexit
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+
+# Per-instance Pub/Sub subscriptions delete themselves after this long without a
+# subscriber (Pub/Sub's minimum), so instances that die without close() don't leak them
+SUBSCRIPTION_EXPIRATION_SECONDS = 86400
+# Invalidations older than the lookup cache TTL are useless; keep the backlog short
+# (Pub/Sub's minimum retention)
+MESSAGE_RETENTION_SECONDS = 600
+
+class InvalidationBus:
+    """
+    Broadcasts "short code changed to version N" messages to every instance
+    Subscribers (the per-process lookup caches) are called with
+    (short_code, version). Publishing always delivers locally first.
+    """
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex
+        self._subscribers = []
+        self.published = 0
+        self.received = 0
+
+    def subscribe(self, callback):
+        """Register a callback(short_code, version); registering twice is a no-op"""
+        if callback not in self._subscribers:
+            self._subscribers.append(callback)
+
+    def publish(self, short_code, version):
+        """
+        Announce that a mapping changed
+        Args:
+            short_code: The short code that changed
+            version: The mapping's new version
+        """
+        self.published += 1
+        self._deliver(short_code, version)
+        try:
+            self._send(short_code, version)
+        except Exception as e:
+            logging.error(f"Failed to publish invalidation for {short_code}: {e}")
+
+    def start(self):
+        """Start receiving remote messages (no-op for the local bus)"""
+        pass
+
+    def close(self):
+        """Stop receiving remote messages"""
+        pass
+
+    def _send(self, short_code, version):
+        pass
+
+    def _deliver(self, short_code, version):
+        for callback in list(self._subscribers):
+            try:
+                callback(short_code, version)
+            except Exception as e:
+                logging.error(f"Invalidation subscriber failed for {short_code}: {e}")
+
+    def _encode(self, short_code, version):
+        return json.dumps({"c": short_code, "v": version, "o": self.origin}, separators=(',', ':')).encode()
+
+    def _receive(self, payload):
+        try:
+            message = json.loads(payload)
+            short_code, version, origin = message["c"], int(message["v"]), message.get("o")
+        except (ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Ignoring malformed invalidation message: {e}")
+            return
+        if origin == self.origin:
+            return  # already delivered locally on publish
+        self.received += 1
+        self._deliver(short_code, version)
+
+
+class LocalInvalidationBus(InvalidationBus):
+    """In-process bus for single-instance deployments and tests"""
+    pass
+
+
+class UDPInvalidationBus(InvalidationBus):
+    """
+    Sends invalidations as UDP datagrams to a fixed list of peers
+    Intended for local multi-process setups and tests; delivery is best effort,
+    which is fine because cache entries also expire on their own.
+    """
+
+    def __init__(self, bind_host='127.0.0.1', bind_port=0, peers=None):
+        super().__init__()
+        self.peers = list(peers or [])
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind((bind_host, bind_port))
+        self.address = self._socket.getsockname()
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._listen, daemon=True, name="invalidation-udp")
+        self._thread.start()
+
+    def close(self):
+        self._running = False
+        self._socket.close()
+
+    def _send(self, short_code, version):
+        payload = self._encode(short_code, version)
+        for peer in self.peers:
+            self._socket.sendto(payload, peer)
+
+    def _listen(self):
+        while self._running:
+            try:
+                payload, _ = self._socket.recvfrom(2048)
+            except OSError:
+                break
+            self._receive(payload)
+
+
+class PubSubInvalidationBus(InvalidationBus):
+    """
+    Google Cloud Pub/Sub bus for App Engine instances
+    Each instance pulls from its own subscription on the shared topic. The
+    subscription is deleted on shutdown and expires on its own if an instance
+    is killed first. Requires the optional google-cloud-pubsub package.
+    """
+
+    def __init__(self, project_id, topic):
+        super().__init__()
+        from google.cloud import pubsub_v1
+
+        self._publisher = pubsub_v1.PublisherClient()
+        self._subscriber = pubsub_v1.SubscriberClient()
+        self.topic_path = self._publisher.topic_path(project_id, topic)
+        self.subscription_path = self._subscriber.subscription_path(project_id, f"{topic}-{self.origin}")
+        self._future = None
+
+    def start(self):
+        if self._future is not None:
+            return
+        self._subscriber.create_subscription(
+            request={
+                "name": self.subscription_path,
+                "topic": self.topic_path,
+                "ack_deadline_seconds": 10,
+                "expiration_policy": {"ttl": {"seconds": SUBSCRIPTION_EXPIRATION_SECONDS}},
+                "message_retention_duration": {"seconds": MESSAGE_RETENTION_SECONDS}
+            }
+        )
+        atexit.register(self.close)
+
+        def callback(message):
+            self._receive(message.data)
+            message.ack()
+
+        self._future = self._subscriber.subscribe(self.subscription_path, callback=callback)
+
+    def close(self):
+        if self._future is not None:
+            self._future.cancel()
+            self._future = None
+            try:
+                self._subscriber.delete_subscription(request={"subscription": self.subscription_path})
+            except Exception as e:
+                logging.error(f"Failed to delete invalidation subscription {self.subscription_path}: {e}")
+
+    def _send(self, short_code, version):
+        self._publisher.publish(self.topic_path, self._encode(short_code, version))
+
+
+def _parse_address(value):
+    host, _, port = value.strip().rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def create_invalidation_bus():
+    """
+    Build the invalidation bus selected by INVALIDATION_BUS (local, udp or pubsub)
+    Returns:
+        InvalidationBus instance
+    """
+    kind = os.getenv('INVALIDATION_BUS', 'local').lower()
+    try:
+        if kind == 'udp':
+            host, port = _parse_address(os.getenv('INVALIDATION_UDP_BIND', '127.0.0.1:0'))
+            peers = [_parse_address(peer) for peer in os.getenv('INVALIDATION_UDP_PEERS', '').split(',') if peer.strip()]
+            return UDPInvalidationBus(host, port, peers)
+        if kind == 'pubsub':
+            return PubSubInvalidationBus(
+                os.getenv('GOOGLE_CLOUD_PROJECT'),
+                os.getenv('INVALIDATION_TOPIC', 'url-mapping-invalidations')
+            )
+    except Exception as e:
+        logging.error(f"Failed to create {kind} invalidation bus, using local bus: {e}")
+    return LocalInvalidationBus()
+
+
+# Global bus shared by the model (publisher) and the lookup caches (subscribers)
+invalidation_bus = create_invalidation_bus()
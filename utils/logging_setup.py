@@ -0,0 +1,189 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line
+    Fields passed with `extra={...}` (e.g. route, short_code) become top-level keys.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RouteSampler(logging.Filter):
+    """
+    Keeps a fraction of success-path records per route
+    Records tagged with `extra={"route": name}` below WARNING are kept with the
+    route's configured probability; warnings, errors and untagged records always pass.
+    """
+
+    def __init__(self, rates=None, rng=random.random):
+        super().__init__()
+        self.rates = dict(rates or {})
+        self._rng = rng
+        self.sampled_out = 0
+
+    def filter(self, record):
+        route = getattr(record, "route", None)
+        if route is None or record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(route, 1.0)
+        if rate >= 1.0 or self._rng() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that defers formatting to the listener thread and never blocks
+    The stock handler formats the message in the calling thread; here records are
+    enqueued as-is (the queue is in-process) and dropped when the queue is full.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+DEFAULT_SAMPLE_RATES = "redirect=0.01,redirect_miss=0.1"
+
+
+def parse_sample_rates(value, default=DEFAULT_SAMPLE_RATES):
+    """
+    Parse "redirect=0.01,shorten=1" into {"redirect": 0.01, "shorten": 1.0}
+    A logging setting must never stop the service, so malformed entries (or rates
+    outside [0, 1]) are logged and ignored; their route keeps its rate from `default`.
+    Returns:
+        dict: route name -> fraction of success-path records to keep
+    """
+    defaults = parse_sample_rates(default, None) if default else {}
+    rates = {}
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        route, _, rate = item.partition("=")
+        route = route.strip()
+        try:
+            rate = float(rate)
+            if not route or not 0 <= rate <= 1:
+                raise ValueError("expected route=rate with a rate between 0 and 1")
+        except ValueError as e:
+            logging.warning(f"Ignoring invalid log sample rate {item!r}: {e}")
+            if route in defaults:
+                rates[route] = defaults[route]
+            continue
+        rates[route] = rate
+    return rates
+
+
+class LoggingSetup:
+    """Owns the queue handler and the background listener that writes log output"""
+
+    def __init__(self):
+        self.handler = None
+        self.listener = None
+        self.sampler = None
+        self._lock = threading.Lock()
+
+    def configure(self, level="INFO", log_format="json", sample_rates=None, queue_size=10000, stream=None):
+        """
+        Route the root logger through a bounded queue drained by a background thread
+        Args:
+            level: Root log level name
+            log_format: "json" for structured records, "text" for the classic format
+            sample_rates: Dict of route name -> fraction of success-path records to keep
+            queue_size: Records buffered before new ones are dropped
+            stream: Output stream (default stderr)
+        """
+        with self._lock:
+            self._shutdown()
+
+            if log_format == "json":
+                formatter = JSONFormatter()
+            else:
+                formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            output = logging.StreamHandler(stream or sys.stderr)
+            output.setFormatter(formatter)
+
+            self.sampler = RouteSampler(sample_rates)
+            self.handler = AsyncQueueHandler(queue.Queue(maxsize=queue_size))
+            self.handler.addFilter(self.sampler)
+            self.listener = logging.handlers.QueueListener(self.handler.queue, output, respect_handler_level=True)
+
+            root = logging.getLogger()
+            root.setLevel(level)
+            root.addHandler(self.handler)
+            self.listener.start()
+
+    def stop(self):
+        """Flush queued records and detach the handler"""
+        with self._lock:
+            self._shutdown()
+
+    def stats(self):
+        """Counters for metrics"""
+        if self.handler is None:
+            return {"queued": 0, "dropped": 0, "sampled_out": 0}
+        return {
+            "queued": self.handler.queue.qsize(),
+            "dropped": self.handler.dropped,
+            "sampled_out": self.sampler.sampled_out
+        }
+
+    def _shutdown(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        if self.handler is not None:
+            logging.getLogger().removeHandler(self.handler)
+            self.handler = None
+
+
+# Global logging setup used by app.py
+logging_setup = LoggingSetup()
+atexit.register(logging_setup.stop)
+
+
+def configure_logging():
+    """Configure logging from the LOG_* environment variables"""
+    logging_setup.configure(
+        level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+        log_format=os.getenv('LOG_FORMAT', 'json').lower(),
+        sample_rates=parse_sample_rates(os.getenv('LOG_SAMPLE_RATES', DEFAULT_SAMPLE_RATES)),
+        queue_size=int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    )
@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class MappingCache:
+    """
+    Per-process LRU cache of mapping lookups with versioned entries
+    Every entry carries the mapping's version. An invalidation for version N evicts
+    older entries and leaves a tombstone, so a slow read that finishes after the
+    invalidation (or a reordered older message) can't put stale data back.
+    Entries past their TTL are kept for `stale_seconds` more so they can be served
+    while a refresh runs or while the backend is down; invalidated entries are not.
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=60, negative_ttl_seconds=5, max_tombstones=10000,
+                 stale_seconds=3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_tombstones = max_tombstones
+        self.stale_seconds = stale_seconds
+        self._entries = OrderedDict()  # short_code -> (value, version, fresh_until, stale_until)
+        self._tombstones = OrderedDict()  # short_code -> (min_version, expires_monotonic)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, short_code, now=None):
+        """
+        Look up a fresh cached mapping
+        Returns:
+            dict or None: Cached lookup result, None on miss or when stale
+        """
+        value, fresh = self.lookup(short_code, now)
+        return value if fresh else None
+
+    def lookup(self, short_code, now=None):
+        """
+        Look up a cached mapping, including stale entries
+        Returns:
+            tuple: (value or None, is_fresh)
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._entries.get(short_code)
+            if entry is None:
+                self.misses += 1
+                return None, False
+            if entry[3] <= now:
+                del self._entries[short_code]
+                self.misses += 1
+                return None, False
+            self._entries.move_to_end(short_code)
+            if entry[2] <= now:
+                self.stale_hits += 1
+                return entry[0], False
+            self.hits += 1
+            return entry[0], True
+
+    def get_stale(self, short_code, now=None):
+        """
+        Last known value for a short code, fresh or stale
+        Returns:
+            dict or None
+        """
+        value, _ = self.lookup(short_code, now)
+        return value
+
+    def put(self, short_code, value, version, ttl=None, now=None):
+        """
+        Cache a lookup result
+        Args:
+            short_code: The short code
+            value: Lookup result (treated as read-only by callers)
+            version: Mapping version the result reflects (0 for "not found")
+            ttl: Optional lifetime in seconds, e.g. bounded by the link's expiry
+        Returns:
+            boolean: False if an invalidation already superseded this version
+        """
+        now = time.monotonic() if now is None else now
+        if ttl is None:
+            ttl = self.ttl_seconds if value.get("exists") else self.negative_ttl_seconds
+        if ttl <= 0:
+            return False
+
+        with self._lock:
+            tombstone = self._tombstones.get(short_code)
+            if tombstone is not None:
+                if tombstone[1] <= now:
+                    del self._tombstones[short_code]
+                elif version < tombstone[0]:
+                    return False
+
+            current = self._entries.get(short_code)
+            if current is not None and current[1] > version and current[2] > now:
+                return False
+
+            self._entries[short_code] = (value, version, now + ttl, now + ttl + self.stale_seconds)
+            self._entries.move_to_end(short_code)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def invalidate(self, short_code, version=None, now=None):
+        """
+        Evict a short code whose mapping changed to `version`
+        Entries older than `version` are dropped and later puts of older
+        versions are refused until the tombstone expires. Without a version
+        the entry is dropped unconditionally.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._entries.get(short_code)
+            if entry is not None and (version is None or entry[1] < version):
+                del self._entries[short_code]
+
+            if version is not None:
+                previous = self._tombstones.get(short_code)
+                if previous is None or previous[0] < version:
+                    # Outlive any read that could still be in flight
+                    self._tombstones[short_code] = (version, now + max(self.ttl_seconds, 60))
+                    self._tombstones.move_to_end(short_code)
+                    while len(self._tombstones) > self.max_tombstones:
+                        self._tombstones.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry and tombstone"""
+        with self._lock:
+            self._entries.clear()
+            self._tombstones.clear()
+
+    def stats(self):
+        """Cache counters for metrics"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+# Global per-process cache used by URLMapping.get_mapping
+mapping_cache = MappingCache(
+    max_entries=int(os.getenv('MAPPING_CACHE_SIZE', '10000')),
+    ttl_seconds=float(os.getenv('MAPPING_CACHE_TTL_SECONDS', '60')),
+    negative_ttl_seconds=float(os.getenv('MAPPING_CACHE_NEGATIVE_TTL_SECONDS', '5')),
+    stale_seconds=float(os.getenv('MAPPING_CACHE_STALE_SECONDS', '3600'))
+)
@@ -0,0 +1,238 @@
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request, jsonify
+
+
+class MemoryRateLimitStore:
+    """
+    In-process token bucket store
+    Buckets live in an OrderedDict kept in least-recently-used order, so idle
+    buckets are evicted from the front in O(1) amortized time and memory stays
+    bounded by `max_keys`.
+    """
+
+    def __init__(self, max_keys=100000, idle_seconds=600):
+        self.max_keys = max_keys
+        self.idle_seconds = idle_seconds
+        self._buckets = OrderedDict()  # key -> [tokens, last_refill]
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate, cost=1, now=None):
+        """
+        Take `cost` tokens from a bucket
+        Args:
+            key: Bucket key (policy + client identity)
+            capacity: Maximum burst size
+            refill_rate: Tokens added per second
+            cost: Tokens needed for this request
+        Returns:
+            tuple: (allowed, retry_after_seconds, remaining_tokens)
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [capacity, now]
+            else:
+                bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * refill_rate)
+                bucket[1] = now
+                self._buckets.move_to_end(key)
+
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                result = (True, 0, bucket[0])
+            else:
+                result = (False, (cost - bucket[0]) / refill_rate, bucket[0])
+
+            self._evict(now)
+        return result
+
+    def reset(self):
+        """Drop all buckets"""
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _evict(self, now):
+        # Idle buckets have refilled anyway, so dropping them loses nothing
+        while self._buckets:
+            key, (tokens, last_refill) = next(iter(self._buckets.items()))
+            if len(self._buckets) > self.max_keys or now - last_refill > self.idle_seconds:
+                self._buckets.popitem(last=False)
+            else:
+                break
+
+
+class RedisRateLimitStore:
+    """
+    Token bucket store shared between instances through Redis
+    The refill-and-take step runs as a Lua script so it is atomic across instances;
+    keys expire once a bucket would be full again, which bounds Redis memory.
+    """
+
+    SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+return {allowed, tostring(tokens)}
+"""
+
+    def __init__(self, client, prefix='ratelimit:'):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(self.SCRIPT)
+
+    def consume(self, key, capacity, refill_rate, cost=1, now=None):
+        """Take `cost` tokens from a shared bucket (see MemoryRateLimitStore.consume)"""
+        now = time.time() if now is None else now
+        allowed, tokens = self._script(keys=[self.prefix + key], args=[capacity, refill_rate, cost, now])
+        tokens = float(tokens)
+        if allowed:
+            return True, 0, tokens
+        return False, (cost - tokens) / refill_rate, tokens
+
+    def reset(self):
+        """Shared buckets expire on their own"""
+        pass
+
+
+class RateLimiter:
+    """
+    Applies named token bucket policies to client identities
+    Policies map a name to (capacity, refill_per_second).
+    """
+
+    def __init__(self, store, policies=None, enabled=True, api_keys=None):
+        self.store = store
+        self.policies = policies or {}
+        self.enabled = enabled
+        self.api_keys = set(api_keys or [])
+
+    def client_key(self):
+        """
+        Identify the caller: a known API key if one is sent, otherwise the client IP
+        Unknown API keys are ignored so rotating fake keys can't bypass the IP limit.
+        """
+        api_key = request.headers.get('X-API-Key')
+        if api_key and api_key in self.api_keys:
+            return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:32]
+        return f"ip:{request.remote_addr}"
+
+    def check(self, policy_name, cost=1):
+        """
+        Check the current request against a policy
+        Returns:
+            tuple: (allowed, retry_after_seconds)
+        """
+        policy = self.policies.get(policy_name)
+        if not self.enabled or not policy:
+            return True, 0
+
+        capacity, refill_rate = policy
+        try:
+            allowed, retry_after, _ = self.store.consume(
+                f"{policy_name}:{self.client_key()}", capacity, refill_rate, cost
+            )
+            return allowed, retry_after
+        except Exception as e:
+            # Fail open: a broken shared store must not take the API down
+            logging.error(f"Rate limit store error: {e}")
+            return True, 0
+
+    def reset(self):
+        """Drop all buckets (mainly for tests)"""
+        self.store.reset()
+
+
+def parse_rate(value, default):
+    """
+    Parse a "<requests>/<seconds>" rate string
+    Returns:
+        tuple: (capacity, refill_per_second)
+    """
+    try:
+        requests_allowed, seconds = (value or default).split('/')
+        requests_allowed, seconds = int(requests_allowed), float(seconds)
+        if requests_allowed <= 0 or seconds <= 0:
+            raise ValueError("rate must be positive")
+    except ValueError as e:
+        logging.error(f"Invalid rate limit {value!r}, using {default}: {e}")
+        requests_allowed, seconds = (float(part) for part in default.split('/'))
+    return requests_allowed, requests_allowed / seconds
+
+
+def create_rate_limit_store():
+    """
+    Build the rate limit store: Redis when REDIS_URL is set, in-process otherwise
+    Returns:
+        Store instance with a consume() method
+    """
+    redis_url = os.getenv('REDIS_URL')
+    if redis_url:
+        try:
+            import redis
+            return RedisRateLimitStore(redis.Redis.from_url(redis_url))
+        except Exception as e:
+            logging.error(f"Failed to connect rate limiter to Redis, using in-process store: {e}")
+
+    return MemoryRateLimitStore(
+        max_keys=int(os.getenv('RATE_LIMIT_MAX_KEYS', '100000')),
+        idle_seconds=float(os.getenv('RATE_LIMIT_IDLE_SECONDS', '600'))
+    )
+
+
+# Global rate limiter shared by the API blueprints
+rate_limiter = RateLimiter(
+    create_rate_limit_store(),
+    policies={
+        "shorten": parse_rate(os.getenv('RATE_LIMIT_SHORTEN'), '60/60'),
+        "stats": parse_rate(os.getenv('RATE_LIMIT_STATS'), '300/60')
+    },
+    enabled=os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true',
+    api_keys=[key.strip() for key in os.getenv('API_KEYS', '').split(',') if key.strip()]
+)
+
+
+def rate_limit(policy_name, cost=None):
+    """
+    Decorator that enforces a rate limit policy on a view
+    Returns 429 with a Retry-After header when the caller's bucket is empty.
+    Args:
+        policy_name: Name of the policy in rate_limiter.policies
+        cost: Optional function returning the token cost of the current request
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            allowed, retry_after = rate_limiter.check(policy_name, cost() if cost else 1)
+            if not allowed:
+                response = jsonify({
+                    "success": False,
+                    "error": "Rate limit exceeded. Please try again later."
+                })
+                response.status_code = 429
+                response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+                return response
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,246 @@
+import bisect
+import functools
+import os
+import re
+from datetime import datetime
+
+# Most rules one link may carry
+MAX_RULES = 500
+
+# Request headers holding the client's country, first match wins (App Engine, Cloudflare)
+COUNTRY_HEADERS = [name.strip() for name in
+                   os.getenv('ROUTING_COUNTRY_HEADERS', 'X-AppEngine-Country,CF-IPCountry').split(',')
+                   if name.strip()]
+
+DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+# Ordered user agent matchers, compiled once; the first pattern that matches wins
+_DEVICE_PATTERNS = [
+    ("bot", re.compile(r"bot|crawl|spider|slurp|facebookexternalhit|preview", re.I)),
+    ("tablet", re.compile(r"ipad|tablet|kindle|silk|playbook|android(?!.*mobile)", re.I)),
+    ("mobile", re.compile(r"mobi|iphone|ipod|android|blackberry|opera mini|windows phone", re.I)),
+]
+_OS_PATTERNS = [
+    ("ios", re.compile(r"iphone|ipad|ipod|\bios\b", re.I)),
+    ("android", re.compile(r"android", re.I)),
+    ("windows", re.compile(r"windows", re.I)),
+    ("macos", re.compile(r"mac os x|macintosh", re.I)),
+    ("linux", re.compile(r"linux|x11|cros", re.I)),
+]
+_TIME = re.compile(r"^([01]\d|2[0-3]):([0-5]\d)$|^24:00$")
+
+DEVICES = frozenset(["bot", "tablet", "mobile", "desktop"])
+OPERATING_SYSTEMS = frozenset(name for name, _ in _OS_PATTERNS) | {"other"}
+
+
+@functools.lru_cache(maxsize=4096)
+def classify_user_agent(user_agent):
+    """
+    Device class and operating system of a User-Agent header (cached; agents repeat)
+    Returns:
+        tuple: (device, os), e.g. ("mobile", "ios"); ("desktop", "other") when unknown
+    """
+    user_agent = user_agent or ""
+    device = next((name for name, pattern in _DEVICE_PATTERNS if pattern.search(user_agent)), "desktop")
+    system = next((name for name, pattern in _OS_PATTERNS if pattern.search(user_agent)), "other")
+    return device, system
+
+
+def _country(get_header):
+    for name in COUNTRY_HEADERS:
+        value = get_header(name)
+        if value:
+            return value.strip().upper()
+    return None
+
+
+def _language(get_header):
+    # Primary subtag of the most preferred language: "de-AT,de;q=0.9" -> "de"
+    value = get_header('Accept-Language')
+    if not value:
+        return None
+    return value.split(",", 1)[0].split(";", 1)[0].split("-", 1)[0].strip().lower() or None
+
+
+# Request attributes rules can match on exactly, in evaluation order
+DIMENSIONS = {
+    "country": _country,
+    "language": _language,
+    "device": lambda get_header: classify_user_agent(get_header('User-Agent'))[0],
+    "os": lambda get_header: classify_user_agent(get_header('User-Agent'))[1],
+}
+
+
+def _parse_time(value):
+    match = _TIME.match(value) if isinstance(value, str) else None
+    if not match:
+        raise ValueError("Rule times must be HH:MM (UTC)")
+    return MINUTES_PER_DAY if value == "24:00" else int(match.group(1)) * 60 + int(match.group(2))
+
+
+def _normalize_values(dimension, value):
+    values = [value] if isinstance(value, str) else value
+    if not isinstance(values, list) or not values or not all(isinstance(item, str) and item for item in values):
+        raise ValueError(f"Rule {dimension} must be a string or a non-empty list of strings")
+    values = sorted({item.strip().upper() if dimension == "country" else item.strip().lower() for item in values})
+    allowed = {"device": DEVICES, "os": OPERATING_SYSTEMS}.get(dimension)
+    if allowed is not None and not set(values) <= allowed:
+        raise ValueError(f"Rule {dimension} must be one of: {', '.join(sorted(allowed))}")
+    return values
+
+
+def parse_rules(data, validate_url):
+    """
+    Read the optional routing rules from a shorten request body
+    Accepts "rules": [{"url": "...", "country": ["DE", "AT"], "device": "mobile",
+    "os": "ios", "language": "de", "time": {"start": "09:00", "end": "17:00",
+    "days": ["mon", "fri"]}}, ...]. Every condition in a rule must hold; the first
+    matching rule picks the destination, and requests matching none get the
+    link's usual destination. Times are UTC; a window may wrap past midnight.
+    Args:
+        data: Request JSON
+        validate_url: Callable(url) -> bool
+    Returns:
+        list or None: Normalized rules
+    Raises:
+        ValueError: If a rule is malformed
+    """
+    rules = data.get('rules')
+    if rules is None:
+        return None
+    if not isinstance(rules, list) or not 1 <= len(rules) <= MAX_RULES:
+        raise ValueError(f"rules must be a list of 1 to {MAX_RULES} rules")
+
+    normalized = []
+    for rule in rules:
+        if not isinstance(rule, dict) or not isinstance(rule.get('url'), str) or not validate_url(rule['url']):
+            raise ValueError("Every rule needs a valid url")
+        unknown = set(rule) - set(DIMENSIONS) - {"url", "time"}
+        if unknown:
+            raise ValueError(f"Unknown rule condition: {sorted(unknown)[0]}")
+        entry = {"url": rule["url"]}
+        for dimension in DIMENSIONS:
+            if dimension in rule:
+                entry[dimension] = _normalize_values(dimension, rule[dimension])
+        if "time" in rule:
+            window = rule["time"]
+            if not isinstance(window, dict):
+                raise ValueError("Rule time must be an object with start and end")
+            start, end = _parse_time(window.get("start")), _parse_time(window.get("end"))
+            if start == end or start == MINUTES_PER_DAY:
+                raise ValueError("Rule time windows must have different start and end")
+            days = window.get("days", list(DAYS))
+            if not isinstance(days, list) or not days or not set(days) <= set(DAYS):
+                raise ValueError(f"Rule days must be a non-empty list of: {', '.join(DAYS)}")
+            entry["time"] = {"start": window["start"], "end": window["end"],
+                             "days": [day for day in DAYS if day in days]}
+        if len(entry) == 1:
+            raise ValueError("Every rule needs at least one condition")
+        normalized.append(entry)
+    compile_rules(normalized)
+    return normalized
+
+
+def _time_intervals(window):
+    """Minute-of-week [start, end) intervals of a time window, split at the week boundary"""
+    start, end = _parse_time(window["start"]), _parse_time(window["end"])
+    length = (end - start) % MINUTES_PER_DAY or MINUTES_PER_DAY
+    intervals = []
+    for day in window["days"]:
+        begin = DAYS.index(day) * MINUTES_PER_DAY + start
+        finish = begin + length
+        if finish > MINUTES_PER_WEEK:
+            intervals += [(begin, MINUTES_PER_WEEK), (0, finish - MINUTES_PER_WEEK)]
+        else:
+            intervals.append((begin, finish))
+    return intervals
+
+
+def compile_rules(rules):
+    """
+    Compile rules into a decision table of rule bitmasks (bit i = rule i)
+    For each dimension, "values" maps a request value to the rules that accept it
+    and "any" holds the rules that don't test that dimension. Time windows become
+    a sorted list of minute-of-week boundaries with the rules active in each
+    segment. A request keeps the rules allowed by every dimension and takes the
+    lowest bit: a few dict lookups, ANDs and one bisect, however many rules there are.
+    Masks are plain ints, so the table is JSON-friendly and cached with the mapping.
+    Returns:
+        dict: {"urls": [...], "all": mask, "dims": {dimension: {"values", "any"}}, "time": ...}
+    """
+    everything = (1 << len(rules)) - 1
+    dims = {}
+    for dimension in DIMENSIONS:
+        if not any(dimension in rule for rule in rules):
+            continue
+        values, unconstrained = {}, 0
+        for index, rule in enumerate(rules):
+            if dimension not in rule:
+                unconstrained |= 1 << index
+                continue
+            for value in rule[dimension]:
+                values[value] = values.get(value, 0) | 1 << index
+        dims[dimension] = {"values": values, "any": unconstrained}
+
+    table = {"urls": [rule["url"] for rule in rules], "all": everything, "dims": dims}
+    if any("time" in rule for rule in rules):
+        # Toggle a rule's bit at each edge of its intervals; adjacent intervals cancel out
+        toggles = {0: 0}
+        untimed = 0
+        for index, rule in enumerate(rules):
+            if "time" not in rule:
+                untimed |= 1 << index
+                continue
+            for begin, finish in _time_intervals(rule["time"]):
+                toggles[begin] = toggles.get(begin, 0) ^ 1 << index
+                if finish < MINUTES_PER_WEEK:
+                    toggles[finish] = toggles.get(finish, 0) ^ 1 << index
+        bounds, masks, active = [], [], 0
+        for minute in sorted(toggles):
+            active ^= toggles[minute]
+            if masks and masks[-1] == active | untimed:
+                continue
+            bounds.append(minute)
+            masks.append(active | untimed)
+        table["time"] = {"bounds": bounds, "masks": masks}
+    return table
+
+
+def minute_of_week(now=None):
+    """Minutes since Monday 00:00 UTC"""
+    now = now or datetime.utcnow()
+    return now.weekday() * MINUTES_PER_DAY + now.hour * 60 + now.minute
+
+
+def evaluate(table, get_header, now=None):
+    """
+    First rule matching a request
+    Args:
+        table: compile_rules() output
+        get_header: Callable(name) -> header value or None
+        now: Optional naive UTC datetime
+    Returns:
+        int or None: Index of the matching rule
+    """
+    mask = table["all"]
+    for dimension, entry in table["dims"].items():
+        mask &= entry["any"] | entry["values"].get(DIMENSIONS[dimension](get_header), 0)
+        if not mask:
+            return None
+    window = table.get("time")
+    if window:
+        mask &= window["masks"][bisect.bisect_right(window["bounds"], minute_of_week(now)) - 1]
+    if not mask:
+        return None
+    return (mask & -mask).bit_length() - 1
+
+
+def routing_fields(rules):
+    """
+    Fields a lookup result carries for a link with rules
+    Returns:
+        dict: {"routing": compiled table}, empty for links without rules
+    """
+    return {"routing": compile_rules(rules)} if rules else {}
@@ -0,0 +1,530 @@
+import base64
+import bisect
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+MAGIC = b"URLSEG01"
+_TRAILER = struct.Struct(">Q8s")  # footer length, magic
+TOMBSTONE_LOG = "tombstones.log"
+# First line of a tombstone log rewritten by compaction; it changes on every rewrite,
+# which tells other processes to reload the log from the start
+COMPACTED_HEADER = "#compacted"
+# Bytes read from the start of the log to recognise its first line
+HEADER_PROBE_BYTES = 64
+RECORDS_PER_BLOCK = 64
+BLOOM_BITS_PER_KEY = 10
+BLOOM_HASHES = 7
+
+
+def _encode_value(value):
+    # Mapping documents hold bytes (the visitor sketch); JSON needs them tagged
+    if isinstance(value, bytes):
+        return {"$bytes": base64.b64encode(value).decode()}
+    raise TypeError(f"Cannot archive value of type {type(value).__name__}")
+
+
+def _decode_value(obj):
+    if len(obj) == 1 and "$bytes" in obj:
+        return base64.b64decode(obj["$bytes"])
+    return obj
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter so most lookups of unarchived codes skip the block read"""
+
+    def __init__(self, num_bits, num_hashes=BLOOM_HASHES, bits=None):
+        self.num_bits = max(8, num_bits)
+        self.num_hashes = num_hashes
+        self.bits = bytearray(bits) if bits is not None else bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class DirectoryBackend:
+    """
+    Segment files in a directory
+    A local disk is only visible to one instance and lost when it is recycled, so
+    a directory counts as shared (safe to archive into) only when the caller says
+    it is, e.g. a gcsfuse or Filestore mount seen by every instance.
+    """
+
+    def __init__(self, directory, shared=False):
+        self.directory = directory
+        self.shared = shared
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def names(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(".seg"))
+
+    def size(self, name):
+        return os.path.getsize(self._path(name))
+
+    def read(self, name, offset=0, length=None):
+        try:
+            with open(self._path(name), "rb") as f:
+                f.seek(offset)
+                return f.read() if length is None else f.read(length)
+        except FileNotFoundError:
+            if name == TOMBSTONE_LOG:
+                return b""
+            raise
+
+    def write(self, name, data):
+        # Write then rename so readers never see a partial segment
+        temp = self._path(name + ".tmp")
+        with open(temp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self._path(name))
+
+    def append(self, name, data):
+        with open(self._path(name), "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def delete(self, name):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+
+class GCSBackend:
+    """
+    Segment files in a Cloud Storage bucket (gs://bucket/prefix), shared by every instance
+    Objects can't be appended to, so the tombstone log is rewritten with a
+    generation precondition and retried when another writer got there first.
+    """
+
+    shared = True
+
+    def __init__(self, url, client=None):
+        bucket, _, prefix = url[len("gs://"):].partition("/")
+        if client is None:
+            from google.cloud import storage
+            client = storage.Client()
+        self.bucket = client.bucket(bucket)
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+
+    def _blob(self, name):
+        return self.bucket.blob(self.prefix + name)
+
+    def names(self):
+        return sorted(blob.name[len(self.prefix):] for blob in self.bucket.list_blobs(prefix=self.prefix)
+                      if blob.name.endswith(".seg"))
+
+    def size(self, name):
+        blob = self.bucket.get_blob(self.prefix + name)
+        if blob is None:
+            raise FileNotFoundError(name)
+        return blob.size
+
+    def read(self, name, offset=0, length=None):
+        from google.api_core.exceptions import NotFound
+        end = None if length is None else offset + length - 1
+        if length == 0:
+            return b""
+        try:
+            return self._blob(name).download_as_bytes(start=offset, end=end)
+        except NotFound:
+            if name == TOMBSTONE_LOG:
+                return b""
+            raise FileNotFoundError(name)
+
+    def write(self, name, data):
+        # Object uploads are atomic: readers see the old object or the whole new one
+        self._blob(name).upload_from_string(data)
+
+    def append(self, name, data, attempts=10):
+        from google.api_core.exceptions import PreconditionFailed
+        for _ in range(attempts):
+            blob = self.bucket.get_blob(self.prefix + name)
+            current, generation = (blob.download_as_bytes(), blob.generation) if blob else (b"", 0)
+            try:
+                self._blob(name).upload_from_string(current + data, if_generation_match=generation)
+                return
+            except PreconditionFailed:
+                continue
+        raise RuntimeError(f"Could not append to {name}: too many concurrent writers")
+
+    def delete(self, name):
+        from google.api_core.exceptions import NotFound
+        try:
+            self._blob(name).delete()
+        except NotFound:
+            pass
+
+
+class MemoryBackend:
+    """In-memory object store stand-in (tests and benchmarks)"""
+
+    def __init__(self, shared=False):
+        self.objects = {}
+        self.shared = shared
+
+    def names(self):
+        return sorted(name for name in self.objects if name.endswith(".seg"))
+
+    def size(self, name):
+        return len(self.objects[name])
+
+    def read(self, name, offset=0, length=None):
+        data = self.objects.get(name, b"" if name == TOMBSTONE_LOG else None)
+        if data is None:
+            raise FileNotFoundError(name)
+        return bytes(data[offset:] if length is None else data[offset:offset + length])
+
+    def write(self, name, data):
+        self.objects[name] = bytes(data)
+
+    def append(self, name, data):
+        self.objects[name] = self.objects.get(name, b"") + data
+
+    def delete(self, name):
+        self.objects.pop(name, None)
+
+
+def _parse_tombstones(data, tombstones):
+    """Fold complete tombstone log lines into a short_code -> newest stamp dict"""
+    for line in data.decode().splitlines():
+        if line.startswith("#"):
+            continue
+        code, _, stamp = line.partition(" ")
+        tombstones[code] = max(int(stamp), tombstones.get(code, 0))
+    return tombstones
+
+
+class _Segment:
+    """In-memory index of one segment: first key of each block plus a Bloom filter"""
+
+    __slots__ = ("name", "generation", "count", "first_keys", "blocks", "bloom")
+
+    def __init__(self, name, footer):
+        self.name = name
+        self.generation = footer["generation"]
+        self.count = footer["count"]
+        self.first_keys = [block[0] for block in footer["blocks"]]
+        self.blocks = [(block[1], block[2]) for block in footer["blocks"]]
+        self.bloom = BloomFilter(footer["bloom_bits"], footer["bloom_hashes"],
+                                 base64.b64decode(footer["bloom"]))
+
+
+class SegmentStore:
+    """
+    Cold tier for idle mappings: compressed, indexed, append-only segment files
+    Each segment holds records sorted by short code in zlib-compressed blocks of
+    RECORDS_PER_BLOCK, followed by a footer with the first key and location of every
+    block and a Bloom filter. Only footers are kept in memory, so a lookup is a Bloom
+    check, a bisect and at most one block read per segment (recent blocks are cached).
+    Segments are never modified: a promoted or deleted record gets a tombstone with
+    a timestamp, which hides copies in segments written before it; compaction
+    rewrites live records into one segment and drops the tombstones it no longer needs.
+    """
+
+    def __init__(self, backend=None, block_cache_size=256, refresh_seconds=60):
+        self.block_cache_size = block_cache_size
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._block_cache = OrderedDict()  # (segment name, block index) -> {code: record}
+        self.lookups = 0
+        self.hits = 0
+        self.bloom_rejects = 0
+        self.block_reads = 0
+        self.open(backend)
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    @property
+    def shared(self):
+        """Whether every instance sees the segments, so archiving can't strand links"""
+        return self.enabled and getattr(self.backend, "shared", False)
+
+    def open(self, backend):
+        """Switch to a backend (None disables the cold tier) and load its index"""
+        with self._lock:
+            self.backend = backend
+            self._segments = []  # newest first
+            self._tombstones = {}  # short_code -> tombstone time (ns)
+            self._tombstone_offset = 0
+            self._tombstone_header = b""
+            self._block_cache.clear()
+            self._refreshed = 0
+        if backend is not None:
+            self.refresh()
+
+    def refresh(self):
+        """Pick up segments and tombstones written by other processes"""
+        if not self.enabled:
+            return
+        names = self.backend.names()
+        with self._lock:
+            known = {segment.name: segment for segment in self._segments}
+        segments = []
+        for name in names:
+            segment = known.get(name)
+            if segment is None:
+                try:
+                    segment = _Segment(name, self._read_footer(name))
+                except FileNotFoundError:
+                    continue  # removed by a concurrent compaction
+                except Exception as e:
+                    logging.error(f"Skipping unreadable segment {name}: {e}")
+                    continue
+            segments.append(segment)
+        segments.sort(key=lambda segment: segment.generation, reverse=True)
+
+        with self._lock:
+            self._segments = segments
+            header = self.backend.read(TOMBSTONE_LOG, 0, HEADER_PROBE_BYTES).partition(b"\n")[0]
+            if header != self._tombstone_header:
+                # Rewritten by a compaction (or first read): reload it from the start
+                self._tombstone_header = header
+                self._tombstones = {}
+                self._tombstone_offset = 0
+            log = self.backend.read(TOMBSTONE_LOG, self._tombstone_offset)
+            # Only complete lines; a concurrent append may be half written
+            complete = log[:log.rfind(b"\n") + 1]
+            self._tombstone_offset += len(complete)
+            _parse_tombstones(complete, self._tombstones)
+            self._refreshed = time.monotonic()
+
+    def _read_footer(self, name):
+        size = self.backend.size(name)
+        footer_length, magic = _TRAILER.unpack(self.backend.read(name, size - _TRAILER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{name} is not a segment file")
+        raw = self.backend.read(name, size - _TRAILER.size - footer_length, footer_length)
+        return json.loads(zlib.decompress(raw))
+
+    def write_segment(self, records):
+        """
+        Write a new segment
+        Args:
+            records: dict of short_code -> mapping document
+        Returns:
+            str: Segment name, or None if there was nothing to write
+        """
+        if not self.enabled:
+            raise RuntimeError("Cold tier is not configured")
+        if not records:
+            return None
+        generation = time.time_ns()
+        name = f"seg-{generation:020d}-{os.getpid()}.seg"
+        self.backend.write(name, self._encode_segment(records, generation))
+        self.refresh()
+        return name
+
+    @staticmethod
+    def _encode_segment(records, generation):
+        codes = sorted(records)
+        bloom = BloomFilter(len(codes) * BLOOM_BITS_PER_KEY)
+        body = bytearray()
+        blocks = []
+        for start in range(0, len(codes), RECORDS_PER_BLOCK):
+            chunk = codes[start:start + RECORDS_PER_BLOCK]
+            raw = zlib.compress(json.dumps([[code, records[code]] for code in chunk],
+                                           default=_encode_value, separators=(",", ":")).encode(), 6)
+            blocks.append([chunk[0], len(body), len(raw)])
+            body += raw
+            for code in chunk:
+                bloom.add(code)
+
+        footer = zlib.compress(json.dumps({
+            "generation": generation,
+            "count": len(codes),
+            "blocks": blocks,
+            "bloom": base64.b64encode(bytes(bloom.bits)).decode(),
+            "bloom_bits": bloom.num_bits,
+            "bloom_hashes": bloom.num_hashes
+        }).encode())
+        return bytes(body) + footer + _TRAILER.pack(len(footer), MAGIC)
+
+    def _block(self, segment, index):
+        key = (segment.name, index)
+        with self._lock:
+            block = self._block_cache.get(key)
+            if block is not None:
+                self._block_cache.move_to_end(key)
+                return block
+        offset, length = segment.blocks[index]
+        block = dict(json.loads(zlib.decompress(self.backend.read(segment.name, offset, length)),
+                                object_hook=_decode_value))
+        with self._lock:
+            self.block_reads += 1
+            self._block_cache[key] = block
+            while len(self._block_cache) > self.block_cache_size:
+                self._block_cache.popitem(last=False)
+        return block
+
+    def get(self, short_code):
+        """
+        Newest live archived copy of a mapping
+        Returns:
+            dict or None: The archived mapping document
+        """
+        if not self.enabled:
+            return None
+        if time.monotonic() - self._refreshed > self.refresh_seconds:
+            self.refresh()
+        self.lookups += 1
+        with self._lock:
+            segments = self._segments
+            tombstone = self._tombstones.get(short_code, 0)
+        for segment in segments:
+            if segment.generation <= tombstone:
+                break  # this and all older copies are dead
+            if short_code not in segment.bloom:
+                self.bloom_rejects += 1
+                continue
+            index = bisect.bisect_right(segment.first_keys, short_code) - 1
+            if index < 0:
+                continue
+            try:
+                record = self._block(segment, index).get(short_code)
+            except FileNotFoundError:
+                self.refresh()  # compacted away underneath us
+                return self.get(short_code)
+            if record is not None:
+                self.hits += 1
+                return record
+        return None
+
+    def contains(self, short_code):
+        return self.get(short_code) is not None
+
+    def discard(self, short_code):
+        """
+        Hide every archived copy of a short code (after promotion or deletion)
+        Returns:
+            boolean: True if a live copy existed
+        """
+        if not self.contains(short_code):
+            return False
+        stamp = time.time_ns()
+        self.backend.append(TOMBSTONE_LOG, f"{short_code} {stamp}\n".encode())
+        with self._lock:
+            self._tombstones[short_code] = stamp
+        return True
+
+    def compact(self):
+        """
+        Merge all segments into one, dropping dead and superseded records
+        The merged segment keeps the newest input's generation, so tombstones
+        written while compaction runs still hide its records.
+        Returns:
+            dict: {"segments": merged, "records": kept}
+        """
+        self.refresh()
+        with self._lock:
+            segments = list(self._segments)
+            tombstones = dict(self._tombstones)
+        if len(segments) < 2:
+            self._compact_tombstones()
+            return {"segments": len(segments), "records": sum(segment.count for segment in segments)}
+
+        live = {}
+        for segment in reversed(segments):  # oldest first, newer copies overwrite
+            for index in range(len(segment.blocks)):
+                for code, record in self._block(segment, index).items():
+                    if segment.generation > tombstones.get(code, 0):
+                        live[code] = record
+                    else:
+                        live.pop(code, None)
+
+        # A fresh name, so no process can confuse it with an input it has indexed
+        generation = segments[0].generation
+        if live:
+            self.backend.write(f"seg-{generation:020d}-c{time.time_ns()}.seg",
+                               self._encode_segment(live, generation))
+        for segment in segments:
+            self.backend.delete(segment.name)
+        with self._lock:
+            self._block_cache.clear()
+        self.refresh()
+        self._compact_tombstones()
+        return {"segments": len(segments), "records": len(live)}
+
+    def _compact_tombstones(self):
+        """
+        Rewrite the tombstone log without tombstones older than every remaining segment
+        A tombstone only hides copies in segments written before it, so once those
+        segments are compacted away it hides nothing; without this the log (and every
+        process's tombstone dict) would grow forever. Lines appended while the log is
+        being filtered are carried over as they are.
+        """
+        log = self.backend.read(TOMBSTONE_LOG)
+        log = log[:log.rfind(b"\n") + 1]
+        if not log:
+            return
+        with self._lock:
+            horizon = min((segment.generation for segment in self._segments), default=None)
+        tombstones = _parse_tombstones(log, {})
+        kept = "".join(f"{code} {stamp}\n" for code, stamp in tombstones.items()
+                       if horizon is not None and stamp >= horizon)
+        appended = self.backend.read(TOMBSTONE_LOG, len(log))
+        self.backend.write(TOMBSTONE_LOG, f"{COMPACTED_HEADER} {time.time_ns()}\n{kept}".encode() + appended)
+        self.refresh()
+
+    def stats(self):
+        """Cold tier counters for metrics"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "segments": len(self._segments),
+                "records": sum(segment.count for segment in self._segments),
+                "index_blocks": sum(len(segment.blocks) for segment in self._segments),
+                "tombstones": len(self._tombstones),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "bloom_rejects": self.bloom_rejects,
+                "block_reads": self.block_reads
+            }
+
+
+def create_segment_store():
+    """
+    Cold tier in TIERING_SEGMENT_DIR, or a disabled store when it's not set
+    gs://bucket/prefix uses Cloud Storage; a directory is treated as shared only
+    with TIERING_SHARED_STORAGE=true (a mount every instance sees).
+    """
+    directory = os.getenv('TIERING_SEGMENT_DIR')
+    backend = None
+    if directory:
+        try:
+            if directory.startswith("gs://"):
+                backend = GCSBackend(directory)
+            else:
+                backend = DirectoryBackend(
+                    directory, shared=os.getenv('TIERING_SHARED_STORAGE', 'false').lower() == 'true')
+        except Exception as e:
+            logging.error(f"Cold tier disabled, cannot use {directory}: {e}")
+    return SegmentStore(backend, refresh_seconds=float(os.getenv('TIERING_REFRESH_SECONDS', '60')))
+
+
+# Global cold tier used by URLMapping
+segment_store = create_segment_store()
@@ -0,0 +1,283 @@
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+
+# Values above this size are zlib-compressed before they go over the wire
+COMPRESS_THRESHOLD = 512
+# Suffix of the key holding the lowest version a versioned key may still be set to
+FLOOR_SUFFIX = '#v'
+
+
+def encode_value(value, fields=None):
+    """
+    Serialize a dict compactly for the shared cache
+    With `fields`, the dict is stored as a positional JSON array in that order,
+    which drops the key names from every entry.
+    Args:
+        value: Dict to serialize
+        fields: Optional tuple of field names
+    Returns:
+        bytes: b'j' + JSON or b'z' + zlib(JSON)
+    """
+    payload = [value.get(field) for field in fields] if fields else value
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    if len(raw) > COMPRESS_THRESHOLD:
+        return b'z' + zlib.compress(raw)
+    return b'j' + raw
+
+
+def decode_value(data, fields=None):
+    """
+    Restore a value written by `encode_value`
+    Returns:
+        dict or None if the payload is unreadable
+    """
+    try:
+        if isinstance(data, str):
+            data = data.encode()
+        marker, body = data[:1], data[1:]
+        if marker == b'z':
+            body = zlib.decompress(body)
+        elif marker != b'j':
+            return None
+        payload = json.loads(body)
+        if fields:
+            return dict(zip(fields, payload))
+        return payload
+    except (ValueError, TypeError, zlib.error) as e:
+        logging.warning(f"Unreadable shared cache value: {e}")
+        return None
+
+
+class InMemorySharedCache:
+    """
+    In-process stand-in for the shared cache, used in tests and local development
+    Counts round trips so tests can check that batch reads are pipelined.
+    """
+
+    def __init__(self):
+        self._data = {}  # key -> (bytes, expires_at)
+        self._lock = threading.Lock()
+        self.round_trips = 0
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        now = time.time()
+        with self._lock:
+            self.round_trips += 1
+            found = {}
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is not None and entry[1] > now:
+                    found[key] = entry[0]
+            return found
+
+    def set(self, key, value, ttl):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items, ttl):
+        expires_at = time.time() + ttl
+        with self._lock:
+            self.round_trips += 1
+            for key, value in items.items():
+                self._data[key] = (value, expires_at)
+
+    def set_if_current(self, key, value, version, ttl):
+        """Set a versioned key unless an invalidation raised its floor above `version`"""
+        now = time.time()
+        with self._lock:
+            self.round_trips += 1
+            floor = self._data.get(key + FLOOR_SUFFIX)
+            if floor is not None and floor[1] > now and version < int(floor[0]):
+                return False
+            self._data[key] = (value, now + ttl)
+            return True
+
+    def invalidate(self, key, version, ttl):
+        """Delete a versioned key and refuse sets of versions below `version` for `ttl` seconds"""
+        now = time.time()
+        with self._lock:
+            self.round_trips += 1
+            self._data.pop(key, None)
+            floor = self._data.get(key + FLOOR_SUFFIX)
+            if floor is None or floor[1] <= now or int(floor[0]) < version:
+                self._data[key + FLOOR_SUFFIX] = (str(version).encode(), now + ttl)
+
+    def add(self, key, value, ttl):
+        """Set `key` only if it holds no live value; returns whether it was set"""
+        now = time.time()
+        with self._lock:
+            self.round_trips += 1
+            entry = self._data.get(key)
+            if entry is not None and entry[1] > now:
+                return False
+            self._data[key] = (value, now + ttl)
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            self.round_trips += 1
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.round_trips = 0
+
+
+class RedisSharedCache:
+    """Shared cache on Redis; multi-key operations use MGET and pipelines"""
+
+    # Versioned set and invalidation run as scripts so a check and its write are atomic
+    SET_IF_CURRENT = """
+local floor = tonumber(redis.call('GET', KEYS[2]))
+if floor and tonumber(ARGV[2]) < floor then
+  return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+return 1
+"""
+    INVALIDATE = """
+redis.call('DEL', KEYS[1])
+local floor = tonumber(redis.call('GET', KEYS[2]))
+if not floor or floor < tonumber(ARGV[1]) then
+  redis.call('SET', KEYS[2], ARGV[1], 'EX', ARGV[2])
+end
+return 1
+"""
+
+    def __init__(self, client, prefix='urlshort:'):
+        self.client = client
+        self.prefix = prefix
+        self._set_if_current = client.register_script(self.SET_IF_CURRENT)
+        self._invalidate = client.register_script(self.INVALIDATE)
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        values = self.client.mget([self.prefix + key for key in keys])
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, ex=max(1, int(ttl)))
+
+    def set_many(self, items, ttl):
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.set(self.prefix + key, value, ex=max(1, int(ttl)))
+        pipe.execute()
+
+    def add(self, key, value, ttl):
+        return bool(self.client.set(self.prefix + key, value, ex=max(1, int(ttl)), nx=True))
+
+    def set_if_current(self, key, value, version, ttl):
+        keys = [self.prefix + key, self.prefix + key + FLOOR_SUFFIX]
+        return bool(self._set_if_current(keys=keys, args=[value, version, max(1, int(ttl))]))
+
+    def invalidate(self, key, version, ttl):
+        self._invalidate(keys=[self.prefix + key, self.prefix + key + FLOOR_SUFFIX], args=[version, max(1, int(ttl))])
+
+    def delete(self, *keys):
+        self.client.delete(*[self.prefix + key for key in keys])
+
+
+class MemcachedSharedCache:
+    """Shared cache on memcached (pymemcache client); get_many is a single multi-get"""
+
+    def __init__(self, client, prefix='urlshort:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        values = self.client.get_many([self.prefix + key for key in keys])
+        return {key[len(self.prefix):]: value for key, value in values.items()}
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, expire=max(1, int(ttl)))
+
+    def set_many(self, items, ttl):
+        self.client.set_many({self.prefix + key: value for key, value in items.items()}, expire=max(1, int(ttl)))
+
+    def add(self, key, value, ttl):
+        return bool(self.client.add(self.prefix + key, value, expire=max(1, int(ttl)), noreply=False))
+
+    def set_if_current(self, key, value, version, ttl):
+        # memcached can't check and set in one step; the window is one round trip wide
+        floor = self.client.get(self.prefix + key + FLOOR_SUFFIX)
+        if floor is not None and version < int(floor):
+            return False
+        self.client.set(self.prefix + key, value, expire=max(1, int(ttl)))
+        return True
+
+    def invalidate(self, key, version, ttl):
+        floor_key = self.prefix + key + FLOOR_SUFFIX
+        self.client.delete(self.prefix + key)
+        # Raise the floor with compare-and-swap so a concurrent lower version can't win
+        for _ in range(5):
+            floor, cas = self.client.gets(floor_key)
+            if floor is not None and int(floor) >= version:
+                return
+            if floor is None:
+                if self.client.add(floor_key, str(version), expire=max(1, int(ttl)), noreply=False):
+                    return
+            elif self.client.cas(floor_key, str(version), cas, expire=max(1, int(ttl)), noreply=False):
+                return
+
+    def delete(self, *keys):
+        self.client.delete_many([self.prefix + key for key in keys])
+
+
+def create_shared_cache():
+    """
+    Build the shared cache selected by SHARED_CACHE (redis, memcached, memory or none)
+    Defaults to Redis when REDIS_URL is set, otherwise no shared tier.
+    Returns:
+        Shared cache instance or None
+    """
+    kind = os.getenv('SHARED_CACHE', 'redis' if os.getenv('REDIS_URL') else 'none').lower()
+    try:
+        if kind == 'redis':
+            import redis
+            return RedisSharedCache(redis.Redis.from_url(
+                os.getenv('REDIS_URL', 'redis://localhost:6379/0'), socket_timeout=0.5, socket_connect_timeout=0.5
+            ))
+        if kind == 'memcached':
+            from pymemcache.client.base import Client
+            host, _, port = os.getenv('MEMCACHED_ADDRESS', 'localhost:11211').rpartition(':')
+            return MemcachedSharedCache(Client((host, int(port)), connect_timeout=1, timeout=0.5))
+        if kind == 'memory':
+            return InMemorySharedCache()
+    except Exception as e:
+        logging.error(f"Failed to create {kind} shared cache, continuing without it: {e}")
+    return None
+
+
+_shared_cache = create_shared_cache()
+
+
+def get_shared_cache():
+    """
+    Function to get the shared cache tier
+    Returns: Shared cache instance or None when disabled
+    """
+    return _shared_cache
+
+
+def set_shared_cache(cache):
+    """Replace the shared cache tier (None disables it)"""
+    global _shared_cache
+    _shared_cache = cache
@@ -0,0 +1,131 @@
+import asyncio
+import threading
+
+
+class _Call:
+    """One in-flight call that waiters can block on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one backend call (threads)
+    The first caller for a key runs the function; callers that arrive while it is
+    running wait and receive the same result, or the same exception.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Run func(*args, **kwargs) once per key at a time
+        Args:
+            key: Identity of the call (e.g. the short code)
+            func: Function to run if no call for the key is in flight
+        Returns:
+            The function's result (shared by every waiter)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self):
+        """Number of keys with a call currently running"""
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        """Counters for metrics"""
+        return {
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "in_flight": self.in_flight()
+        }
+
+
+class AsyncSingleFlight:
+    """
+    asyncio version of SingleFlight for coroutine-based callers
+    Must be used from a single event loop.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key, func, *args, **kwargs):
+        """
+        Await func(*args, **kwargs) once per key at a time
+        Args:
+            key: Identity of the call
+            func: Coroutine function to run if no call for the key is in flight
+        Returns:
+            The coroutine's result (shared by every waiter)
+        """
+        future = self._calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            # shield() so one cancelled waiter doesn't cancel the shared call
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        self.executed += 1
+        try:
+            result = await func(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            del self._calls[key]
+
+    def stats(self):
+        """Counters for metrics"""
+        return {
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls)
+        }
+
+
+# Global coalescer for mapping lookups that miss the local cache
+lookup_flight = SingleFlight()
@@ -0,0 +1,101 @@
+import gzip
+import hashlib
+import logging
+import os
+import threading
+from flask import render_template, request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+
+class StaticPage:
+    """A page rendered once and kept as precompressed byte buffers"""
+
+    def __init__(self, body, mtime):
+        self.mtime = mtime
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+        self.variants = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(body, quality=11)
+
+
+class StaticPageCache:
+    """
+    Serves templates that have no per-request content without running Jinja
+    Pages are rendered at startup into identity/gzip/brotli buffers and served with
+    content negotiation and an ETag. In debug mode a page is re-rendered whenever
+    its template file changes.
+    """
+
+    def __init__(self, names=("index.html", "404.html", "503.html")):
+        self.names = names
+        self.app = None
+        self.pages = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """
+        Render all pages for an application
+        Args:
+            app: Flask application
+        """
+        self.app = app
+        self.pages = {}
+        with app.app_context():
+            for name in self.names:
+                try:
+                    self._render(name)
+                except Exception as e:
+                    logging.error(f"Failed to pre-render {name}: {e}")
+
+    def response(self, name, status=200):
+        """
+        Build a response for a pre-rendered page
+        Args:
+            name: Template name
+            status: HTTP status code
+        Returns:
+            Response: The best encoding the client accepts, or 304 if its copy is current
+        """
+        page = self._get_page(name)
+        encoding = request.accept_encodings.best_match([e for e in ("br", "gzip") if e in page.variants])
+        encoding = encoding or "identity"
+        etag = page.etag if encoding == "identity" else f"{page.etag}-{encoding}"
+
+        response_class = self.app.response_class
+        if status == 200 and request.if_none_match.contains(etag):
+            response = response_class(status=304)
+        else:
+            response = response_class(page.variants[encoding], status=status, mimetype="text/html")
+            if encoding != "identity":
+                response.headers["Content-Encoding"] = encoding
+
+        response.set_etag(etag)
+        response.vary.add("Accept-Encoding")
+        return response
+
+    def _get_page(self, name):
+        page = self.pages.get(name)
+        if page is None or (self.app.debug and self._template_mtime(name) != page.mtime):
+            with self._lock:
+                page = self._render(name)
+        return page
+
+    def _render(self, name):
+        mtime = self._template_mtime(name)
+        body = render_template(name).encode("utf-8")
+        page = self.pages[name] = StaticPage(body, mtime)
+        return page
+
+    def _template_mtime(self, name):
+        try:
+            return os.path.getmtime(os.path.join(self.app.root_path, self.app.template_folder, name))
+        except OSError:
+            return None
+
+
+# Global page cache, initialized by create_app()
+static_pages = StaticPageCache()
@@ -0,0 +1,448 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from functools import wraps
+
+# W3C trace context: version-traceid-parentid-flags
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+# Firestore GAPIC calls that return a response stream rather than a message
+_STREAMING_RPCS = {"batch_get_documents", "run_query", "run_aggregation_query"}
+_TRACED_RPCS = _STREAMING_RPCS | {"commit", "begin_transaction", "rollback", "list_documents",
+                                  "list_collection_ids", "partition_query"}
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def _new_id(bits):
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+def parse_traceparent(value):
+    """
+    Parse a W3C traceparent header
+    Returns:
+        tuple: (trace_id, parent_span_id, sampled) or None if missing or malformed
+    """
+    match = _TRACEPARENT.match((value or "").strip().lower())
+    if not match or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+
+class Trace:
+    """Spans recorded for one request; exported as a unit once the root span ends"""
+
+    __slots__ = ("trace_id", "sampled", "spans", "max_spans")
+
+    def __init__(self, trace_id, sampled, max_spans):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans = []
+        self.max_spans = max_spans
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attributes", "error",
+                 "start_ns", "_started", "duration_ns", "_token")
+
+    def __init__(self, trace, name, parent_id=None, attributes=None):
+        self.trace = trace
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes or {}
+        self.error = None
+        self.start_ns = time.time_ns()
+        self._started = time.perf_counter_ns()
+        self.duration_ns = None
+        self._token = None
+
+    def child(self, name, attributes=None):
+        """Start a span under this one (not made current)"""
+        return Span(self.trace, name, self.span_id, attributes)
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_error(self, error):
+        self.error = f"{type(error).__name__}: {error}"
+
+    def finish(self):
+        if self.duration_ns is not None:
+            return
+        self.duration_ns = time.perf_counter_ns() - self._started
+        # A runaway loop can't grow a trace without bound
+        if len(self.trace.spans) < self.trace.max_spans:
+            self.trace.spans.append(self)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ns / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+
+class Tracer:
+    """
+    Request tracing with head and tail sampling
+    A request is head-sampled when the caller's traceparent says so or with
+    probability `sample_rate`. With tail sampling on (`tail_latency_ms`), the
+    other requests are recorded too and exported only if they turn out slow or
+    fail; with it off they record nothing and each instrumented call costs a
+    single context-variable lookup.
+    """
+
+    def __init__(self, exporter=None, sample_rate=0.01, tail_latency_ms=None, max_spans=256):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.tail_latency_ms = tail_latency_ms
+        self.max_spans = max_spans
+        self.started = 0
+        self.exported = 0
+
+    @property
+    def enabled(self):
+        return self.exporter is not None
+
+    def start_trace(self, name, traceparent=None, attributes=None):
+        """
+        Start the root span of a request and make it current
+        Args:
+            name: Span name, e.g. "GET /<short_code>"
+            traceparent: Incoming W3C traceparent header, if any
+            attributes: Initial span attributes
+        Returns:
+            Span or None when the request is not recorded
+        """
+        if not self.enabled:
+            return None
+        parent = parse_traceparent(traceparent)
+        sampled = parent[2] if parent else random.random() < self.sample_rate
+        if not sampled and self.tail_latency_ms is None:
+            return None
+
+        self.started += 1
+        trace = Trace(parent[0] if parent else _new_id(128), sampled, self.max_spans)
+        span = Span(trace, name, parent[1] if parent else None, attributes)
+        span._token = _current_span.set(span)
+        return span
+
+    def end_trace(self, span, error=None):
+        """Finish a root span and export its trace if it was sampled, slow or failed"""
+        if error is not None:
+            span.record_error(error)
+        span.finish()
+        if span._token is not None:
+            try:
+                _current_span.reset(span._token)
+            except ValueError:
+                # Ended from a different context than it started in
+                _current_span.set(None)
+            span._token = None
+
+        trace = span.trace
+        keep = trace.sampled or (self.tail_latency_ms is not None and (
+            span.error is not None or span.duration_ns >= self.tail_latency_ms * 1e6))
+        if keep and self.exporter is not None:
+            self.exported += 1
+            self.exporter.export([s.to_dict() for s in trace.spans])
+
+    def span(self, name, **attributes):
+        """Context manager for a child span of the current span (no-op outside a trace)"""
+        return _SpanScope(name, attributes)
+
+    def traced(self, name):
+        """Decorator that wraps every call in a span named `name`"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if _current_span.get() is None:
+                    return func(*args, **kwargs)
+                with _SpanScope(name, None):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def init_app(self, app):
+        """Trace every Flask request, continuing the caller's traceparent if present"""
+        from flask import request, g
+
+        @app.before_request
+        def start_request_trace():
+            if not self.enabled:
+                return
+            rule = request.url_rule.rule if request.url_rule is not None else request.path
+            g.trace_span = self.start_trace(f"{request.method} {rule}", request.headers.get('traceparent'),
+                                            {"http.method": request.method, "http.route": rule})
+
+        @app.after_request
+        def tag_response(response):
+            span = g.get('trace_span')
+            if span is not None:
+                span.set_attribute("http.status_code", response.status_code)
+                if response.status_code >= 500:
+                    span.error = f"HTTP {response.status_code}"
+                if span.trace.sampled:
+                    response.headers['X-Trace-Id'] = span.trace.trace_id
+            return response
+
+        @app.teardown_request
+        def end_request_trace(exc=None):
+            span = g.pop('trace_span', None)
+            if span is not None:
+                self.end_trace(span, exc)
+
+    def stats(self):
+        """Tracing counters for metrics"""
+        data = {"enabled": self.enabled, "sample_rate": self.sample_rate,
+                "tail_latency_ms": self.tail_latency_ms, "traces_started": self.started,
+                "traces_exported": self.exported}
+        if hasattr(self.exporter, "dropped"):
+            data["dropped"] = self.exporter.dropped
+        return data
+
+
+class _SpanScope:
+    __slots__ = ("name", "attributes", "span", "token")
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        parent = _current_span.get()
+        if parent is None:
+            self.span = None
+            return None
+        self.span = parent.child(self.name, self.attributes)
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.span is not None:
+            if exc is not None:
+                self.span.record_error(exc)
+            self.span.finish()
+            _current_span.reset(self.token)
+        return False
+
+
+def current_span():
+    """The span active in this context, or None"""
+    return _current_span.get()
+
+
+class TracedFirestoreAPI:
+    """
+    Proxy for a Firestore client's GAPIC API that records a span per RPC
+    Streaming calls (document batch reads, queries) are timed until their
+    response stream is exhausted or closed.
+    """
+
+    def __init__(self, api):
+        self._api = api
+
+    def __getattr__(self, name):
+        attr = getattr(self._api, name)
+        if name not in _TRACED_RPCS or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            parent = _current_span.get()
+            if parent is None:
+                return attr(*args, **kwargs)
+            span = parent.child(f"firestore.{name}")
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                span.record_error(e)
+                span.finish()
+                raise
+            if name in _STREAMING_RPCS:
+                return _traced_stream(span, result)
+            span.finish()
+            return result
+        return call
+
+
+def _traced_stream(span, stream):
+    try:
+        yield from stream
+    except Exception as e:
+        span.record_error(e)
+        raise
+    finally:
+        span.finish()
+
+
+def instrument_firestore(client):
+    """Record Firestore RPCs of a client as spans (no-op for clients without a GAPIC API)"""
+    try:
+        api = getattr(client, "_firestore_api", None)
+        if api is not None and not isinstance(api, TracedFirestoreAPI):
+            client._firestore_api_internal = TracedFirestoreAPI(api)
+    except Exception as e:
+        logging.error(f"Failed to instrument Firestore client for tracing: {e}")
+    return client
+
+
+class JsonlExporter:
+    """Appends one JSON line per span to a local file"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, spans):
+        with open(self.path, "a") as f:
+            f.write("".join(json.dumps(span, default=str) + "\n" for span in spans))
+
+
+class OtlpHttpExporter:
+    """Sends spans to an OpenTelemetry collector using OTLP/HTTP with JSON encoding"""
+
+    def __init__(self, endpoint, service_name="url-shortener", headers=None, timeout=5):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.headers = dict(headers or {}, **{"Content-Type": "application/json"})
+        self.timeout = timeout
+
+    @staticmethod
+    def _attribute(key, value):
+        if isinstance(value, bool):
+            typed = {"boolValue": value}
+        elif isinstance(value, int):
+            typed = {"intValue": str(value)}
+        elif isinstance(value, float):
+            typed = {"doubleValue": value}
+        else:
+            typed = {"stringValue": str(value)}
+        return {"key": key, "value": typed}
+
+    def _otlp_span(self, span):
+        start = span["start_ns"]
+        otlp = {
+            "traceId": span["trace_id"],
+            "spanId": span["span_id"],
+            "name": span["name"],
+            # SERVER for request roots, CLIENT for Firestore RPCs, INTERNAL otherwise
+            "kind": 2 if "http.route" in span["attributes"] else 3 if span["name"].startswith("firestore.") else 1,
+            "startTimeUnixNano": str(start),
+            "endTimeUnixNano": str(start + int(span["duration_ms"] * 1e6)),
+            "attributes": [self._attribute(k, v) for k, v in span["attributes"].items()],
+            "status": {"code": 2, "message": span["error"]} if span["error"] else {"code": 1}
+        }
+        if span["parent_id"]:
+            otlp["parentSpanId"] = span["parent_id"]
+        return otlp
+
+    def export(self, spans):
+        import requests
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": [self._attribute("service.name", self.service_name)]},
+            "scopeSpans": [{"scope": {"name": "url-shortener"}, "spans": [self._otlp_span(s) for s in spans]}]
+        }]}
+        response = requests.post(self.url, data=json.dumps(payload), headers=self.headers, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class BatchExporter:
+    """
+    Exports traces from a background thread so requests never wait on I/O
+    Traces are queued without blocking (dropped when the queue is full) and
+    handed to the wrapped exporter in batches.
+    """
+
+    def __init__(self, exporter, max_queue=2048, batch_size=256, interval=2.0):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0
+        self.failed = 0
+        self._queue = queue.Queue(max_queue)
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def export(self, spans):
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self, first=None):
+        batch = list(first or [])
+        while len(batch) < self.batch_size:
+            try:
+                batch.extend(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            try:
+                self.exporter.export(batch)
+            except Exception as e:
+                self.failed += 1
+                logging.error(f"Failed to export {len(batch)} spans: {e}")
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.interval)
+            except queue.Empty:
+                continue
+            self._drain(first)
+
+    def flush(self):
+        """Export everything queued so far (called at exit)"""
+        while not self._queue.empty():
+            self._drain()
+
+
+def create_exporter():
+    """
+    Build the trace exporter from the environment
+    TRACE_EXPORTER=otlp sends to OTEL_EXPORTER_OTLP_ENDPOINT, jsonl appends to
+    TRACE_FILE; by default OTLP is used when an endpoint is configured, JSONL
+    when TRACE_FILE is set, and tracing is off otherwise.
+    Returns:
+        BatchExporter or None
+    """
+    kind = os.getenv('TRACE_EXPORTER', '').lower()
+    endpoint = os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT')
+    path = os.getenv('TRACE_FILE')
+    if kind == 'none' or os.getenv('TRACING_ENABLED', 'true').lower() != 'true':
+        return None
+    if kind == 'otlp' or (not kind and endpoint):
+        if not endpoint:
+            logging.error("TRACE_EXPORTER=otlp needs OTEL_EXPORTER_OTLP_ENDPOINT; tracing disabled")
+            return None
+        return BatchExporter(OtlpHttpExporter(endpoint, os.getenv('OTEL_SERVICE_NAME', 'url-shortener')))
+    if kind == 'jsonl' or path:
+        return BatchExporter(JsonlExporter(path or 'traces.jsonl'))
+    return None
+
+
+def _tail_latency():
+    value = os.getenv('TRACE_TAIL_LATENCY_MS', '')
+    return float(value) if value else None
+
+
+# Global tracer used by the route, model and database layers
+tracer = Tracer(
+    create_exporter(),
+    sample_rate=float(os.getenv('TRACE_SAMPLE_RATE', '0.01')),
+    tail_latency_ms=_tail_latency()
+)
+traced = tracer.traced
@@ -0,0 +1,218 @@
+import atexit
+import gzip
+import hashlib
+import hmac
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from utils.fast_path import reserved_paths
+from utils.url_encoder import URLEncoder
+
+# First line of every capture file
+HEADER = "#traffic-capture v1 ts_ms method path status latency_us"
+SHORTEN_PATH = "/api/shorten"
+# Characters of the keyed hash kept per anonymized short code
+TOKEN_LENGTH = 10
+
+
+class TrafficCapture:
+    """
+    Records anonymized redirect and shorten requests for replay_traffic.py
+    Each request becomes one tab-separated line: arrival time (ms since the
+    epoch), method, path, status and server latency (µs). Short codes are
+    replaced by a keyed hash, so the file shows the shape of the traffic (hot
+    set, 404 probes, bursts) without the links themselves; no IPs, headers or
+    request bodies are kept. Redirects are sampled per short code, not per
+    request, so sampled codes keep every hit and cache behaviour replays
+    faithfully. Lines are buffered and appended as gzip members.
+    """
+
+    def __init__(self, directory=None, sample_rate=1.0, salt=None, flush_records=1000, flush_seconds=5.0):
+        """
+        Args:
+            directory: Where capture files go; None disables capturing
+            sample_rate: Fraction of short codes (and shorten requests) recorded
+            salt: Key for anonymizing short codes; set the same value on every
+                  instance so one code gets one token across their files
+            flush_records: Buffered lines that trigger a write
+            flush_seconds: Oldest buffered line age that triggers a write
+        """
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.salt = (salt or os.urandom(16).hex()).encode()
+        self.flush_records = flush_records
+        self.flush_seconds = flush_seconds
+        self.path = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.path = os.path.join(directory, f"traffic-{socket.gethostname()}-{os.getpid()}.tsv.gz")
+        self._buffer = []
+        self._buffer_started = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.recorded = 0
+        self.skipped = 0
+        self.write_errors = 0
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def anonymize(self, short_code):
+        """
+        Stable, keyed replacement for a short code
+        Returns:
+            tuple: (token, sample bucket in [0, 1))
+        """
+        digest = hmac.new(self.salt, short_code.encode("utf-8", "surrogateescape"), hashlib.sha256).digest()
+        value = int.from_bytes(digest[:8], "big")
+        return URLEncoder.encode_base62(value)[:TOKEN_LENGTH], int.from_bytes(digest[8:12], "big") / 2 ** 32
+
+    def record_request(self, method, path, status, latency_us, ts_ms=None):
+        """
+        Record one request if it is a redirect (GET /<code>) or a shorten request
+        Args:
+            method: HTTP method
+            path: Request path, e.g. "/abc123"
+            status: Response status code
+            latency_us: Server time in microseconds
+            ts_ms: Arrival time, defaults to now
+        """
+        if path == SHORTEN_PATH:
+            if random.random() >= self.sample_rate:
+                self.skipped += 1
+                return
+        else:
+            token, bucket = self.anonymize(path[1:])
+            if bucket >= self.sample_rate:
+                self.skipped += 1
+                return
+            path = "/" + token
+        line = f"{int(ts_ms if ts_ms is not None else time.time() * 1000)}\t{method}\t{path}\t{status}\t{int(latency_us)}\n"
+        with self._lock:
+            self._buffer.append(line)
+            self.recorded += 1
+            if self._buffer_started is None:
+                self._buffer_started = time.monotonic()
+            due = len(self._buffer) >= self.flush_records or \
+                time.monotonic() - self._buffer_started >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Append buffered lines to the capture file as one gzip member"""
+        with self._lock:
+            lines, self._buffer, self._buffer_started = self._buffer, [], None
+        if not lines or not self.enabled:
+            return
+        with self._write_lock:
+            try:
+                new_file = not os.path.exists(self.path)
+                with gzip.open(self.path, "at", encoding="utf-8") as f:
+                    if new_file:
+                        f.write(HEADER + "\n")
+                    f.write("".join(lines))
+            except OSError as e:
+                self.write_errors += 1
+                logging.error(f"Failed to write {len(lines)} captured requests to {self.path}: {e}")
+
+    def close(self):
+        self.flush()
+
+    def stats(self):
+        """Capture counters for metrics"""
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "sample_rate": self.sample_rate,
+            "recorded": self.recorded,
+            "skipped": self.skipped,
+            "write_errors": self.write_errors
+        }
+
+
+class TrafficCaptureMiddleware:
+    """
+    Outermost WSGI middleware feeding TrafficCapture
+    Sits outside the fast path, so cached redirects are captured too, and
+    times each request up to the moment the wrapped app returns its response.
+    """
+
+    def __init__(self, wsgi_app, capture, reserved=()):
+        self.wsgi_app = wsgi_app
+        self.capture = capture
+        self.reserved_paths = frozenset(reserved)
+
+    def _captured(self, method, path):
+        if method == 'POST':
+            return path == SHORTEN_PATH
+        # Everything the redirect route matches, including bot probes like /wp-login.php
+        return method == 'GET' and len(path) > 1 and path.count('/') == 1 and path not in self.reserved_paths
+
+    def __call__(self, environ, start_response):
+        method, path = environ.get('REQUEST_METHOD'), environ.get('PATH_INFO', '')
+        if not self._captured(method, path):
+            return self.wsgi_app(environ, start_response)
+
+        ts_ms = time.time() * 1000
+        started = time.perf_counter()
+        statuses = []
+
+        def capture_start_response(status, headers, exc_info=None):
+            statuses.append(status)
+            return start_response(status, headers, exc_info)
+
+        response = self.wsgi_app(environ, capture_start_response)
+        try:
+            status = int(statuses[-1].split(' ', 1)[0]) if statuses else 0
+            self.capture.record_request(method, path, status, (time.perf_counter() - started) * 1e6, ts_ms)
+        except Exception as e:
+            # Capturing must never break the request being captured
+            logging.error(f"Traffic capture failed for {method} request: {e}")
+        return response
+
+
+def read_capture(path):
+    """
+    Read a capture file
+    Returns:
+        list: (ts_ms, method, path, status, latency_us) tuples in file order
+    """
+    records = []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            ts_ms, method, request_path, status, latency_us = line.rstrip("\n").split("\t")
+            records.append((int(ts_ms), method, request_path, int(status), int(latency_us)))
+    return records
+
+
+def install_traffic_capture(app, capture=None):
+    """
+    Wrap a Flask app's WSGI callable with TrafficCaptureMiddleware
+    Install after the fast path so it wraps it.
+    Returns:
+        TrafficCaptureMiddleware: The installed middleware
+    """
+    app.wsgi_app = TrafficCaptureMiddleware(app.wsgi_app, capture or traffic_capture, reserved_paths(app))
+    return app.wsgi_app
+
+
+def create_traffic_capture():
+    """Build the process-wide capture from TRAFFIC_CAPTURE_* settings (disabled without a directory)"""
+    return TrafficCapture(
+        directory=os.getenv('TRAFFIC_CAPTURE_DIR') or None,
+        sample_rate=float(os.getenv('TRAFFIC_CAPTURE_SAMPLE_RATE', '1.0')),
+        salt=os.getenv('TRAFFIC_CAPTURE_SALT') or None,
+        flush_records=int(os.getenv('TRAFFIC_CAPTURE_FLUSH_RECORDS', '1000')),
+        flush_seconds=float(os.getenv('TRAFFIC_CAPTURE_FLUSH_SECONDS', '5'))
+    )
+
+
+# Global per-process capture, flushed on shutdown
+traffic_capture = create_traffic_capture()
+atexit.register(traffic_capture.close)
@@ -0,0 +1,151 @@
+import atexit
+import hashlib
+import logging
+import os
+import threading
+import time
+from utils.hyperloglog import HyperLogLog
+
+
+class VisitorTracker:
+    """
+    Buffers per-link HyperLogLog sketches of visitors and flushes them in batches
+    Visitors are identified by a keyed hash of client IP + user agent; raw IPs are
+    never buffered or stored. Pending sketches are merged into the stored sketch by
+    `flush_func(short_code, sketch_bytes)`, which returns True on success, None
+    when the link no longer exists (the sketch is dropped) and False on a
+    transient failure (the sketch is kept for a retry).
+    """
+
+    def __init__(self, flush_func=None, precision=12, flush_events=500, flush_seconds=30, salt=''):
+        self.flush_func = flush_func
+        self.precision = precision
+        self.flush_events = flush_events
+        self.flush_seconds = flush_seconds
+        self._key = hashlib.blake2b(salt.encode(), digest_size=32).digest()
+        self._pending = {}  # short_code -> HyperLogLog
+        self._pending_events = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._flushing = threading.Lock()
+        self.dropped = 0
+
+    def visitor_hash(self, client_ip, user_agent):
+        """
+        Hash a visitor identity to a 64-bit integer
+        Returns:
+            int: Keyed hash of client IP and user agent
+        """
+        digest = hashlib.blake2b(
+            f"{client_ip or ''}|{user_agent or ''}".encode(),
+            key=self._key,
+            digest_size=8
+        ).digest()
+        return int.from_bytes(digest, 'big')
+
+    def record(self, short_code, client_ip, user_agent):
+        """
+        Record a visit and trigger a background flush when the batch is full or old
+        Args:
+            short_code: The short code that was visited
+            client_ip: Visitor IP address
+            user_agent: Visitor User-Agent header
+        """
+        value = self.visitor_hash(client_ip, user_agent)
+        with self._lock:
+            sketch = self._pending.get(short_code)
+            if sketch is None:
+                sketch = self._pending[short_code] = HyperLogLog(self.precision)
+            sketch.add_hash(value)
+            self._pending_events += 1
+            due = (self._pending_events >= self.flush_events
+                   or time.monotonic() - self._last_flush >= self.flush_seconds)
+
+        if due and not self._flushing.locked():
+            threading.Thread(target=self.flush, daemon=True).start()
+
+    def flush(self):
+        """
+        Merge all pending sketches into storage
+        Sketches that fail to flush are kept for the next attempt; because HyperLogLog
+        merges are idempotent, a retry never double counts. Sketches for deleted
+        links are dropped instead of being retried forever.
+        Returns:
+            int: Number of short codes flushed successfully
+        """
+        if not self.flush_func:
+            return 0
+
+        with self._flushing:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._pending_events = 0
+                self._last_flush = time.monotonic()
+
+            flushed = 0
+            for short_code, sketch in pending.items():
+                try:
+                    ok = self.flush_func(short_code, sketch.to_bytes())
+                except Exception as e:
+                    logging.error(f"Failed to flush visitor sketch for {short_code}: {e}")
+                    ok = False
+
+                if ok:
+                    flushed += 1
+                elif ok is None:
+                    self.dropped += 1
+                else:
+                    self._requeue(short_code, sketch)
+            return flushed
+
+    def estimate(self, short_code, stored_bytes=None):
+        """
+        Estimate unique visitors from the stored sketch plus any unflushed visits
+        Args:
+            short_code: The short code to estimate
+            stored_bytes: Serialized sketch stored with the mapping, if any
+        Returns:
+            int: Approximate number of unique visitors
+        """
+        sketch = HyperLogLog(self.precision)
+        if stored_bytes:
+            try:
+                sketch = HyperLogLog.from_bytes(bytes(stored_bytes))
+            except ValueError as e:
+                logging.error(f"Ignoring corrupt visitor sketch for {short_code}: {e}")
+
+        with self._lock:
+            pending = self._pending.get(short_code)
+            if pending is not None:
+                sketch.merge(pending)
+        return sketch.estimate()
+
+    def reset(self):
+        """Drop all pending visits"""
+        with self._lock:
+            self._pending = {}
+            self._pending_events = 0
+
+    def _requeue(self, short_code, sketch):
+        with self._lock:
+            existing = self._pending.get(short_code)
+            if existing is None:
+                self._pending[short_code] = sketch
+            else:
+                existing.merge(sketch)
+
+
+def _flush_to_storage(short_code, sketch_bytes):
+    from models.url_mapping import URLMapping
+    return URLMapping.merge_visitor_sketch(short_code, sketch_bytes)
+
+
+# Global tracker used by the redirect handler
+visitor_tracker = VisitorTracker(
+    flush_func=_flush_to_storage,
+    flush_events=int(os.getenv('VISITOR_FLUSH_EVENTS', '500')),
+    flush_seconds=float(os.getenv('VISITOR_FLUSH_SECONDS', '30')),
+    salt=os.getenv('VISITOR_HASH_SALT', os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production'))
+)
+
+atexit.register(visitor_tracker.flush)
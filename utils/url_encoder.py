@@ -3,6 +3,12 @@ import string
 import re
 import requests
 from urllib.parse import urlparse
+from utils.tracing import traced
+
+try:
+    import numpy as np
+except ImportError:  # optional: batch encoding falls back to pure Python
+    np = None
 
 class URLEncoder:
     BASE62_CHARS = string.ascii_letters + string.digits  # a-z, A-Z, 0-9
@@ -13,6 +19,7 @@ class URLEncoder:
         return ''.join(random.choices(URLEncoder.BASE62_CHARS, k=length))
     
     @staticmethod
+    @traced("URLEncoder.validate_url")
     def validate_url(url):
         """
         Validate URL format and basic accessibility
@@ -65,6 +72,7 @@ class URLEncoder:
         return True
     
     @staticmethod
+    @traced("URLEncoder.generate_unique_code")
     def generate_unique_code(check_existence_func, length=6, max_retries=5):
         """
         Generate unique code with collision detection
@@ -91,17 +99,20 @@ class URLEncoder:
         Encode a number to Base62 string
         Useful for sequential ID encoding
         """
+        if number < 0:
+            raise ValueError("Cannot Base62-encode a negative number")
         if number == 0:
             return URLEncoder.BASE62_CHARS[0]
         
-        result = ""
-        base = len(URLEncoder.BASE62_CHARS)
-        
+        # Two digits per division via the pair table; digits are collected and joined once
+        pairs = []
         while number > 0:
-            result = URLEncoder.BASE62_CHARS[number % base] + result
-            number //= base
+            number, pair = divmod(number, _PAIR_BASE)
+            pairs.append(_PAIRS[pair])
+        pairs.reverse()
         
-        return result
+        # The most significant pair may carry a leading zero digit
+        return ''.join(pairs).lstrip(URLEncoder.BASE62_CHARS[0]) or URLEncoder.BASE62_CHARS[0]
     
     @staticmethod
     def decode_base62(encoded_string):
@@ -109,10 +120,141 @@ class URLEncoder:
         Decode a Base62 string to number
         Useful for sequential ID decoding
         """
-        base = len(URLEncoder.BASE62_CHARS)
         result = 0
         
-        for char in encoded_string:
-            result = result * base + URLEncoder.BASE62_CHARS.index(char)
+        try:
+            for char in encoded_string:
+                result = result * 62 + _DIGITS[char]
+        except KeyError as e:
+            raise ValueError(f"Invalid Base62 character: {e.args[0]!r}")
         
         return result
+    
+    @staticmethod
+    def encode_many(numbers, use_numpy=None):
+        """
+        Encode many non-negative integers to Base62 strings
+        Args:
+            numbers: Iterable of integers
+            use_numpy: Force (True) or disable (False) the vectorized path;
+                       by default NumPy is used when installed and the batch is large
+        Returns:
+            list: Base62 strings in input order
+        """
+        numbers = numbers if isinstance(numbers, list) else list(numbers)
+        if URLEncoder._vectorize(len(numbers), use_numpy):
+            encoded = _encode_many_numpy(numbers)
+            if encoded is not None:
+                return encoded
+        encode = URLEncoder.encode_base62
+        return [encode(number) for number in numbers]
+    
+    @staticmethod
+    def decode_many(encoded_strings, use_numpy=None):
+        """
+        Decode many Base62 strings to integers
+        Args:
+            encoded_strings: Iterable of Base62 strings
+            use_numpy: Force (True) or disable (False) the vectorized path
+        Returns:
+            list: Integers in input order
+        """
+        encoded_strings = encoded_strings if isinstance(encoded_strings, list) else list(encoded_strings)
+        if URLEncoder._vectorize(len(encoded_strings), use_numpy):
+            decoded = _decode_many_numpy(encoded_strings)
+            if decoded is not None:
+                return decoded
+        decode = URLEncoder.decode_base62
+        return [decode(encoded) for encoded in encoded_strings]
+    
+    @staticmethod
+    def _vectorize(count, use_numpy):
+        if np is None or use_numpy is False:
+            return False
+        return use_numpy is True or count >= NUMPY_MIN_BATCH
+
+
+# Lookup tables shared by the scalar and batch Base62 codecs
+_DIGITS = {char: value for value, char in enumerate(URLEncoder.BASE62_CHARS)}
+_PAIRS = [high + low for high in URLEncoder.BASE62_CHARS for low in URLEncoder.BASE62_CHARS]
+_PAIR_BASE = len(_PAIRS)  # 62 ** 2
+
+# Largest Base62 width whose values always fit in a signed 64-bit integer
+_MAX_INT64_DIGITS = 10
+_POWERS = [62 ** place for place in range(_MAX_INT64_DIGITS + 1)]
+
+# Below this batch size NumPy's setup cost outweighs the vectorized loop
+NUMPY_MIN_BATCH = 256
+
+if np is not None:
+    _NP_CHARS = np.frombuffer(URLEncoder.BASE62_CHARS.encode('ascii'), dtype=np.uint8)
+    _NP_DIGITS = np.full(256, -1, dtype=np.int64)
+    _NP_DIGITS[_NP_CHARS] = np.arange(62)
+    _NP_POWERS = np.array(_POWERS[:_MAX_INT64_DIGITS], dtype=np.int64)
+
+
+def _encode_many_numpy(numbers):
+    """Vectorized encode; returns None when the batch doesn't fit in int64"""
+    if not numbers:
+        return []
+    try:
+        values = np.asarray(numbers, dtype=np.int64)
+    except (OverflowError, TypeError, ValueError):
+        return None
+    if values.ndim != 1:
+        return None
+    if (values < 0).any():
+        raise ValueError("Cannot Base62-encode a negative number")
+    
+    # Extract every digit column at once, most significant first
+    width = len(URLEncoder.encode_base62(int(values.max())))
+    digits = np.empty((len(values), width), dtype=np.uint8)
+    remaining = values
+    for column in range(width - 1, -1, -1):
+        remaining, digits[:, column] = np.divmod(remaining, 62)
+    chars = _NP_CHARS[digits]
+    
+    # Rows with the same digit count become fixed-width byte strings in one step
+    lengths = np.ones(len(values), dtype=np.int64)
+    for length in range(2, width + 1):
+        lengths[values >= _POWERS[length - 1]] = length
+    encoded = np.empty(len(values), dtype=object)
+    for length in np.unique(lengths).tolist():
+        rows = lengths == length
+        block = np.ascontiguousarray(chars[rows, width - length:])
+        encoded[rows] = block.view(f'S{length}').ravel().astype(f'U{length}')
+    return encoded.tolist()
+
+
+def _decode_many_numpy(encoded_strings):
+    """Vectorized decode; returns None to hand the whole batch to the scalar path"""
+    if not encoded_strings:
+        return []
+    lengths = np.fromiter(map(len, encoded_strings), dtype=np.int64, count=len(encoded_strings))
+    
+    # Codes wider than int64 (and empty ones) are decoded one at a time
+    scalar = (lengths > _MAX_INT64_DIGITS) | (lengths == 0)
+    if scalar.any():
+        positions = np.flatnonzero(~scalar).tolist()
+        decoded = [URLEncoder.decode_base62(encoded) if wide else None
+                   for encoded, wide in zip(encoded_strings, scalar.tolist())]
+        if positions:
+            vectorized = _decode_many_numpy([encoded_strings[i] for i in positions])
+            if vectorized is None:
+                return None
+            for position, value in zip(positions, vectorized):
+                decoded[position] = value
+        return decoded
+    
+    try:
+        packed = ''.join(encoded_strings).encode('ascii')
+    except UnicodeEncodeError:
+        return None  # let the scalar path report the offending character
+    digits = _NP_DIGITS[np.frombuffer(packed, dtype=np.uint8)]
+    if (digits < 0).any():
+        return None
+    
+    # Weight each digit by 62 ** (its place from the right) and sum per code
+    offsets = np.cumsum(lengths) - lengths
+    place = np.repeat(lengths + offsets - 1, lengths) - np.arange(len(digits))
+    return np.add.reduceat(digits * _NP_POWERS[place], offsets).tolist()